@@ -1,8 +1,17 @@
 import logging
-
-from dotenv import find_dotenv, load_dotenv
-
-load_dotenv(find_dotenv())
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
+
+
+@lru_cache
+def load_env() -> None:
+    """load the nearest .env once. called by the modules that build API clients
+
+    rather than on every import of the package, which most commands don't need
+    """
+
+    from dotenv import find_dotenv, load_dotenv
+
+    load_dotenv(find_dotenv())
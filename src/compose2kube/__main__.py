@@ -1,32 +1,45 @@
 import argparse
+import asyncio
 import glob
+import itertools
 import logging
 import os
 import pickle
 from logging import getLogger
 from pathlib import Path
 import sys
-from typing import Optional
+from typing import TYPE_CHECKING, Iterator, Optional
 
-import langfuse
-from langchain.globals import set_debug, set_verbose
-from langfuse.callback import CallbackHandler
+from compose2kube import concurrency, load_env
+from compose2kube.selection import select
 
-from compose2kube import evaluator
+# langchain, langfuse and the chains are imported where a command needs them, so
+# that --help and argument errors don't wait for them
+if TYPE_CHECKING:
+    from langfuse.callback import CallbackHandler
 
+    from compose2kube.metrics import MetricsHandler
+    from compose2kube.runlog import ResultLog
 
 PKGROOT = Path(os.path.dirname(os.path.abspath(__file__)))
 INPUTROOTDIR = PKGROOT.parent.parent / "data" / "deployments_anonymized"
 HUMANROOTDIR = PKGROOT.parent.parent / "data" / "manifest-by-human"
-TMPFILE = "/tmp/got.pkl"
-EVALFILE = "/tmp/eval.pkl"
+TMPFILE = "/tmp/got.jsonl"
+EVALFILE = "/tmp/eval.jsonl"
+# EVALFILE flattened for analysis, see results
+EVALPARQUET = "/tmp/eval.parquet"
+# + .json and .prom
+METRICSFILE = "/tmp/metrics-{command}"
 SESSON_ID = None
+CONCURRENCY = 8
 logger = getLogger(__name__)
 
 
 def get_handler(
     trace_name: str, user_id: str, session_id: Optional[str] = None
-) -> CallbackHandler:
+) -> "CallbackHandler":
+    import langfuse
+
     langfuse_client = langfuse.Langfuse()
     if not langfuse_client.auth_check():
         raise RuntimeError("langfuse auth failed")
@@ -41,41 +54,132 @@ def get_handler(
     return handler
 
 
-def convert(session_id):
+def _callbacks(trace_name: str, session_id: str | None, langfuse: bool) -> list:
+    """the metrics handler, and the langfuse handler when langfuse is used"""
+
+    from compose2kube import tools
+    from compose2kube.metrics import MetricsHandler
+
+    tools.reset_stats()
+    concurrency.reset_queue_stats()
+    callbacks: list = [MetricsHandler()]
+    if langfuse:
+        callbacks.append(get_handler(trace_name, user_id=__name__, session_id=session_id))
+    return callbacks
+
+
+def _write_metrics(command: str, metrics: "MetricsHandler") -> None:
+    path = METRICSFILE.format(command=command)
+    metrics.write(f"{path}.json")
+    metrics.write(f"{path}.prom")
+    logger.info(f"metrics: {metrics.summary()}")
+    print(f"wrote {path}.json {path}.prom")
+
+
+def _open_log(path: str, resume: bool) -> tuple["ResultLog", set[str]]:
+    """the result log and the keys of its finished work. a new run starts from an empty log"""
+
+    from compose2kube import workkey
+    from compose2kube.runlog import ResultLog
+
+    log = ResultLog(path)
+    if not resume:
+        log.truncate()
+        return log, set()
+    done = workkey.completed(log)
+    logger.info(f"resume: skip {len(done)} finished items in {path}")
+    return log, done
+
+
+def _inputs(selectors: list[str] | None = None) -> list[dict]:
+    """{input, answer} of the inputs whose names (see evaluator.input_name) are selected"""
+
+    from compose2kube.evaluator import input_name
+
     inputfiles = glob.glob(f"{INPUTROOTDIR}/*/compose.yaml")
     answerfiles = glob.glob(f"{HUMANROOTDIR}/*/all.yaml")
     input = [{"input": k, "answer": v} for k, v in zip(inputfiles, answerfiles)]
-    chain = evaluator.convert_chain
-    handler = get_handler(
-        trace_name="compose2kube:convert", user_id=__name__, session_id=session_id
-    )
+    names = set(select(sorted(input_name(x["input"]) for x in input), selectors))
+    return [x for x in input if input_name(x["input"]) in names]
 
-    # Because langfuse doesn't support .batch(),
-    # use .map().invoke() instead for a while.
-    got = chain.map().invoke(input, config={"callbacks": [handler]})
 
-    with open(TMPFILE, "wb") as f:
-        pickle.dump(got, f)
+def convert(
+    session_id,
+    concurrency: int = CONCURRENCY,
+    resume: bool = False,
+    langfuse: bool = True,
+    methods: list[str] | None = None,
+    inputs: list[str] | None = None,
+):
+    """run the methods of evaluator.ops chosen by the selectors on the chosen inputs"""
+
+    from compose2kube import evaluator
+
+    input = _inputs(inputs)
+    callbacks = _callbacks("compose2kube:convert", session_id, langfuse)
+    log, done = _open_log(TMPFILE, resume)
+
+    # Because langfuse doesn't support .batch(),
+    # each (input, method) is run by .ainvoke() instead.
+    async def run():
+        items = evaluator.astream_convert(
+            input,
+            max_concurrency=concurrency,
+            config={"callbacks": callbacks},
+            skip=done,
+            methods=methods,
+        )
+        async for item in items:
+            log.append(item)
 
+    asyncio.run(run())
     print(f"wrote {TMPFILE}")
-    return got
+    _write_metrics("convert", callbacks[0])
 
 
-def evaluate(session_id):
-    with open(TMPFILE, "rb") as f:
-        got = pickle.load(f)
+def read_converted(path: str) -> Iterator[dict]:
+    """items written by convert(). a whole-run pickle of older runs is flattened"""
 
-    # flatten
-    items = sum(got, [])
+    from compose2kube.runlog import ResultLog
 
-    chain = evaluator.eval_chain
-    handler = get_handler(
-        trace_name="compose2kube:evaluate", user_id=__name__, session_id=session_id
-    )
-    got2 = chain.batch(items, config={"callbacks": [handler]})
-    with open(EVALFILE, "wb") as f:
-        pickle.dump(got2, f)
+    if path.endswith(".pkl"):
+        with open(path, "rb") as f:
+            return itertools.chain.from_iterable(pickle.load(f))
+    return iter(ResultLog(path))
+
+
+def evaluate(
+    session_id,
+    concurrency: int = CONCURRENCY,
+    resume: bool = False,
+    langfuse: bool = True,
+    methods: list[str] | None = None,
+    inputs: list[str] | None = None,
+):
+    """evaluate the converted items of the methods and inputs chosen by the selectors"""
+
+    from compose2kube import evaluator, results
+
+    items = read_converted(TMPFILE)
+    if methods or inputs:
+        ops = set(select(evaluator.ops.steps__, methods))
+        names = {evaluator.input_name(x["input"]) for x in _inputs(inputs)}
+        items = (x for x in items if x["op"] in ops and evaluator.input_name(x["input"]) in names)
+    callbacks = _callbacks("compose2kube:evaluate", session_id, langfuse)
+    log, done = _open_log(EVALFILE, resume)
+
+    async def run():
+        results = evaluator.astream_evaluate(
+            items, max_concurrency=concurrency, config={"callbacks": callbacks}, skip=done
+        )
+        async for result in results:
+            log.append(result)
+
+    asyncio.run(run())
     logger.info(f"wrote {EVALFILE}")
+    results.to_parquet(log, EVALPARQUET)
+    logger.info(f"wrote {EVALPARQUET}")
+    _write_metrics("evaluate", callbacks[0])
 
 
 def main():
@@ -100,6 +204,51 @@ def main():
     parser.add_argument("--verbose", "-v", action="store_true")
     parser.add_argument("--debug", action="store_true")
     parser.add_argument("--sessionid", "--sid", type=str, default="c2ksession")
+    parser.add_argument(
+        "--concurrency",
+        "-j",
+        type=int,
+        default=CONCURRENCY,
+        help="max number of (input, method) items in flight",
+    )
+    parser.add_argument(
+        "--stage-limit",
+        action="append",
+        default=[],
+        metavar="STAGE=N",
+        help="max concurrent work of a stage: llm, kompose, compose, dryrun. repeatable",
+    )
+    parser.add_argument(
+        "--no-langfuse",
+        action="store_true",
+        help="don't trace to langfuse. the metrics summary is written anyway",
+    )
+    parser.add_argument(
+        "--no-llm-cache",
+        action="store_true",
+        help="don't keep the LLM responses in $C2K_CACHE_DIR (/tmp/c2kcache) for later runs",
+    )
+    parser.add_argument(
+        "--method",
+        "-m",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="run only the methods matching: a name or glob, or !PATTERN to skip. repeatable",
+    )
+    parser.add_argument(
+        "--input",
+        "-i",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="run only the inputs (directory names) matching, like --method. repeatable",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="keep the result logs of the last run and only run the items missing in them",
+    )
     args = parser.parse_args()
     if not (args.convert or args.eval):
         parser.print_help()
@@ -111,17 +260,59 @@ def main():
     elif args.debug:
         loglevel = logging.DEBUG
 
+    load_env()
+    from langchain.globals import set_debug, set_llm_cache, set_verbose
+    from langchain_core.caches import InMemoryCache
+
+    from compose2kube import cache
+
     setup_logger("compose2kube", loglevel)
     setup_logger(__name__, loglevel)
     set_verbose(args.verbose)
     set_debug(args.debug)
+    try:
+        for name, limit in concurrency.parse_stage_limits(args.stage_limit).items():
+            concurrency.set_stage_limit(name, limit)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.no_llm_cache:
+        # the models are built with cache=True, which needs some cache
+        set_llm_cache(InMemoryCache())
+    else:
+        cache.install_llm_cache()
+
+    if args.method or args.input:
+        # fail on a selector that matches nothing before anything runs
+        from compose2kube import evaluator
 
+        try:
+            select(evaluator.ops.steps__, args.method)
+            _inputs(args.input)
+        except ValueError as e:
+            parser.error(str(e))
+
+    selected = dict(methods=args.method, inputs=args.input)
     if args.convert:
         logger.info("start convert")
-        convert(args.sessionid)
+        convert(
+            args.sessionid,
+            args.concurrency,
+            resume=args.resume,
+            langfuse=not args.no_langfuse,
+            **selected,
+        )
     if args.eval:
         logger.info("start eval")
-        evaluate(args.sessionid)
+        evaluate(
+            args.sessionid,
+            args.concurrency,
+            resume=args.resume,
+            langfuse=not args.no_langfuse,
+            **selected,
+        )
+    if not args.no_llm_cache:
+        logger.info(f"llm cache: {cache.llm_cache().stats()}")
 
 
 if __name__ == "__main__":
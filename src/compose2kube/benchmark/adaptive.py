@@ -0,0 +1,101 @@
+"""Sequential sampling: fewer generations for the inputs whose results are clear.
+
+Instead of requesting n samples at once, a method of chains_convert_grade is
+run in rounds of `round_n` samples, each round with its own seed (configurable
+"sample", see ChatOpenAIMultiGenerations), and each round is graded as it comes.
+Sampling stops once the Wilson interval of the pass rate of every judge is
+narrower than `width`, or at `max_n` samples. The inputs that always pass or
+always fail stop early; the uncertain ones get all max_n samples. The number of
+samples used is recorded in "n_used".
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Any
+
+from langchain_core.runnables import Runnable, RunnableConfig, ensure_config, patch_config
+
+
+@dataclass(frozen=True)
+class Adaptive:
+    round_n: int = 5
+    max_n: int = 20
+    # of the confidence interval of each pass rate
+    width: float = 0.3
+    # 1.96 for 95%
+    z: float = 1.96
+
+    def __str__(self) -> str:
+        return f"{self.round_n}:{self.max_n}:{self.width}:{self.z}"
+
+    def stable(self, passes: dict[str, list[bool]]) -> bool:
+        """whether the pass rate of every judge is known well enough"""
+
+        for results in passes.values():
+            if results:
+                low, high = wilson_interval(sum(results), len(results), self.z)
+                if high - low > self.width:
+                    return False
+        return True
+
+
+def wilson_interval(passed: int, n: int, z: float = 1.96) -> tuple[float, float]:
+    """the Wilson score interval of a pass rate, sound for rates near 0 and 1"""
+
+    if n == 0:
+        return 0.0, 1.0
+    p = passed / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def passes(graded: dict[str, Any]) -> dict[str, list[bool]]:
+    """judge -> whether each sample passed it, of an output of chains_grade"""
+
+    found: dict[str, list[bool]] = {}
+    if "grade_by_function" in graded:
+        found["function"] = [j.ok for j in graded["grade_by_function"]]
+    if "grade_by_dryrun" in graded:
+        found["dryrun"] = [j.ok for j in graded["grade_by_dryrun"]]
+    if "grade_by_model" in graded:
+        decisions = graded["grade_by_model"].get("model_graded", [])
+        found["model"] = [d.get("decision") == "Y" for d in decisions]
+    return found
+
+
+def merge(first: dict[str, Any], then: dict[str, Any]) -> dict[str, Any]:
+    """the outputs of two rounds as one: the per-sample lists concatenated"""
+
+    merged = dict(first)
+    for key, value in then.items():
+        if key not in merged:
+            merged[key] = value
+        elif isinstance(value, list):
+            merged[key] = merged[key] + value
+        elif isinstance(value, dict):
+            merged[key] = merge(merged[key], value)
+    return merged
+
+
+async def asample(
+    runnable: Runnable, input: dict, config: RunnableConfig | None, adaptive: Adaptive
+) -> dict[str, Any]:
+    """runnable run in rounds until adaptive is stable, the rounds merged"""
+
+    config = ensure_config(config)
+    configurable = config.get("configurable", {})
+    first = configurable.get("sample", 0)
+    graded: dict[str, Any] = {}
+    used = rounds = 0
+    while used < adaptive.max_n:
+        n = min(adaptive.round_n, adaptive.max_n - used)
+        round_config = patch_config(
+            config, configurable=dict(configurable, n=n, sample=first + rounds)
+        )
+        graded = merge(graded, await runnable.ainvoke(input, round_config))
+        used, rounds = used + n, rounds + 1
+        if adaptive.stable(passes(graded)):
+            break
+    return dict(graded, n_used=used, rounds=rounds)
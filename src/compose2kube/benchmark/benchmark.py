@@ -1,4 +1,7 @@
+import time
+from functools import lru_cache
 from operator import attrgetter, itemgetter
+from typing import AsyncIterator, Container, Iterable, Sequence
 
 import yaml
 from langchain.chains.openai_functions import convert_to_openai_function, get_openai_output_parser
@@ -7,6 +10,7 @@ from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import (
     ConfigurableField,
+    RunnableConfig,
     RunnableLambda,
     RunnableParallel,
     RunnablePassthrough,
@@ -15,12 +19,17 @@ from langchain_core.runnables import (
     chain as chain_decorator,
 )
 
+from compose2kube import workkey
+from compose2kube.benchmark.adaptive import Adaptive, asample
 from compose2kube.benchmark.grader import chains_grade
 from compose2kube.benchmark.grader.rule import INPUTS_JUDGES
-from compose2kube.benchmark.methods import CONVERT_METHODS, to_doc
+from compose2kube.benchmark.grader.version import grader_versions
+from compose2kube.benchmark.methods import to_doc
 from compose2kube.benchmark.parser import MDCodeBlockOutputParser
+from compose2kube.concurrency import astream_bounded
 from compose2kube.evaluator import Manifests
 from compose2kube.model import ChatOpenAIMultiGenerations
+from compose2kube.selection import select, select_steps
 
 
 def _join_manifests(xs: list[dict | str]) -> str:
@@ -39,99 +48,208 @@ def dedoc(doc: Document) -> str:
     return doc.page_content
 
 
+# The chains with LLM clients are built on first use (see __getattr__): importing
+# this module doesn't need OPENAI_API_KEY.
+
+
 # さまざまなメソッドからなるチェーン
 # receive {compose, judge}
-chains_convert_grade = RunnableParallel(
-    #
-    # Method1
-    #
-    zeroshot_txt=RunnablePassthrough.assign(
-        output={"compose": itemgetter("compose")}
-        | PromptTemplate.from_template(
-            "convert the composefile to kubernetes manifests:\n{compose}"
+@lru_cache
+def _chains_convert_grade() -> RunnableParallel:
+    from compose2kube.benchmark.methods import CONVERT_METHODS
+
+    return RunnableParallel(
+        #
+        # Method1
+        #
+        zeroshot_txt=RunnablePassthrough.assign(
+            output={"compose": itemgetter("compose")}
+            | PromptTemplate.from_template(
+                "convert the composefile to kubernetes manifests:\n{compose}"
+            )
+            | ChatOpenAIMultiGenerations(cache=True, model_kwargs={"seed": 1}).configurable_fields(
+                model_name=ConfigurableField(id="model_name"),
+                n=ConfigurableField(id="n", name="llm_n"),
+            )
         )
-        | ChatOpenAIMultiGenerations(cache=True, model_kwargs={"seed": 1}).configurable_fields(
-            model_name=ConfigurableField(id="model_name"),
-            n=ConfigurableField(id="n", name="llm_n"),
+        .assign(  # {compose, judge, output}
+            output_str=itemgetter("output") | StrOutputParser().map(),
+            output_parsed=itemgetter("output") | MDCodeBlockOutputParser().map(),
         )
-    )
-    .assign(  # {compose, judge, output}
-        output_str=itemgetter("output") | StrOutputParser().map(),
-        output_parsed=itemgetter("output") | MDCodeBlockOutputParser().map(),
-    )
-    .pick(["compose", "judge", "output", "output_str", "output_parsed"])
-    | chains_grade,
-    #
-    # Method2: JSON mode
-    #
-    zeroshot_jsonmode=RunnablePassthrough.assign(
-        output={"compose": itemgetter("compose")}
-        | PromptTemplate.from_template(
-            "convert the composefile to kubernetes manifests:\n{{compose}}",
-            template_format="jinja2",
+        .pick(["compose", "judge", "output", "output_str", "output_parsed"])
+        | chains_grade,
+        #
+        # Method2: JSON mode
+        #
+        zeroshot_jsonmode=RunnablePassthrough.assign(
+            output={"compose": itemgetter("compose")}
+            | PromptTemplate.from_template(
+                "convert the composefile to kubernetes manifests:\n{{compose}}",
+                template_format="jinja2",
+            )
+            | ChatOpenAIMultiGenerations(
+                cache=True,
+                model_kwargs={
+                    "seed": 1,
+                    "functions": [convert_to_openai_function(Manifests)],
+                    "function_call": {"name": "Manifests"},
+                },
+            ).configurable_fields(
+                model_name=ConfigurableField(id="model_name"),
+                n=ConfigurableField(id="n", name="llm_n"),
+            )
         )
-        | ChatOpenAIMultiGenerations(
-            cache=True,
-            model_kwargs={
-                "seed": 1,
-                "functions": [convert_to_openai_function(Manifests)],
-                "function_call": {"name": "Manifests"},
-            },
-        ).configurable_fields(
-            model_name=ConfigurableField(id="model_name"),
-            n=ConfigurableField(id="n", name="llm_n"),
+        .assign(  # {compose, judge, output}
+            output_parsed=itemgetter("output")
+            | (get_openai_output_parser([Manifests]) | (lambda m: m.manifests) | _join_manifests)
+            .with_fallbacks([RunnableLambda(lambda _: "parse failed")])
+            .map(),
         )
+        .pick(["compose", "judge", "output", "output_parsed"])
+        | chains_grade,
+        #
+        # Method3: annotate -> kompose
+        # annotate_kompose=RunnablePassthrough.assign(
+        #     output_with_metadata=itemgetter("compose")
+        #     | to_doc
+        #     | CONVERT_METHODS["annotate_kompose"],
+        # )
+        # .assign(
+        #     output_parsed=itemgetter("output_with_metadata")
+        #     | RunnableLambda(lambda doc: doc.page_content).map()
+        # )
+        # .pick(["compose", "judge", "output_with_metadata", "output_parsed"])
+        # | chains_grade,
+        # #
+        # # Method4: 正規化してからmethod3
+        # canonicalize_annotate_kompose=RunnablePassthrough.assign(
+        #     output_with_metadata=itemgetter("compose")
+        #     | to_doc
+        #     | CONVERT_METHODS["canonical_annotate_kompose"],
+        # )
+        # .assign(
+        #     output_parsed=itemgetter("output_with_metadata")
+        #     | RunnableLambda(lambda doc: doc.page_content).map()
+        # )
+        # .pick(["compose", "judge", "output_with_metadata", "output_parsed"])
+        # | chains_grade,
+        #
+        # Method5: expert prompting
+        #
+        expertprompting_text=RunnablePassthrough.assign(
+            output_parsed=itemgetter("compose")
+            | to_doc
+            | CONVERT_METHODS["expertprompting_text"]  # receives Document
+            | dedoc.map()  # TODO: make chains_grade accept Document, not str
+        ).pick(["compose", "judge", "output", "output_parsed"])
+        | chains_grade,
+        # Method5' expert prompting (JSON mode)
+        expertprompting_json=RunnablePassthrough.assign(
+            output_parsed=itemgetter("compose")
+            | to_doc
+            | CONVERT_METHODS["expertprompting_json"]
+            | dedoc.map()
+        ).pick(["compose", "judge", "output", "output_parsed"])
+        | chains_grade,
     )
-    .assign(  # {compose, judge, output}
-        output_parsed=itemgetter("output")
-        | (get_openai_output_parser([Manifests]) | (lambda m: m.manifests) | _join_manifests)
-        .with_fallbacks([RunnableLambda(lambda _: "parse failed")])
-        .map(),
+
+
+def chains_convert_grade_for(methods: Sequence[str] | None = None) -> RunnableParallel:
+    """chains_convert_grade with only the methods chosen by selectors (see selection)"""
+
+    return select_steps(_chains_convert_grade(), methods)
+
+
+def __getattr__(name: str):
+    if name == "chains_convert_grade":
+        return _chains_convert_grade()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def inputs_judges(inputs: Sequence[str] | None = None) -> list[tuple]:
+    """(name, compose, judge) of INPUTS_JUDGES chosen by selectors of their names"""
+
+    names = select([name for name, _, _ in INPUTS_JUDGES], inputs)
+    return [x for x in INPUTS_JUDGES if x[0] in names]
+
+
+@lru_cache
+def _method_version(method: str) -> tuple[str, int | None]:
+    step = _chains_convert_grade().steps__[method]
+    return workkey.prompt_version(step), workkey.seed_of(step)
+
+
+def convert_grade_key(
+    compose: str,
+    method: str,
+    config: RunnableConfig | None = None,
+    adaptive: Adaptive | None = None,
+    name: str | None = None,
+) -> str:
+    """the work key of running a method of chains_convert_grade on a compose file
+
+    name: of the input, which tells apart the inputs of the same compose file
+    """
+
+    configurable = (config or {}).get("configurable", {})
+    prompt, seed = _method_version(method)
+    key = workkey.WorkKey(
+        input=workkey.content_hash(compose),
+        name=name,
+        method=method,
+        sample=configurable.get("sample", 0),
+        model=configurable.get("model_name"),
+        n=configurable.get("n"),
+        seed=seed,
+        prompt=prompt,
+        adaptive=str(adaptive) if adaptive else None,
     )
-    .pick(["compose", "judge", "output", "output_parsed"])
-    | chains_grade,
-    #
-    # Method3: annotate -> kompose
-    # annotate_kompose=RunnablePassthrough.assign(
-    #     output_with_metadata=itemgetter("compose")
-    #     | to_doc
-    #     | CONVERT_METHODS["annotate_kompose"],
-    # )
-    # .assign(
-    #     output_parsed=itemgetter("output_with_metadata")
-    #     | RunnableLambda(lambda doc: doc.page_content).map()
-    # )
-    # .pick(["compose", "judge", "output_with_metadata", "output_parsed"])
-    # | chains_grade,
-    # #
-    # # Method4: 正規化してからmethod3
-    # canonicalize_annotate_kompose=RunnablePassthrough.assign(
-    #     output_with_metadata=itemgetter("compose")
-    #     | to_doc
-    #     | CONVERT_METHODS["canonical_annotate_kompose"],
-    # )
-    # .assign(
-    #     output_parsed=itemgetter("output_with_metadata")
-    #     | RunnableLambda(lambda doc: doc.page_content).map()
-    # )
-    # .pick(["compose", "judge", "output_with_metadata", "output_parsed"])
-    # | chains_grade,
-    #
-    # Method5: expert prompting
-    #
-    expertprompting_text=RunnablePassthrough.assign(
-        output_parsed=itemgetter("compose")
-        | to_doc
-        | CONVERT_METHODS["expertprompting_text"]  # receives Document
-        | dedoc.map()  # TODO: make chains_grade accept Document, not str
-    ).pick(["compose", "judge", "output", "output_parsed"])
-    | chains_grade,
-    # Method5' expert prompting (JSON mode)
-    expertprompting_json=RunnablePassthrough.assign(
-        output_parsed=itemgetter("compose")
-        | to_doc
-        | CONVERT_METHODS["expertprompting_json"]
-        | dedoc.map()
-    ).pick(["compose", "judge", "output", "output_parsed"])
-    | chains_grade,
-)
+    return str(key)
+
+
+async def astream_convert_grade(
+    inputs: Iterable[dict],
+    max_concurrency: int,
+    config: RunnableConfig | None = None,
+    skip: Container[str] = (),
+    adaptive: Adaptive | None = None,
+    methods: Sequence[str] | None = None,
+) -> AsyncIterator[dict]:
+    """chains_convert_grade for many {compose, judge, name}, running each method on its own
+
+    name is optional, but the inputs of the same compose file (input4 and input9)
+    need it to have their own keys. yields {key, input, method, model, **graded}
+    as each (input, method) finishes, with input being the name and
+    graded being the output of the method without the judge function, the
+    seconds it took in "seconds" and the versions of its graders in
+    "grader_versions" (see regrade). methods whose key is in skip are not run,
+    so feeding the keys in the log of an interrupted run resumes it. with
+    adaptive, the samples are requested in rounds until the pass rates are
+    stable, instead of configurable "n" at once, and graded has the number used
+    in "n_used". only the methods chosen by the selectors in methods are run.
+    """
+
+    configurable = (config or {}).get("configurable", {})
+
+    async def run(cell: tuple[dict, str, str]) -> dict:
+        x, method, _ = cell
+        step = _chains_convert_grade().steps__[method]
+        start = time.perf_counter()
+        if adaptive:
+            graded = await asample(step, x, config, adaptive)
+        else:
+            graded = await step.ainvoke(x, config=config)
+        seconds = time.perf_counter() - start
+        return dict(graded, seconds=seconds, grader_versions=grader_versions(x["judge"], config))
+
+    cells = (
+        (x, method, key)
+        for x in inputs
+        for method in select(_chains_convert_grade().steps__, methods)
+        if (key := convert_grade_key(x["compose"], method, config, adaptive, x.get("name")))
+        not in skip
+    )
+    async for (x, method, key), graded in astream_bounded(run, cells, max_concurrency):
+        graded = {k: v for k, v in graded.items() if k != "judge"}
+        model = configurable.get("model_name")
+        yield dict(key=key, input=x.get("name"), method=method, model=model, **graded)
@@ -1,18 +1,58 @@
 from operator import itemgetter
+from typing import Iterable
 
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import Runnable, RunnableConfig, RunnablePassthrough
+from langchain_core.runnables import (
+    chain as chain_decorator,
+)
 
-from .dryrun import dryrun_str
-from .llm import chain_grader
+from compose2kube.manifest import ParsedManifest
 
-# 複数の評価 (Correctness, groundness) をするチェーン
-# receive {compose, judge, output_parsed}
-chains_grade = RunnablePassthrough.assign(
-    grade_by_function=lambda dic: list(map(dic["judge"], dic["output_parsed"])),  # type: ignore
+from .dedup import deduplicated, fan_out, object_key, text_key, unique
+from .dryrun import dryrun_batch, dryrun_str  # noqa: F401
+from .judgement import Judgement
+from .llm import grade_samples
+
+
+@chain_decorator
+def grade_by_function(dic: dict) -> list[Judgement]:
+    """the judge of each distinct sample text"""
+
+    uniques, index = unique(dic["output_parsed"], text_key)
+    return fan_out([dic["judge"](m) for m in uniques], index)
+
+
+@chain_decorator
+def grade_by_model(dic: dict, config: RunnableConfig) -> list[dict]:
+    """the LLM grader of each distinct sample text"""
+
+    uniques, index = unique(dic["output_parsed"], text_key)
+    graded = grade_samples.invoke({"compose": dic["compose"], "manifests": uniques}, config)
+    return fan_out(graded, index)
+
+
+# the graders of chains_grade by the key of their output, see version
+GRADERS = dict(
+    grade_by_function=grade_by_function,
     grade_by_model=RunnablePassthrough.assign(
         _in_out_pairs=lambda dic: [
             {"compose": dic["compose"], "manifest": m} for m in dic["output_parsed"]
         ]
-    ).assign(model_graded=itemgetter("_in_out_pairs") | chain_grader.map()),
-    grade_by_dryrun=itemgetter("output_parsed") | dryrun_str.map(),
+    ).assign(model_graded=grade_by_model),
+    grade_by_dryrun=itemgetter("output_parsed") | deduplicated(dryrun_batch, object_key),
 )
+
+
+def chains_grade_by(names: Iterable[str]) -> Runnable:
+    """chains_grade with only the graders of names, to grade stored samples again"""
+
+    return RunnablePassthrough.assign(
+        # parse each sample once for all the graders
+        output_parsed=lambda dic: [ParsedManifest.of(m) for m in dic["output_parsed"]],
+    ).assign(**{name: GRADERS[name] for name in names})
+
+
+# 複数の評価 (Correctness, groundness) をするチェーン
+# receive {compose, judge, output_parsed}
+# every grader runs once per distinct sample (see dedup)
+chains_grade = chains_grade_by(GRADERS)
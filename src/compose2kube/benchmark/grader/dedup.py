@@ -0,0 +1,69 @@
+"""Grading each distinct sample once.
+
+With n samples and a fixed seed many samples of an input are the same. The
+graders run on the distinct samples and their results are fanned back out to
+every sample index, so per-sample results are unchanged.
+
+What counts as the same depends on what a grader reads. The rule judges and the
+LLM grader read the text (judge9 looks at comments), so they group by the text;
+kubectl reads the objects, so the dry-run groups by the canonical YAML.
+"""
+
+import copy
+from typing import Any, Callable, Hashable, Sequence, TypeVar
+
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+from compose2kube.cache import canonical_yaml
+
+T = TypeVar("T")
+
+
+def unique(items: Sequence[T], key: Callable[[T], Hashable] = str) -> tuple[list[T], list[int]]:
+    """the first item of each key, and the index in them of every item"""
+
+    firsts: dict[Hashable, int] = {}
+    uniques: list[T] = []
+    index: list[int] = []
+    for item in items:
+        k = key(item)
+        if k not in firsts:
+            firsts[k] = len(uniques)
+            uniques.append(item)
+        index.append(firsts[k])
+    return uniques, index
+
+
+def fan_out(results: Sequence[Any], index: Sequence[int]) -> list[Any]:
+    """the result of every item. repeated results are copies, not shared objects"""
+
+    seen: set[int] = set()
+    out = []
+    for i in index:
+        out.append(results[i] if i not in seen else copy.deepcopy(results[i]))
+        seen.add(i)
+    return out
+
+
+def text_key(manifest: str) -> str:
+    return str(manifest)
+
+
+def object_key(manifest: str) -> str:
+    return canonical_yaml(manifest)
+
+
+def deduplicated(
+    runnable: Runnable[list, list], key: Callable[[Any], Hashable] = text_key
+) -> Runnable[list, list]:
+    """runnable over a list, run on its distinct items only"""
+
+    def invoke(items: list, config: RunnableConfig) -> list:
+        uniques, index = unique(items, key)
+        return fan_out(runnable.invoke(uniques, config), index) if uniques else []
+
+    async def ainvoke(items: list, config: RunnableConfig) -> list:
+        uniques, index = unique(items, key)
+        return fan_out(await runnable.ainvoke(uniques, config), index) if uniques else []
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=f"deduplicated_{runnable.get_name()}")
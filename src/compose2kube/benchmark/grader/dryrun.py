@@ -1,30 +1,33 @@
-import subprocess
-import tempfile
-
 from langchain_core.runnables import chain as chain_decorator
 
+from compose2kube import kubectl
+
 from .judgement import Judgement
 
 
+def _to_judgement(result: kubectl.DryRunResult) -> Judgement:
+    return Judgement(ok=result.ok, metadata=dict(stdout=result.stdout, stderr=result.stderr))
+
+
 @chain_decorator
 def dryrun_str(manifests: str) -> Judgement:
     """execute kubectl apply --dry-run=server"""
 
-    # generate tmpfile
-    with tempfile.NamedTemporaryFile(
-        "w", prefix="dryrun", suffix=".yaml", delete=False
-    ) as f:
-        f.write(manifests)
-        f.close()
-        # get stdout and stderr separately using pipe
-        with subprocess.Popen(
-            f"kubectl apply -f {f.name} --dry-run=server",
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            encoding="utf-8",
-        ) as proc:
-            stdout, stderr = proc.communicate()
-            return Judgement(
-                ok=proc.returncode == 0, metadata=dict(stdout=stdout, stderr=stderr)
-            )
+    return _to_judgement(kubectl.dry_run(manifests, mode="server"))
+
+
+@chain_decorator
+def dryrun_batch(manifests: list[str]) -> list[Judgement]:
+    """execute kubectl apply --dry-run=server for all samples in one kubectl process
+
+    same as `dryrun_str.map()`: kubectl's stdout and stderr are split per sample
+    (see kubectl.dry_run_batch), and the indexes of the erroneous documents are
+    also recorded in `documents`.
+    """
+
+    judgements = []
+    for result in kubectl.dry_run_batch(manifests, mode="server"):
+        judgement = _to_judgement(result)
+        judgement.metadata["documents"] = result.documents
+        judgements.append(judgement)
+    return judgements
@@ -0,0 +1,248 @@
+"""Declarative rules for judging manifests in one pass.
+
+A `Rule` selects documents by kind (and `where` conditions), takes the values
+at `path` and tests them with `expected` or `predicate`. A path is dotted keys,
+where `*` iterates a list, `{a,b}` takes either key and `@containers` is the
+containers of a pod or of a controller's pod template. `quantifier` decides
+how the values make the verdict:
+
+- any: ok at the first value that passes
+- all: fails at the first value that doesn't pass, ok if some value passed
+- first: the first value decides
+
+A `RuleSet` compiles the rules of an input. Each manifest is parsed once and
+its documents are visited once for all the rules, sharing the values of the
+same path; the visit stops as soon as every rule has decided.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator, Literal
+
+from compose2kube.manifest import ParsedManifest
+
+from .judgement import Judgement
+
+NOTHING: Any = object()
+Metadata = dict | Callable[[Any], dict]
+
+_WORKLOAD_TEMPLATE = {
+    "Deployment": ("spec", "template", "spec"),
+    "StatefulSet": ("spec", "template", "spec"),
+    "DaemonSet": ("spec", "template", "spec"),
+    "ReplicaSet": ("spec", "template", "spec"),
+    "Job": ("spec", "template", "spec"),
+    "CronJob": ("spec", "jobTemplate", "spec", "template", "spec"),
+    "Pod": ("spec",),
+}
+
+
+def _pod_containers(doc: dict) -> Any:
+    keys = _WORKLOAD_TEMPLATE.get(str(doc.get("kind")))
+    if keys is None:
+        return NOTHING
+    spec: Any = doc
+    for key in keys:
+        spec = spec.get(key) if isinstance(spec, dict) else None
+    return spec.get("containers", NOTHING) if isinstance(spec, dict) else NOTHING
+
+
+SELECTORS: dict[str, Callable[[dict], Any]] = {"containers": _pod_containers}
+
+
+def _steps(path: str) -> list[str | tuple[str, ...]]:
+    steps: list[str | tuple[str, ...]] = []
+    for step in re.findall(r"\{[^}]*\}|[^.]+", path):
+        steps.append(tuple(step[1:-1].split(",")) if step.startswith("{") else step)
+    return steps
+
+
+def resolve(doc: Any, path: str, default: Any = NOTHING) -> Iterator[Any]:
+    """the values at path in doc
+
+    a missing key gives default, like chained `.get(key, default)`, or no value
+    without a default.
+    """
+
+    def walk(value: Any, steps: list) -> Iterator[Any]:
+        if not steps:
+            yield value
+            return
+        step, rest = steps[0], steps[1:]
+        if isinstance(step, tuple):
+            for key in step:
+                yield from walk(value, [key, *rest])
+        elif step == "*":
+            if isinstance(value, list):
+                for item in value:
+                    yield from walk(item, rest)
+        elif step.startswith("@"):
+            selected = SELECTORS[step[1:]](value) if isinstance(value, dict) else NOTHING
+            if selected is not NOTHING:
+                yield from walk(selected, rest)
+        elif isinstance(value, dict) and step in value:
+            yield from walk(value[step], rest)
+        elif default is not NOTHING:
+            yield default
+
+    return walk(doc, _steps(path)) if path else iter([doc])
+
+
+def _metadata(metadata: Metadata, value: Any) -> dict:
+    return metadata(value) if callable(metadata) else dict(metadata)
+
+
+@dataclass(frozen=True)
+class Rule:
+    """judge the values at path of the documents of kinds"""
+
+    name: str
+    path: str
+    kinds: frozenset[str] | None = None  # None for any kind
+    exclude_kinds: frozenset[str] = frozenset()
+    # path -> expected value, all of which a document must have
+    where: dict[str, Any] = field(default_factory=dict)
+    expected: Any = NOTHING
+    predicate: Callable[[Any], bool] | None = None
+    quantifier: Literal["any", "all", "first"] = "any"
+    # the value of a missing key on the path (see resolve)
+    default: Any = NOTHING
+    # metadata of the judgement, or functions of the deciding value
+    passed: Metadata = field(default_factory=dict)
+    failed: Metadata = field(default_factory=dict)
+    # metadata when no value decided, or a function of the last value seen (or None)
+    missing: Metadata = field(default_factory=dict)
+
+    def test(self, value: Any) -> bool:
+        if self.predicate is not None:
+            return bool(self.predicate(value))
+        return value == self.expected
+
+    def selects(self, doc: dict) -> bool:
+        kind = doc.get("kind")
+        if (self.kinds is not None and kind not in self.kinds) or kind in self.exclude_kinds:
+            return False
+        return all(
+            any(v == expected for v in resolve(doc, path)) for path, expected in self.where.items()
+        )
+
+
+@dataclass(frozen=True)
+class TextRule:
+    """judge the manifest text by regular expressions, e.g. for comments that YAML drops"""
+
+    name: str
+    patterns: tuple[str, ...]
+    quantifier: Literal["any", "all"] = "all"
+    passed: dict = field(default_factory=dict)
+    failed: dict = field(default_factory=dict)
+    flags: int = re.MULTILINE
+
+    def judge(self, text: str) -> Judgement:
+        found = (re.search(p, text, self.flags) for p in self.patterns)
+        ok = all(found) if self.quantifier == "all" else any(found)
+        return Judgement(ok=ok, metadata=dict(self.passed if ok else self.failed))
+
+
+class _State:
+    __slots__ = ("rule", "judgement", "seen", "last")
+
+    def __init__(self, rule: Rule):
+        self.rule = rule
+        self.judgement: Judgement | None = None
+        self.seen = False
+        self.last: Any = None
+
+    def feed(self, value: Any) -> None:
+        rule = self.rule
+        ok = rule.test(value)
+        self.seen, self.last = True, value
+        if rule.quantifier == "first" or ok == (rule.quantifier == "any"):
+            self.judgement = Judgement(
+                ok=ok, metadata=_metadata(rule.passed if ok else rule.failed, value)
+            )
+
+    def finish(self) -> Judgement:
+        if self.judgement is not None:
+            return self.judgement
+        rule = self.rule
+        if rule.quantifier == "all" and self.seen:
+            return Judgement(ok=True, metadata=_metadata(rule.passed, self.last))
+        return Judgement(ok=False, metadata=_metadata(rule.missing, self.last))
+
+
+class RuleSet:
+    """rules compiled into one visitor over the documents of a manifest
+
+    Calling a RuleSet judges a manifest like the judge functions do: by its
+    only rule, or by all of them with the judgement of each in metadata.
+    """
+
+    def __init__(self, rules: Iterable[Rule | TextRule]):
+        self.rules = list(rules)
+        names = [r.name for r in self.rules]
+        if len(names) != len(set(names)):
+            raise ValueError(f"rule names must be unique: {names}")
+        self._text = [r for r in self.rules if isinstance(r, TextRule)]
+        self._doc = [r for r in self.rules if isinstance(r, Rule)]
+        self._candidates: dict[Any, list[int]] = {}
+
+    def candidates(self, kind: Any) -> list[int]:
+        """indexes of the rules that may select a document of kind"""
+
+        if (found := self._candidates.get(kind)) is None:
+            found = self._candidates[kind] = [
+                i
+                for i, rule in enumerate(self._doc)
+                if (rule.kinds is None or kind in rule.kinds) and kind not in rule.exclude_kinds
+            ]
+        return found
+
+    def evaluate(self, manifest: str) -> dict[str, Judgement]:
+        """the judgement of every rule"""
+
+        judgements = {r.name: r.judge(manifest) for r in self._text}
+        states = [_State(rule) for rule in self._doc]
+        pending = len(states)
+        # text rules alone don't need the YAML parsed
+        documents = ParsedManifest.of(manifest).iter_documents() if states else iter(())
+        try:
+            for doc in documents:
+                if not pending:
+                    break
+                if doc is None:
+                    continue
+                if not isinstance(doc, dict):
+                    raise ValueError(f"YAML parsed non dict: {doc}")
+                # shared by the rules of the same path
+                values: dict[tuple[str, int], list[Any]] = {}
+                kind = doc.get("kind")
+                for i in self.candidates(kind if isinstance(kind, str) else None):
+                    state = states[i]
+                    rule = state.rule
+                    if state.judgement is not None or not rule.selects(doc):
+                        continue
+                    key = (rule.path, id(rule.default))
+                    if key not in values:
+                        values[key] = list(resolve(doc, rule.path, rule.default))
+                    for value in values[key]:
+                        state.feed(value)
+                        if state.judgement is not None:
+                            pending -= 1
+                            break
+        except Exception as e:
+            for state in states:
+                if state.judgement is None:
+                    state.judgement = Judgement(ok=False, metadata={"error": str(e)})
+
+        judgements |= {state.rule.name: state.finish() for state in states}
+        return {r.name: judgements[r.name] for r in self.rules}
+
+    def __call__(self, manifest: str) -> Judgement:
+        judgements = self.evaluate(manifest)
+        if len(judgements) == 1:
+            return next(iter(judgements.values()))
+        return Judgement(
+            ok=all(j.ok for j in judgements.values()),
+            metadata={name: vars(j) for name, j in judgements.items()},
+        )
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import (
     ChatPromptTemplate,
@@ -6,16 +8,26 @@ from langchain_core.prompts import (
 )
 from langchain_core.runnables import (
     ConfigurableField,
+    Runnable,
+    RunnableConfig,
     RunnableLambda,
-    RunnableParallel,
     RunnablePassthrough,
 )
+from langchain_core.runnables import (
+    chain as chain_decorator,
+)
 from langchain_openai import ChatOpenAI
 
+from compose2kube import load_env
+
+# candidates per grader request, overridden by configurable "grader_batch_size"
+GRADER_BATCH_SIZE = 1
+
 prompt_grader = ChatPromptTemplate.from_messages(
     messages=[
         SystemMessagePromptTemplate.from_template(
-            """Your primary concern is making sure that given the compose file, the generated kubernetes manifests are correct."""
+            "Your primary concern is making sure that given the compose file, "
+            "the generated kubernetes manifests are correct."
         ),
         HumanMessagePromptTemplate.from_template(
             """
@@ -39,13 +51,125 @@ Separate the decision and the explanation. For example:
     ],
 )
 
-# receive {compose, manifest}
-chain_grader = (
-    prompt_grader
-    | ChatOpenAI(cache=True, model_kwargs={"seed": 1}, temperature=0)
-    .configurable_fields(model_name=ConfigurableField(id="grader_model_name"))
-    .with_retry()
-    | JsonOutputParser(name="grader parser").with_fallbacks(
-        [RunnableLambda(lambda _: {"decision": "N", "explanation": "parse failed"})]
+# The chains with the grader client are built on first use (see __getattr__):
+# importing this module doesn't need OPENAI_API_KEY.
+
+
+@lru_cache
+def _grader_llm() -> Runnable:
+    load_env()
+    return (
+        ChatOpenAI(cache=True, model_kwargs={"seed": 1}, temperature=0)
+        .configurable_fields(model_name=ConfigurableField(id="grader_model_name"))
+        .with_retry()
     )
-).with_config(run_name="chain_grader")
+
+
+# receive {compose, manifest}
+@lru_cache
+def _chain_grader() -> Runnable:
+    return (
+        prompt_grader
+        | _grader_llm()
+        | JsonOutputParser(name="grader parser").with_fallbacks(
+            [RunnableLambda(lambda _: {"decision": "N", "explanation": "parse failed"})]
+        )
+    ).with_config(run_name="chain_grader")
+
+prompt_batch_grader = ChatPromptTemplate.from_messages(
+    messages=[
+        SystemMessagePromptTemplate.from_template(
+            "Your primary concern is making sure that given the compose file, "
+            "the generated kubernetes manifests are correct."
+        ),
+        HumanMessagePromptTemplate.from_template(
+            """
+Judge if each of the {{ manifests|length }} candidate kubernetes manifests below \
+is correctly converted from the given compose file.
+Judge every candidate on its own. If correct then the decision is 'Y' otherwise 'N'.
+Answer with one entry per candidate, in order, separating the decision and the explanation. \
+For example:
+{
+    "decisions": [
+        {"candidate": 1, "decision": "Y", "explanation": "..."},
+        {"candidate": 2, "decision": "N", "explanation": "..."}
+    ]
+}
+
+####Compose####
+
+{{ compose }}
+{% for manifest in manifests %}
+####Manifest {{ loop.index }}####
+
+{{ manifest }}
+{% endfor %}""",
+            template_format="jinja2",
+        ),
+    ],
+)
+
+
+def _split_decisions(dic: dict) -> list[dict]:
+    """the {decision, explanation} of each candidate. raises unless there is one per candidate"""
+
+    decisions = dic["graded"]["decisions"]
+    n = len(dic["manifests"])
+    by_candidate = {int(d["candidate"]): d for d in decisions if isinstance(d, dict)}
+    if len(decisions) != n or sorted(by_candidate) != list(range(1, n + 1)):
+        raise ValueError(f"expected decisions of candidates 1..{n}: {decisions}")
+    graded = [by_candidate[i] for i in range(1, n + 1)]
+    if any(d.get("decision") not in ("Y", "N") for d in graded):
+        raise ValueError(f"decision must be Y or N: {decisions}")
+    return [{"decision": d["decision"], "explanation": d.get("explanation", "")} for d in graded]
+
+
+# receive {compose, manifests}, return the chain_grader output of each manifest.
+# grades the manifests one by one when the answer doesn't parse
+@lru_cache
+def _chain_batch_grader() -> Runnable:
+    return (
+        RunnablePassthrough.assign(graded=prompt_batch_grader | _grader_llm() | JsonOutputParser())
+        | RunnableLambda(_split_decisions)
+    ).with_fallbacks(
+        [
+            RunnableLambda(
+                lambda dic: [{"compose": dic["compose"], "manifest": m} for m in dic["manifests"]]
+            )
+            | _chain_grader().map()
+        ]
+    ).with_config(run_name="chain_batch_grader")
+
+
+_LAZY = dict(
+    grader_llm=_grader_llm,
+    chain_grader=_chain_grader,
+    chain_batch_grader=_chain_batch_grader,
+)
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        return _LAZY[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@chain_decorator
+def grade_samples(dic: dict, config: RunnableConfig) -> list[dict]:
+    """chain_grader over {compose, manifests}, k manifests per request
+
+    k is the configurable "grader_batch_size" (GRADER_BATCH_SIZE by default).
+    With k = 1 every manifest is graded by chain_grader on its own.
+    """
+
+    k = config.get("configurable", {}).get("grader_batch_size") or GRADER_BATCH_SIZE
+    compose, manifests = dic["compose"], list(dic["manifests"])
+    if k <= 1:
+        pairs = [{"compose": compose, "manifest": m} for m in manifests]
+        return _chain_grader().batch(pairs, config) if pairs else []
+    chunks = [
+        {"compose": compose, "manifests": manifests[i : i + k]}
+        for i in range(0, len(manifests), k)
+    ]
+    graded = _chain_batch_grader().batch(chunks, config) if chunks else []
+    return [decision for decisions in graded for decision in decisions]
@@ -1,176 +1,115 @@
 import re
 
-import yaml
+from glom import glom
 
 from compose2kube.benchmark.dataset import input3, input4, input5, input12
-from .judgement import Judgement
+
+from .engine import Rule, RuleSet, TextRule
 
 input9 = input4
 
 
-def catch_decorator(fn):
-    def wrapped_fn(*args):
-        try:
-            return fn(*args)
-        except Exception as e:
-            return Judgement(ok=False, metadata={"error": str(e)})
-
-    return wrapped_fn
-
-
-@catch_decorator
-def judge3(manifests_str: str) -> Judgement:
-    try:
-        manifests = yaml.safe_load_all(manifests_str)
-        for manifest in manifests:
-            if manifest is None:
-                continue
-            if manifest.get("kind") == "Service":
-                continue
-            if manifest.get("metadata", {}).get("name") == "db":
-                controller_kind = manifest.get("kind")
-                ok = controller_kind == "StatefulSet"
-                return Judgement(ok=ok, metadata=dict(kind=controller_kind))
-    except Exception as exc:
-        print(f"Error parsing YAML: {exc}")
-        return Judgement(ok=False, metadata={"error": str(exc)})
-
-    return Judgement(
-        ok=False, metadata={"reason": "No 'db' manifest found or other error"}
-    )
-
-
-def judge4_easy(manifests: str) -> Judgement:
-    for line in manifests.splitlines():
-        if line.strip() == "image: $IMAGE_REGISTRY/$IMAGE_REPOSITORY:$IMAGE_VERSION":
-            return Judgement(ok=True, metadata={"message": "Correct image"})
-    return Judgement(ok=False, metadata={"message": "expected image string not found"})
-
-
-@catch_decorator
-def judge4(manifests: str) -> Judgement:
-    documents = yaml.safe_load_all(manifests)
-    for doc in documents:
-        if doc is None:
-            continue
-        match doc.get("kind", ""):
-            case "Deployment" | "StatefulSet":
-                containers = (
-                    doc.get("spec", {})
-                    .get("template", {})
-                    .get("spec", {})
-                    .get("containers", [])
-                )
-
-            case "Pod":
-                containers = doc.get("spec", {}).get("containers", {})
-            case _:
-                continue
-        for container in containers:
-            image = container.get("image", "")
-            env_vars = container.get("env", [])
-            if image == "$IMAGE_REGISTRY/$IMAGE_REPOSITORY:$IMAGE_VERSION":
-                return Judgement(ok=True, metadata={"env": env_vars})
-
-    return Judgement(ok=False, metadata={"message": "Incorrect image"})
-
-
-@catch_decorator
-def judge5(manifests: str) -> Judgement:
-    def is_valid_dns_name(name: str) -> bool:
-        """Check if the given string is a valid DNS name."""
-        if re.match(r"^[a-zA-Z0-9-]{1,63}(\.[a-zA-Z0-9-]{1,63})*$", name):
-            return True
-        return False
-
-    documents = yaml.safe_load_all(manifests)
-
-    at_least_one_service_name_is_valid = False
-    for doc in documents:
-        if doc is None:
-            continue
-        if not isinstance(doc, dict):
-            raise ValueError(f"YAML parsed non dict: {doc}")
-        if doc.get("kind", "") == "Service":
-            metadata_name = doc.get("metadata", {}).get("name", "")
-            if is_valid_dns_name(metadata_name):
-                at_least_one_service_name_is_valid = True
-            else:
-                return Judgement(
-                    ok=False,
-                    metadata={"message": f"Invalid DNS name: {metadata_name}"},
-                )
-    return Judgement(
-        ok=at_least_one_service_name_is_valid,
-        metadata={
-            "message": "At least one service name is valid"
-            if at_least_one_service_name_is_valid
-            else "No service found"
-        },
-    )
-
-
-@catch_decorator
-def judge12(manifests: str) -> Judgement:
-    documents = yaml.safe_load_all(manifests)
-    for doc in documents:
-        if doc is None:
-            continue
-        match doc.get("kind"):
-            case "Deployment" | "StatefulSet":
-                containers = (
-                    doc.get("spec", {})
-                    .get("template", {})
-                    .get("spec", {})
-                    .get("containers", [])
-                )
-            case "Pod":
-                containers = doc.get("spec", {}).get("containers", [])
-            case _:
-                continue
-        for container in containers:
-            for probe_type in ["livenessProbe", "readinessProbe"]:
-                probe = container.get(probe_type, {})
-                if probe.get("httpGet", {}).get("path", "") == "/jupyter/lab":
-                    return Judgement(
-                        ok=True,
-                        metadata=dict(probe=probe),
-                    )
-    return Judgement(
-        ok=False,
-        metadata={
-            "message": "No probe with /jupyter/lab found",
-            "probe": probe if "probe" in locals() else None,
-        },
-    )
-
-
-def judge9(manifests: str) -> Judgement:
-    # pyyamlでパースするとコメントが消えてしまうので文字列処理
-
-    required_comments = list(
-        map(
-            re.compile,
-            [
+def is_valid_dns_name(name: str) -> bool:
+    """Check if the given string is a valid DNS name."""
+    if re.match(r"^[a-zA-Z0-9-]{1,63}(\.[a-zA-Z0-9-]{1,63})*$", name):
+        return True
+    return False
+
+
+IMAGE4 = "$IMAGE_REGISTRY/$IMAGE_REPOSITORY:$IMAGE_VERSION"
+WORKLOADS = frozenset({"Deployment", "StatefulSet", "Pod"})
+
+# the controller of db must be a StatefulSet
+judge3 = RuleSet(
+    [
+        Rule(
+            name="db_is_statefulset",
+            exclude_kinds=frozenset({"Service"}),
+            where={"metadata.name": "db"},
+            path="kind",
+            default=None,
+            quantifier="first",
+            expected="StatefulSet",
+            passed=lambda kind: dict(kind=kind),
+            failed=lambda kind: dict(kind=kind),
+            missing={"reason": "No 'db' manifest found or other error"},
+        )
+    ]
+)
+
+judge4_easy = RuleSet(
+    [
+        TextRule(
+            name="image_line",
+            patterns=(rf"^\s*image: {re.escape(IMAGE4)}\s*$",),
+            passed={"message": "Correct image"},
+            failed={"message": "expected image string not found"},
+        )
+    ]
+)
+
+# the image keeps the variables
+judge4 = RuleSet(
+    [
+        Rule(
+            name="image_with_variables",
+            kinds=WORKLOADS,
+            path="@containers.*",
+            predicate=lambda container: container.get("image", "") == IMAGE4,
+            passed=lambda container: {"env": container.get("env", [])},
+            missing={"message": "Incorrect image"},
+        )
+    ]
+)
+
+# service names must be DNS names
+judge5 = RuleSet(
+    [
+        Rule(
+            name="service_dns_names",
+            kinds=frozenset({"Service"}),
+            path="metadata.name",
+            default="",
+            quantifier="all",
+            predicate=is_valid_dns_name,
+            passed={"message": "At least one service name is valid"},
+            failed=lambda name: {"message": f"Invalid DNS name: {name}"},
+            missing={"message": "No service found"},
+        )
+    ]
+)
+
+# the healthcheck becomes a probe
+judge12 = RuleSet(
+    [
+        Rule(
+            name="jupyter_probe",
+            kinds=WORKLOADS,
+            path="@containers.*.{livenessProbe,readinessProbe}",
+            default={},
+            predicate=lambda probe: glom(probe, "httpGet.path", default="") == "/jupyter/lab",
+            passed=lambda probe: dict(probe=probe),
+            missing=lambda probe: {"message": "No probe with /jupyter/lab found", "probe": probe},
+        )
+    ]
+)
+
+# pyyamlでパースするとコメントが消えてしまうので文字列処理
+judge9 = RuleSet(
+    [
+        TextRule(
+            name="securitycontext_comments",
+            patterns=(
                 r"#\s+securityContext:",
                 r"#\s+runAsUser:\s+\${UID}",
                 r"#\s+runAsGroup:\s+\${GID}",
-            ],
-        )
-    )
-
-    # Check if all required comments are present in the manifests string
-    comments_present = all(
-        re.search(pattern, manifests) for pattern in required_comments
-    )
-    if comments_present:
-        return Judgement(
-            ok=True, metadata={"message": "All required comments are included."}
-        )
-    else:
-        return Judgement(
-            ok=False, metadata={"message": "Not all required comments are included."}
+            ),
+            flags=0,
+            passed={"message": "All required comments are included."},
+            failed={"message": "Not all required comments are included."},
         )
+    ]
+)
 
 
 INPUTS_JUDGES = [
@@ -0,0 +1,55 @@
+import asyncio
+import unittest
+
+from langchain_core.runnables import RunnableLambda
+
+from . import grade_by_function
+from .dedup import deduplicated, fan_out, object_key, unique
+from .judgement import Judgement
+
+SAMPLES = [
+    "kind: Pod\nmetadata: {name: a}\n",
+    "kind: Service\n",
+    "kind: Pod\nmetadata: {name: a}\n",
+    "# the same object\nkind: Pod\nmetadata:\n  name: a\n",
+]
+
+
+class TestDedup(unittest.TestCase):
+    def test_unique(self):
+        uniques, index = unique(SAMPLES)
+        self.assertEqual(uniques, [SAMPLES[0], SAMPLES[1], SAMPLES[3]])
+        self.assertEqual(index, [0, 1, 0, 2])
+        uniques, index = unique(SAMPLES, object_key)
+        self.assertEqual(uniques, SAMPLES[:2])
+        self.assertEqual(index, [0, 1, 0, 0])
+
+    def test_fan_out_copies(self):
+        got = fan_out([{"ok": True}], [0, 0])
+        self.assertEqual(got, [{"ok": True}, {"ok": True}])
+        self.assertIsNot(got[0], got[1])
+
+    def test_deduplicated(self):
+        calls = []
+
+        def grade(manifests: list[str]) -> list[int]:
+            calls.append(manifests)
+            return [len(m) for m in manifests]
+
+        runnable = deduplicated(RunnableLambda(grade), object_key)
+        expected = [len(SAMPLES[0]), len(SAMPLES[1]), len(SAMPLES[0]), len(SAMPLES[0])]
+        self.assertEqual(runnable.invoke(SAMPLES), expected)
+        self.assertEqual(asyncio.run(runnable.ainvoke(SAMPLES)), expected)
+        self.assertEqual(calls, [SAMPLES[:2], SAMPLES[:2]])
+        self.assertEqual(runnable.invoke([]), [])
+
+    def test_grade_by_function(self):
+        judged = []
+
+        def judge(manifest: str) -> Judgement:
+            judged.append(manifest)
+            return Judgement(ok=manifest.startswith("#"), metadata={})
+
+        got = grade_by_function.invoke({"output_parsed": SAMPLES, "judge": judge})
+        self.assertEqual([j.ok for j in got], [False, False, False, True])
+        self.assertEqual(len(judged), 3)  # comments count for the judges
@@ -0,0 +1,143 @@
+import unittest
+
+from . import rule
+from .engine import Rule, RuleSet, TextRule, resolve
+
+STATEFUL_DB = """
+apiVersion: v1
+kind: Service
+metadata:
+  name: db
+---
+apiVersion: apps/v1
+kind: StatefulSet
+metadata:
+  name: db
+spec:
+  template:
+    spec:
+      containers:
+        - name: db
+          image: $IMAGE_REGISTRY/$IMAGE_REPOSITORY:$IMAGE_VERSION
+          env: [{name: A, value: "1"}]
+          readinessProbe:
+            httpGet: {path: /jupyter/lab, port: 8888}
+"""
+
+DEPLOYMENT_DB = """
+kind: Deployment
+metadata:
+  name: db
+spec:
+  template:
+    spec:
+      containers:
+        - name: db
+          image: postgres
+"""
+
+
+class TestResolve(unittest.TestCase):
+    def test_paths(self):
+        doc = {"kind": "Pod", "spec": {"containers": [{"a": 1, "b": 2}, {"a": 3}]}}
+        self.assertEqual(list(resolve(doc, "@containers.*.a")), [1, 3])
+        self.assertEqual(list(resolve(doc, "@containers.*.{a,b}")), [1, 2, 3])
+        self.assertEqual(list(resolve(doc, "@containers.*.{a,b}", default={})), [1, 2, 3, {}])
+        self.assertEqual(list(resolve(doc, "metadata.name")), [])
+        self.assertEqual(list(resolve(doc, "metadata.name", default="")), [""])
+        self.assertEqual(list(resolve({"kind": "Service"}, "@containers")), [])
+
+    def test_cronjob_containers(self):
+        doc = {
+            "kind": "CronJob",
+            "spec": {"jobTemplate": {"spec": {"template": {"spec": {"containers": [1]}}}}},
+        }
+        self.assertEqual(list(resolve(doc, "@containers.*")), [1])
+
+
+class TestRuleSet(unittest.TestCase):
+    def test_quantifiers(self):
+        manifest = "kind: A\nn: 1\n---\nkind: A\nn: 2\n---\nkind: B\nn: 3\n"
+        rules = RuleSet(
+            [
+                Rule(name="any", path="n", predicate=lambda n: n > 1),
+                Rule(name="all", path="n", quantifier="all", predicate=lambda n: n > 1),
+                Rule(name="first", path="n", quantifier="first", expected=1),
+                Rule(name="b", path="n", kinds=frozenset({"B"}), quantifier="all", expected=3),
+                Rule(name="c", path="n", kinds=frozenset({"C"}), quantifier="all", expected=3),
+            ]
+        )
+        got = {name: j.ok for name, j in rules.evaluate(manifest).items()}
+        self.assertEqual(got, {"any": True, "all": False, "first": True, "b": True, "c": False})
+
+    def test_where(self):
+        rules = RuleSet(
+            [Rule(name="r", path="kind", where={"metadata.name": "x"}, expected="Pod")]
+        )
+        self.assertTrue(rules("kind: Service\n---\nkind: Pod\nmetadata: {name: x}\n").ok)
+        self.assertFalse(rules("kind: Pod\nmetadata: {name: y}\n").ok)
+
+    def test_combined_judgement(self):
+        rules = RuleSet(
+            [
+                Rule(name="pod", path="kind", expected="Pod", passed={"message": "pod"}),
+                TextRule(name="comment", patterns=(r"^# hello$",)),
+            ]
+        )
+        got = rules("# hello\nkind: Pod\n")
+        self.assertTrue(got.ok)
+        self.assertEqual(got.metadata["pod"], {"ok": True, "metadata": {"message": "pod"}})
+        self.assertFalse(rules("kind: Pod\n").ok)
+
+    def test_stops_when_decided(self):
+        seen = []
+
+        def predicate(value):
+            seen.append(value)
+            return True
+
+        RuleSet([Rule(name="r", path="n", predicate=predicate)])("n: 1\n---\nn: 2\n")
+        self.assertEqual(seen, [1])
+
+    def test_errors(self):
+        for manifest in ["a: [", "- 1\n- 2"]:
+            with self.subTest(manifest=manifest):
+                got = rule.judge3(manifest)
+                self.assertFalse(got.ok)
+                self.assertIn("error", got.metadata)
+
+    def test_unique_names(self):
+        with self.assertRaises(ValueError):
+            RuleSet([Rule(name="r", path="a"), Rule(name="r", path="b")])
+
+
+class TestJudges(unittest.TestCase):
+    def test_judge3(self):
+        self.assertEqual(rule.judge3(STATEFUL_DB).metadata, {"kind": "StatefulSet"})
+        self.assertTrue(rule.judge3(STATEFUL_DB).ok)
+        self.assertFalse(rule.judge3(DEPLOYMENT_DB).ok)
+        self.assertFalse(rule.judge3("kind: Service\nmetadata: {name: db}\n").ok)
+
+    def test_judge4(self):
+        got = rule.judge4(STATEFUL_DB)
+        self.assertTrue(got.ok)
+        self.assertEqual(got.metadata, {"env": [{"name": "A", "value": "1"}]})
+        self.assertFalse(rule.judge4(DEPLOYMENT_DB).ok)
+        self.assertTrue(rule.judge4_easy(STATEFUL_DB).ok)
+
+    def test_judge5(self):
+        self.assertTrue(rule.judge5(STATEFUL_DB).ok)
+        got = rule.judge5(STATEFUL_DB + "---\nkind: Service\nmetadata: {name: Bad_Name}\n")
+        self.assertEqual(got.metadata, {"message": "Invalid DNS name: Bad_Name"})
+        self.assertFalse(rule.judge5(DEPLOYMENT_DB).ok)
+
+    def test_judge9(self):
+        comments = "# securityContext:\n#   runAsUser: ${UID}\n#   runAsGroup: ${GID}\n"
+        self.assertTrue(rule.judge9(STATEFUL_DB + comments).ok)
+        self.assertFalse(rule.judge9(STATEFUL_DB).ok)
+
+    def test_judge12(self):
+        self.assertTrue(rule.judge12(STATEFUL_DB).ok)
+        got = rule.judge12(DEPLOYMENT_DB)
+        self.assertFalse(got.ok)
+        self.assertEqual(got.metadata["probe"], {})
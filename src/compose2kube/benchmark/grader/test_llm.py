@@ -0,0 +1,96 @@
+import json
+import re
+import unittest
+from unittest.mock import patch
+
+from langchain.globals import get_llm_cache, set_llm_cache
+from langchain_core.caches import InMemoryCache
+from openai.types.chat.chat_completion import ChatCompletion, Choice
+from openai.types.chat.chat_completion_message import ChatCompletionMessage
+
+from .llm import _split_decisions, grade_samples
+
+
+def _completion(content: str) -> ChatCompletion:
+    message = ChatCompletionMessage(content=content, role="assistant")
+    return ChatCompletion(
+        id="test",
+        choices=[Choice(finish_reason="stop", index=0, message=message)],
+        created=1,
+        model="gpt-3.5-turbo",
+        object="chat.completion",
+    )
+
+
+class FakeGrader:
+    """answers 'Y' for the manifests with kind: Pod. breaks batch answers when broken"""
+
+    def __init__(self, broken: bool = False):
+        self.broken = broken
+        self.prompts: list[str] = []
+
+    def __call__(self, _self, messages, **kwargs):
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+        manifests = re.split(r"####Manifest \d+####", prompt)[1:]
+        if not manifests:  # chain_grader
+            manifest = prompt.split("####Compose####")[0]
+            return _completion(json.dumps({"decision": "Y" if "Pod" in manifest else "N"}))
+        if self.broken:
+            return _completion("not json")
+        decisions = [
+            {"candidate": i, "decision": "Y" if "Pod" in m else "N", "explanation": str(i)}
+            for i, m in enumerate(manifests, 1)
+        ]
+        return _completion(json.dumps({"decisions": decisions}))
+
+
+class TestGradeSamples(unittest.TestCase):
+    def setUp(self) -> None:
+        cache = get_llm_cache()
+        set_llm_cache(InMemoryCache())
+        self.addCleanup(set_llm_cache, cache)
+        patcher = patch.dict("os.environ", {"OPENAI_API_KEY": "dummy"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def grade(self, fake: FakeGrader, k: int, n: int = 5) -> list[dict]:
+        manifests = [f"kind: {'Pod' if i % 2 else 'Service'}\nid: {i}" for i in range(n)]
+        config = {"configurable": {"grader_batch_size": k}}
+        create = "openai.resources.chat.completions.Completions.create"
+        with patch(create, autospec=True, side_effect=fake):
+            return grade_samples.invoke({"compose": "services: {}", "manifests": manifests}, config)
+
+    def test_per_pair(self):
+        fake = FakeGrader()
+        got = self.grade(fake, k=1)
+        self.assertEqual([g["decision"] for g in got], ["N", "Y", "N", "Y", "N"])
+        self.assertEqual(len(fake.prompts), 5)
+
+    def test_batched(self):
+        fake = FakeGrader()
+        got = self.grade(fake, k=2)
+        self.assertEqual([g["decision"] for g in got], ["N", "Y", "N", "Y", "N"])
+        self.assertEqual([g["explanation"] for g in got], ["1", "2", "1", "2", "1"])
+        self.assertEqual(len(fake.prompts), 3)
+        self.assertEqual(sum(p.count("####Compose####") for p in fake.prompts), 3)
+
+    def test_fallback_per_pair(self):
+        fake = FakeGrader(broken=True)
+        got = self.grade(fake, k=5)
+        self.assertEqual([g["decision"] for g in got], ["N", "Y", "N", "Y", "N"])
+        self.assertEqual(len(fake.prompts), 1 + 5)
+
+    def test_empty(self):
+        self.assertEqual(self.grade(FakeGrader(), k=3, n=0), [])
+
+    def test_split_decisions(self):
+        dic = {"manifests": ["a", "b"]}
+        decisions = [{"candidate": 2, "decision": "N"}, {"candidate": "1", "decision": "Y"}]
+        got = _split_decisions({**dic, "graded": {"decisions": decisions}})
+        self.assertEqual([g["decision"] for g in got], ["Y", "N"])
+        self.assertEqual(got[0], {"decision": "Y", "explanation": ""})
+        too_few = [{"candidate": 1, "decision": "Y"}]
+        for decisions in [too_few, [{"candidate": 1}, {"candidate": 2}]]:
+            with self.assertRaises(ValueError):
+                _split_decisions({**dic, "graded": {"decisions": decisions}})
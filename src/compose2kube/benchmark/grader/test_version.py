@@ -0,0 +1,46 @@
+import unittest
+from unittest.mock import patch
+
+from compose2kube import kubectl
+
+from . import version
+from .engine import Rule, RuleSet
+from .version import dryrun_version, grader_versions, judge_version, model_version, outdated
+
+
+def _judge(expected: str, passed=lambda kind: dict(kind=kind)) -> RuleSet:
+    return RuleSet([Rule(name="db", path="kind", expected=expected, passed=passed)])
+
+
+class TestVersion(unittest.TestCase):
+    def test_judge_version(self):
+        self.assertEqual(judge_version(_judge("StatefulSet")), judge_version(_judge("StatefulSet")))
+        self.assertNotEqual(judge_version(_judge("StatefulSet")), judge_version(_judge("Pod")))
+        # functions by their source
+        other = _judge("StatefulSet", passed=lambda kind: dict(found=kind))
+        self.assertNotEqual(judge_version(_judge("StatefulSet")), judge_version(other))
+
+    def test_model_version(self):
+        self.assertEqual(model_version(), model_version({"configurable": {}}))
+        gpt4 = {"configurable": {"grader_model_name": "gpt-4"}}
+        self.assertNotEqual(model_version(), model_version(gpt4))
+        batched = {"configurable": {"grader_batch_size": 5}}
+        self.assertNotEqual(model_version(), model_version(batched))
+
+    def test_dryrun_version(self):
+        before, source = dryrun_version(), version._source
+        # a change in how kubectl is run changes it too
+        with patch.object(version, "_source", lambda obj: "" if obj is kubectl else source(obj)):
+            self.assertNotEqual(dryrun_version(), before)
+        self.assertEqual(dryrun_version(), before)
+        # and so does another kubectl or cluster
+        upgraded = "kubectl client=v1.30.0 server=v1.30.1"
+        with patch.object(kubectl, "cluster_version", lambda: upgraded):
+            self.assertNotEqual(dryrun_version(), before)
+
+    def test_outdated(self):
+        versions = grader_versions(_judge("StatefulSet"))
+        self.assertEqual(outdated({}, versions), list(versions))
+        record = dict(grader_versions=dict(versions, grade_by_function="old"))
+        self.assertEqual(outdated(record, versions), ["grade_by_function"])
+        self.assertNotIn("grade_by_function", grader_versions(None))
@@ -0,0 +1,110 @@
+"""Versions of the graders, to grade stored samples again only when a grader changed.
+
+The version of a grader is a hash of what decides its judgements:
+
+- grade_by_function: the rules of the judge of the input (the source of their
+  functions included) and the source of the rule engine
+- grade_by_model: the grader prompts, the grader model and its batch size
+- grade_by_dryrun: the source of the dry-run grader and of the kubectl and
+  tools modules it runs kubectl with, and the kubectl and cluster versions
+
+A record graded by chains_grade keeps the versions it was graded with in
+"grader_versions"; outdated() tells the graders that changed since.
+"""
+
+import dataclasses
+import hashlib
+import inspect
+import json
+from typing import Any, Callable
+
+from langchain_core.runnables import RunnableConfig
+
+from compose2kube import kubectl, tools, workkey
+
+from . import dryrun, engine, llm
+
+
+def _hash(*parts: Any) -> str:
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def _source(obj: Any) -> str:
+    try:
+        return inspect.getsource(obj).strip()
+    except (OSError, TypeError):
+        return getattr(obj, "__qualname__", repr(obj))
+
+
+def _describe(value: Any) -> Any:
+    """value as JSON-able data, functions by their source and the values they close over"""
+
+    if value is engine.NOTHING:
+        return "NOTHING"
+    if isinstance(value, engine.RuleSet):
+        return [_describe(rule) for rule in value.rules]
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {f.name: _describe(getattr(value, f.name)) for f in dataclasses.fields(value)}
+    if isinstance(value, dict):
+        return {str(k): _describe(v) for k, v in value.items()}
+    if isinstance(value, (set, frozenset)):
+        return sorted(str(_describe(v)) for v in value)
+    if isinstance(value, (list, tuple)):
+        return [_describe(v) for v in value]
+    if callable(value):
+        cells = getattr(value, "__closure__", None) or ()
+        return [_source(value), *(_describe(c.cell_contents) for c in cells)]
+    return value
+
+
+def judge_version(judge: Callable[[str], Any]) -> str:
+    """the version of grade_by_function with the judge of an input"""
+
+    return _hash(_describe(judge), _source(engine))
+
+
+def model_version(config: RunnableConfig | None = None) -> str:
+    """the version of grade_by_model with the configurable of config"""
+
+    configurable = (config or {}).get("configurable", {})
+    return _hash(
+        workkey.prompt_version(llm.chain_grader),
+        workkey.prompt_version(llm.chain_batch_grader),
+        configurable.get("grader_model_name"),
+        configurable.get("grader_batch_size") or llm.GRADER_BATCH_SIZE,
+    )
+
+
+def dryrun_version() -> str:
+    """the version of grade_by_dryrun
+
+    kubectl.cluster_version() is in it, so an upgrade of kubectl or of the cluster,
+    whose API server decides the dry-run results, outdates the dry-run grades.
+    """
+
+    return _hash(_source(dryrun), _source(kubectl), _source(tools), kubectl.cluster_version())
+
+
+def grader_versions(
+    judge: Callable[[str], Any] | None, config: RunnableConfig | None = None
+) -> dict[str, str]:
+    """grader -> its version, the graders named by their keys in chains_grade
+
+    without a judge, grade_by_function is left out.
+    """
+
+    versions = dict(grade_by_model=model_version(config), grade_by_dryrun=dryrun_version())
+    if judge is not None:
+        versions = dict(grade_by_function=judge_version(judge), **versions)
+    return versions
+
+
+def outdated(record: dict, versions: dict[str, str]) -> list[str]:
+    """the graders of record that were graded by another version than in versions
+
+    the graders of a record that has no versions are all outdated.
+    """
+
+    recorded = record.get("grader_versions") or {}
+    return [name for name, version in versions.items() if recorded.get(name) != version]
@@ -1,5 +1,4 @@
-import subprocess
-import tempfile
+from functools import lru_cache
 from logging import getLogger
 from operator import itemgetter
 from typing import List, cast
@@ -14,6 +13,7 @@ from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import (
     ConfigurableField,
+    Runnable,
     RunnableLambda,  # noqa: F401
     RunnableParallel,
     RunnablePassthrough,  # noqa: F401
@@ -24,57 +24,54 @@ from langchain_core.runnables import (
 )
 from langchain_openai import ChatOpenAI
 
-from compose2kube import templates
+from compose2kube import composefile, templates, tools
 from compose2kube.benchmark.parser import MDCodeBlockOutputParser
 from compose2kube.evaluator import Manifests
 from compose2kube.model import ChatOpenAIMultiGenerations
 
 logger = getLogger(__name__)
 
+# The chains with LLM clients are built on first use (see __getattr__): importing
+# this module doesn't need OPENAI_API_KEY.
+
 
 @chain_decorator
 def canonicalize(spec: Document) -> Document:
+    """`docker compose config` in-process: the compose file with the short forms expanded
+
+    page_content is empty and metadata["stderr"] tells why when the file is invalid.
+    """
+    try:
+        canonical = composefile.dump(composefile.config(spec.page_content))
+    except (yaml.YAMLError, composefile.ComposeError) as e:
+        return Document(page_content="", metadata=dict(stderr=f"{e}\n"))
+    return Document(page_content=canonical, metadata=dict(stderr=""))
+
+
+@chain_decorator
+def canonicalize_by_docker(spec: Document) -> Document:
     """return stdout and stderr separately of command `docker compose config`"""
-    with tempfile.NamedTemporaryFile(
-        "w", prefix="canonicalize", suffix=".yaml", delete=False
-    ) as tmp:
-        tmp.write(spec.page_content)
-        tmp.close()
-        logger.debug(tmp.name)
-
-        # get stdout and stderr separately using pipe
-        with subprocess.Popen(
-            f"docker compose -f {tmp.name} config --no-path-resolution --no-interpolate",
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            encoding="utf-8",
-        ) as proc:
-            stdout, stderr = proc.communicate()
-            return Document(page_content=stdout, metadata=dict(stderr=stderr))
+    # the project name the former runs got from their temp file in /tmp,
+    # kept so that the output (and the LLM cache keys of its prompts) don't change
+    proc = tools.run(
+        "docker compose -p tmp -f - config --no-path-resolution --no-interpolate",
+        input=spec.page_content,
+        stage_name="compose",
+    )
+    return Document(page_content=proc.stdout, metadata=dict(stderr=proc.stderr))
 
 
 @chain_decorator
 def kompose(spec: Document) -> Document:
     """return output of command `kompose convert`"""
-    with tempfile.NamedTemporaryFile(
-        "w", prefix="kompose", suffix=".yaml", delete=False
-    ) as tmp:
-        tmp.write(spec.page_content)
-        tmp.close()
-        logger.debug(tmp.name)
-
-        with subprocess.Popen(
-            f"kompose convert -f {tmp.name} --stdout",
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            encoding="utf-8",
-        ) as proc:
-            stdout, stderr = proc.communicate()
-            return Document(
-                page_content=stdout, metadata=dict(stderr=stderr, orig_spec=spec)
-            )
+    with tools.workspace(prefix="kompose") as workdir:
+        (workdir / "compose.yaml").write_text(spec.page_content)
+        proc = tools.run(
+            "kompose convert -f compose.yaml --stdout", stage_name="kompose", cwd=workdir
+        )
+    return Document(
+        page_content=proc.stdout, metadata=dict(stderr=proc.stderr, orig_spec=spec)
+    )
 
 
 @chain_decorator
@@ -83,20 +80,30 @@ def to_doc(page_content: str, **kwargs) -> Document:
 
 
 # receive Document, return Documents
-chain_annotate: RunnableSerializable[Document, list[Document]] = (
-    {"input": lambda doc: doc.page_content, "target": lambda _: "AWS EKS"}
-    | templates.prompt1_for_kompose
-    | ChatOpenAIMultiGenerations(
-        cache=True, model_kwargs={"seed": 1}
-    ).configurable_fields(
-        n=ConfigurableField(id="annotate_n"),
-        model_name=ConfigurableField(id="annotate_model_name"),
+@lru_cache
+def _chain_annotate() -> RunnableSerializable[Document, list[Document]]:
+    return (
+        {"input": lambda doc: doc.page_content, "target": lambda _: "AWS EKS"}
+        | templates.prompt1_for_kompose
+        | ChatOpenAIMultiGenerations(
+            cache=True, model_kwargs={"seed": 1}
+        ).configurable_fields(
+            n=ConfigurableField(id="annotate_n"),
+            model_name=ConfigurableField(id="annotate_model_name"),
+        )
+        | (MDCodeBlockOutputParser() | to_doc).map()
     )
-    | (MDCodeBlockOutputParser() | to_doc).map()
-)
 
-chain_annotate_kompose = chain_annotate | kompose.map()
-chain_canonical_annotate_kompose = canonicalize | chain_annotate | kompose.map()
+
+@lru_cache
+def _chain_annotate_kompose() -> Runnable:
+    return _chain_annotate() | kompose.map()
+
+
+@lru_cache
+def _chain_canonical_annotate_kompose() -> Runnable:
+    return canonicalize | _chain_annotate() | kompose.map()
+
 
 #
 # [2305.14688] ExpertPrompting: Instructing Large Language Models to be Distinguished Experts
@@ -169,50 +176,54 @@ def doc_to_str(doc: Document) -> str:
 
 
 # Document => List[Document]
-chain_zeroshottext = (
-    {"compose": doc_to_str}
-    | prompt_zeroshot
-    | ChatOpenAIMultiGenerations(
-        cache=True, model_kwargs={"seed": 1}
-    ).configurable_fields(
-        model_name=ConfigurableField(id="model_name"),
-        n=ConfigurableField(id="n", name="llm_n"),
-    )  # => List[AIMessage]
-    | RunnableLambda(
-        lambda s: Document(
-            page_content=MDCodeBlockOutputParser().invoke(s),
-            metadata=dict(output_str=StrOutputParser().invoke(s)),
-        )
-    ).map()  # => List[Document]
-)
+@lru_cache
+def _chain_zeroshottext() -> Runnable:
+    return (
+        {"compose": doc_to_str}
+        | prompt_zeroshot
+        | ChatOpenAIMultiGenerations(
+            cache=True, model_kwargs={"seed": 1}
+        ).configurable_fields(
+            model_name=ConfigurableField(id="model_name"),
+            n=ConfigurableField(id="n", name="llm_n"),
+        )  # => List[AIMessage]
+        | RunnableLambda(
+            lambda s: Document(
+                page_content=MDCodeBlockOutputParser().invoke(s),
+                metadata=dict(output_str=StrOutputParser().invoke(s)),
+            )
+        ).map()  # => List[Document]
+    )
 
 
 # input is a Document
-chain_expert_prompting: RunnableSerializable[Document, List[Document]] = (
-    RunnableParallel(
-        compose=RunnableLambda(lambda doc: cast(Document, doc).page_content),
-    )
-    .assign(
-        expert_identity=(
-            {"question": lambda _: "convert the composefile to kubernetes manifests"}
-            | prompt_expert_identity
-            | ChatOpenAI(cache=True, model_kwargs={"seed": 1})
-            | StrOutputParser()
-        ),
-        question={"compose": itemgetter("compose")}
-        | prompt_zeroshot
-        | (lambda p: p.to_string()),
-    )
-    .pick(["expert_identity", "question"])
-    | prompt_expertprompting
-    | ChatOpenAIMultiGenerations(
-        cache=True, model_kwargs={"seed": 1}
-    ).configurable_fields(
-        model_name=ConfigurableField(id="model_name"),
-        n=ConfigurableField(id="n", name="llm_n"),
+@lru_cache
+def _chain_expert_prompting() -> RunnableSerializable[Document, List[Document]]:
+    return (
+        RunnableParallel(
+            compose=RunnableLambda(lambda doc: cast(Document, doc).page_content),
+        )
+        .assign(
+            expert_identity=(
+                {"question": lambda _: "convert the composefile to kubernetes manifests"}
+                | prompt_expert_identity
+                | ChatOpenAI(cache=True, model_kwargs={"seed": 1})
+                | StrOutputParser()
+            ),
+            question={"compose": itemgetter("compose")}
+            | prompt_zeroshot
+            | (lambda p: p.to_string()),
+        )
+        .pick(["expert_identity", "question"])
+        | prompt_expertprompting
+        | ChatOpenAIMultiGenerations(
+            cache=True, model_kwargs={"seed": 1}
+        ).configurable_fields(
+            model_name=ConfigurableField(id="model_name"),
+            n=ConfigurableField(id="n", name="llm_n"),
+        )
+        | (MDCodeBlockOutputParser() | to_doc).map()
     )
-    | (MDCodeBlockOutputParser() | to_doc).map()
-)
 
 
 def _join_manifests(xs: list[dict | str]) -> str:
@@ -226,50 +237,72 @@ def _join_manifests(xs: list[dict | str]) -> str:
         raise ValueError(f"argument must be list[dit|str]: {xs}")
 
 
-chain_expert_prompting_json: RunnableSerializable[Document, List[Document]] = (
-    RunnableParallel(
-        compose=RunnableLambda(lambda doc: cast(Document, doc).page_content),
-    )
-    .assign(
-        expert_identity=(
-            {"question": lambda _: "convert the composefile to kubernetes manifests"}
-            | prompt_expert_identity
-            | ChatOpenAI(cache=True, model_kwargs={"seed": 1})
-            | StrOutputParser()
-        ),
-        question={"compose": itemgetter("compose")}
-        | prompt_zeroshot
-        | (lambda p: p.to_string()),
-    )
-    .pick(["expert_identity", "question"])
-    | prompt_expertprompting
-    | ChatOpenAIMultiGenerations(
-        cache=True,
-        model_kwargs={
-            "seed": 1,
-            "functions": [convert_to_openai_function(Manifests)],
-            "function_call": {"name": "Manifests"},
-        },
-    ).configurable_fields(
-        model_name=ConfigurableField(id="model_name"),
-        n=ConfigurableField(id="n", name="llm_n"),
+@lru_cache
+def _chain_expert_prompting_json() -> RunnableSerializable[Document, List[Document]]:
+    return (
+        RunnableParallel(
+            compose=RunnableLambda(lambda doc: cast(Document, doc).page_content),
+        )
+        .assign(
+            expert_identity=(
+                {"question": lambda _: "convert the composefile to kubernetes manifests"}
+                | prompt_expert_identity
+                | ChatOpenAI(cache=True, model_kwargs={"seed": 1})
+                | StrOutputParser()
+            ),
+            question={"compose": itemgetter("compose")}
+            | prompt_zeroshot
+            | (lambda p: p.to_string()),
+        )
+        .pick(["expert_identity", "question"])
+        | prompt_expertprompting
+        | ChatOpenAIMultiGenerations(
+            cache=True,
+            model_kwargs={
+                "seed": 1,
+                "functions": [convert_to_openai_function(Manifests)],
+                "function_call": {"name": "Manifests"},
+            },
+        ).configurable_fields(
+            model_name=ConfigurableField(id="model_name"),
+            n=ConfigurableField(id="n", name="llm_n"),
+        )
+        | (
+            (
+                get_openai_output_parser([Manifests])
+                | (lambda m: m.manifests)
+                | _join_manifests
+            ).with_fallbacks([RunnableLambda(lambda _: "parse failed")])
+            | to_doc
+        ).map()
     )
-    | (
-        (
-            get_openai_output_parser([Manifests])
-            | (lambda m: m.manifests)
-            | _join_manifests
-        ).with_fallbacks([RunnableLambda(lambda _: "parse failed")])
-        | to_doc
-    ).map()
-)
+
 
 #
 # input is a Document, output is a List[Document]
-CONVERT_METHODS = dict(
-    annotate_kompose=chain_annotate_kompose,
-    canonical_annotate_kompose=chain_canonical_annotate_kompose,
-    zeroshottext=chain_zeroshottext,
-    expertprompting_text=chain_expert_prompting,
-    expertprompting_json=chain_expert_prompting_json,
+@lru_cache
+def _convert_methods() -> dict[str, Runnable]:
+    return dict(
+        annotate_kompose=_chain_annotate_kompose(),
+        canonical_annotate_kompose=_chain_canonical_annotate_kompose(),
+        zeroshottext=_chain_zeroshottext(),
+        expertprompting_text=_chain_expert_prompting(),
+        expertprompting_json=_chain_expert_prompting_json(),
+    )
+
+
+_LAZY = dict(
+    chain_annotate=_chain_annotate,
+    chain_annotate_kompose=_chain_annotate_kompose,
+    chain_canonical_annotate_kompose=_chain_canonical_annotate_kompose,
+    chain_zeroshottext=_chain_zeroshottext,
+    chain_expert_prompting=_chain_expert_prompting,
+    chain_expert_prompting_json=_chain_expert_prompting_json,
+    CONVERT_METHODS=_convert_methods,
 )
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        return _LAZY[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -6,10 +6,10 @@ from langchain_core.pydantic_v1 import BaseModel
 from langchain_core.runnables import RunnableConfig
 from langchain_openai.chat_models import ChatOpenAI
 
+from compose2kube.benchmark import methods
 from compose2kube.benchmark.methods import (
     Document,
     canonicalize,
-    chain_zeroshottext,
     kompose,
 )
 
@@ -50,6 +50,11 @@ class TestMethods(unittest.TestCase):
 
         set_llm_cache(SQLiteCache(":memory:"))
 
+    def setUp(self) -> None:
+        patcher = patch.dict("os.environ", {"OPENAI_API_KEY": "dummy"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_canonicalize(self):
         got = canonicalize.invoke(Document(page_content=compose1))
         self.assertEqual(got.metadata.get("stderr"), "")
@@ -93,7 +98,7 @@ class TestMethods(unittest.TestCase):
         mock_create.return_value = mocked_response
 
         n = 2
-        got = chain_zeroshottext.invoke(
+        got = methods.chain_zeroshottext.invoke(
             Document(page_content=compose1), config=RunnableConfig(n=n, cache=True)
         )
         self.assertEqual(len(got), n)
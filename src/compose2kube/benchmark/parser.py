@@ -1,9 +1,318 @@
+import json
+import re
 import warnings
+from dataclasses import dataclass
+from typing import Any
 
-import marko
-import marko.inline
 from langchain_core.output_parsers import StrOutputParser
 
+# CommonMark fences: up to 3 spaces of indent, 3+ backticks or tildes, and an
+# info string, which can't contain a backtick after a backtick fence
+_OPENING = re.compile(r"^( {0,3})(`{3,}(?=[^`]*$)|~{3,})(.*)$")
+_CLOSING = re.compile(r"^ {0,3}(`{3,}|~{3,})[ \t]*$")
+# the other blocks that matter to find the fences at the top level, as marko parses them
+_QUOTE = re.compile(r"^ {0,3}>[ \t]?")
+_LIST_ITEM = re.compile(r"^( {0,3})(\d{1,9}[.)]|[*+-])(?:([ \t]+)(.*))?$")
+_HEADING = re.compile(r"^ {0,3}#{1,6}(?:[ \t]|$)")
+_THEMATIC_BREAK = re.compile(r"^ {0,3}([-_*])(?:[ \t]*\1){2,}[ \t]*$")
+# under a paragraph, which makes it a heading
+_SETEXT_UNDERLINE = re.compile(r"^ {0,3}(?:=+|-+)[ \t]*$")
+_BLANK = re.compile(r"^[ \t]*$")
+_BLOCK_TAGS = """address article aside base basefont blockquote body caption center col colgroup
+dd details dialog dir div dl dt fieldset figcaption figure footer form frame frameset h1 h2 h3 h4
+h5 h6 head header hr html iframe legend li link main menu menuitem meta nav noframes ol optgroup
+option p param section source summary table tbody td tfoot th thead title tr track ul""".split()
+_ATTRIBUTE = r"""[ \t]+[A-Za-z:_][\w.:-]*(?:[ \t]*=[ \t]*(?:[^\s"'`=<>]+|'[^']*'|"[^"]*"))?"""
+# (start, end) of the HTML blocks of types 1 to 7, a blank line ending types 6 and 7
+_HTML_BLOCKS = [
+    # ended by the closing tag of the same name
+    (r"<(?i:(script|pre|style|textarea))(?:[>\s]|$)", r"</(?i:{})>"),
+    (r"<!--", r"-->"),
+    (r"<\?", r"\?>"),
+    (r"<!", r">"),
+    (r"<!\[CDATA\[", r"\]\]>"),
+    (rf"</?(?i:{'|'.join(_BLOCK_TAGS)})(?: +|/?>|$)", None),
+    (rf"(?:<[A-Za-z][\w-]*(?:{_ATTRIBUTE})*[ \t]*/?>|</[A-Za-z][\w-]*[ \t]*>)[ \t]*$", None),
+]
+_HTML_STARTS = [
+    (re.compile(r"^ {0,3}" + start), re.compile(end) if end else _BLANK)
+    for start, end in _HTML_BLOCKS
+]
+
+
+def _html_block(line: str) -> tuple[int, re.Pattern] | None:
+    """(type, the end) of the HTML block the line starts"""
+
+    for i, (start, end) in enumerate(_HTML_STARTS):
+        if m := start.match(line):
+            return i + 1, re.compile(end.pattern.format(m.group(1))) if i == 0 else end
+    return None
+
+
+def _closes(line: str, fence: str) -> bool:
+    """whether the line closes the block opened by fence"""
+
+    m = _CLOSING.match(line)
+    return m is not None and m.group(1)[0] == fence[0] and len(m.group(1)) >= len(fence)
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip(" "))
+
+
+def _breaks_paragraph(line: str, lazy: bool) -> bool:
+    """whether the line starts a block instead of continuing a paragraph
+
+    lazy: the paragraph is in a list item or quote the line doesn't continue
+    """
+
+    if _BLANK.match(line) or _OPENING.match(line) or _QUOTE.match(line) or _HEADING.match(line):
+        return True
+    if _THEMATIC_BREAK.match(line):
+        return True
+    if m := _LIST_ITEM.match(line):
+        # an ordered list interrupts a paragraph only from 1, and no list empty
+        return lazy or bool(m.group(4) and m.group(4).strip() and m.group(2)[:-1] in ("", "1"))
+    html = _html_block(line)
+    return html is not None and html[0] != 7
+
+
+@dataclass
+class _Container:
+    """a list item, quote or HTML block, whose fences are not at the top level"""
+
+    # what the lines in it start with, or what ends an HTML block
+    prefix: re.Pattern | None = None
+    html_end: re.Pattern | None = None
+    # the fence open in it
+    fence: str | None = None
+    paragraph: bool = False
+    # a list item with nothing on the line of its marker
+    empty: bool = False
+
+
+class FenceScanner:
+    """the contents of the fenced code blocks of markdown, in one pass
+
+    Only the fences at the top level of the document are found, as
+    MDCodeBlockOutputParser did with marko: those in list items, quotes and
+    HTML blocks are skipped. Text can be fed in chunks, e.g. as it is streamed.
+    feed() returns the blocks closed by the chunk, and close() the block left
+    open by the end of the text, which CommonMark ends there. The YAML documents
+    of the blocks are collected in `documents` as soon as a `---` line or the
+    end of the block closes them.
+    """
+
+    def __init__(self) -> None:
+        self._rest = ""
+        # (fence, indent) of the open block
+        self._open: tuple[str, int] | None = None
+        self._container: _Container | None = None
+        # whether the last block at the top level is a paragraph
+        self._paragraph = False
+        self._lines: list[str] = []
+        # the first line of the open document in _lines
+        self._document = 0
+        self.blocks: list[str] = []
+        self.documents: list[str] = []
+
+    def feed(self, chunk: str) -> list[str]:
+        *lines, self._rest = (self._rest + chunk).split("\n")
+        found = len(self.blocks)
+        for line in lines:
+            self._line(line.removesuffix("\r"))
+        return self.blocks[found:]
+
+    def close(self) -> list[str]:
+        found = len(self.blocks)
+        if self._rest:
+            # the last line has no newline to keep
+            self._line(self._rest.removesuffix("\r"), end="")
+            self._rest = ""
+        if self._open is not None:
+            self._end()
+        return self.blocks[found:]
+
+    def _line(self, line: str, end: str = "\n") -> None:
+        if self._open is None:
+            # tabs indent to the next multiple of 4, as marko takes them
+            line = line.expandtabs(4)
+            if self._container is None or not self._continues(line):
+                self._top_level(line)
+            return
+        fence, indent = self._open
+        if _closes(line, fence):
+            self._end()
+            return
+        # the indent of the opening fence is removed from the contents, all of a shorter one
+        content = line[indent:] if line.startswith(" " * indent) else line.lstrip()
+        if content.rstrip() == "---":
+            self._end_document()
+            self._document = len(self._lines) + 1
+        self._lines.append(content + end)
+
+    def _top_level(self, line: str) -> None:
+        paragraph, self._paragraph = self._paragraph, False
+        if _BLANK.match(line):
+            return
+        if m := _OPENING.match(line):
+            self._open = (m.group(2), len(m.group(1)))
+            return
+        if (html := _html_block(line)) and (html[0] != 7 or not paragraph):
+            # the end can be on the line that starts the block
+            if not html[1].search(line[_indent(line) + 1 :]) or html[0] > 5:
+                self._container = _Container(html_end=html[1])
+            return
+        if _indent(line) >= 4 and not paragraph:
+            # indented code
+            return
+        if m := _QUOTE.match(line):
+            self._container = _Container(prefix=_QUOTE)
+            self._inside(line[m.end() :])
+            return
+        if _THEMATIC_BREAK.match(line) or _HEADING.match(line):
+            return
+        if paragraph and _SETEXT_UNDERLINE.match(line):
+            return
+        if (m := _LIST_ITEM.match(line)) and (not paragraph or _breaks_paragraph(line, False)):
+            indent, marker, spacing, content = m.groups()
+            spaces = len(spacing or "")
+            # the contents of an empty item, or of one starting with indented code,
+            # are a space after the marker
+            width = spaces if 0 < spaces <= 4 and content else 1
+            column = len(indent) + len(marker) + width
+            empty = not (content or "").strip()
+            self._container = _Container(prefix=re.compile(f"^ {{{column}}}"), empty=empty)
+            self._inside(line[column:] if content else "")
+            return
+        self._paragraph = True
+
+    def _continues(self, line: str) -> bool:
+        """whether the line is in the open container"""
+
+        container = self._container
+        assert container is not None
+        if container.html_end is not None:
+            if container.html_end.search(line):
+                self._container = None
+            return True
+        assert container.prefix is not None
+        blank = bool(_BLANK.match(line))
+        if container.prefix is not _QUOTE and blank:
+            # a list item goes on after a blank line, unless it started empty
+            if container.empty:
+                self._container = None
+                return False
+            container.paragraph = False
+            return True
+        if (m := container.prefix.match(line)) and not (blank and container.prefix is _QUOTE):
+            self._inside(line[m.end() :])
+            return True
+        if container.fence is None and container.paragraph and not _breaks_paragraph(line, True):
+            # a lazy continuation of the paragraph in the container
+            return True
+        self._container = None
+        return False
+
+    def _inside(self, content: str) -> None:
+        """a line in the open list item or quote, without its prefix"""
+
+        container = self._container
+        assert container is not None
+        if container.fence is not None:
+            if _closes(content, container.fence):
+                container.fence = None
+            return
+        paragraph, container.paragraph = container.paragraph, False
+        if _BLANK.match(content):
+            return
+        container.empty = False
+        # the first line of the lists and quotes in it
+        while m := _QUOTE.match(content) or _LIST_ITEM.match(content):
+            if _THEMATIC_BREAK.match(content) or m.re is _LIST_ITEM and not m.group(4):
+                break
+            content = content[m.start(4) if m.re is _LIST_ITEM else m.end() :]
+        if _BLANK.match(content):
+            return
+        if m := _OPENING.match(content):
+            container.fence = m.group(2)
+        elif _indent(content) < 4 or paragraph:
+            container.paragraph = not (
+                _HEADING.match(content)
+                or _THEMATIC_BREAK.match(content)
+                or _html_block(content)
+                or paragraph and _SETEXT_UNDERLINE.match(content)
+            )
+
+    def _end_document(self) -> None:
+        document = "".join(self._lines[self._document :]).strip()
+        if document:
+            self.documents.append(document)
+
+    def _end(self) -> None:
+        self._end_document()
+        self.blocks.append("".join(self._lines))
+        self._open = None
+        self._lines = []
+        self._document = 0
+
+
+class JSONArrayScanner:
+    """the items of the array at `key` of streamed JSON, each as soon as it is closed
+
+    e.g. the manifests in the arguments of a streamed Manifests function call.
+    """
+
+    def __init__(self, key: str) -> None:
+        self._opening = re.compile(rf'"{re.escape(key)}"\s*:\s*\[')
+        self._text = ""
+        # where the scan of the array is, None before the array
+        self._pos: int | None = None
+        self._item = 0
+        self._depth = 0
+        self._string = self._escape = self._closed = False
+        self.items: list[Any] = []
+
+    def feed(self, chunk: str) -> list[Any]:
+        found = len(self.items)
+        self._text += chunk
+        if self._pos is None:
+            m = self._opening.search(self._text)
+            if m is None:
+                return []
+            self._pos = self._item = m.end()
+        text, i = self._text, self._pos
+        while i < len(text) and not self._closed:
+            c = text[i]
+            if self._string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._string = False
+            elif c == '"':
+                self._string = True
+            elif c in "[{":
+                self._depth += 1
+            elif c in "]}" and self._depth:
+                self._depth -= 1
+            elif c in ",]" and not self._depth:
+                if item := text[self._item : i].strip():
+                    self.items.append(json.loads(item))
+                self._item = i + 1
+                self._closed = c == "]"
+            i += 1
+        self._pos = i
+        return self.items[found:]
+
+
+def fenced_blocks(text: str) -> list[str]:
+    scanner = FenceScanner()
+    scanner.feed(text)
+    scanner.close()
+    return scanner.blocks
+
 
 class MDCodeBlockOutputParser(StrOutputParser):
     def parse(self, text: str) -> str:
@@ -14,21 +323,11 @@ class MDCodeBlockOutputParser(StrOutputParser):
                 # skip the line contains ```
                 return "\n".join(line for line in text.split("\n") if "```" not in line)
             case 2:
-                doc = marko.parse(text)
-                for element in doc.children:
-                    if isinstance(element, marko.block.FencedCode):
-                        assert isinstance(element.children[0], marko.inline.RawText)
-                        return element.children[0].children
+                for block in fenced_blocks(text):
+                    return block
                 raise Exception("fenced code not found")
             case x if x % 2 == 0:
-                doc = marko.parse(text)
-                codes = []
-                for element in doc.children:
-                    if isinstance(element, marko.block.FencedCode):
-                        blockchild = element.children[0]
-                        assert isinstance(blockchild, marko.inline.RawText)
-                        codes.append(blockchild.children.strip())
-                return "\n---\n".join(codes)
+                return "\n---\n".join(block.strip() for block in fenced_blocks(text))
             case x if x % 2 == 1:
                 warnings.warn("the text contains odd number of ```:" + text)
                 return ""
@@ -0,0 +1,157 @@
+"""Grade the samples stored in a result log again, without generating them again.
+
+After a change to a judge (grader/rule.py), the grader prompts (grader/llm.py),
+the dry-run grader or the kubectl and cluster versions it runs with, only the
+graders whose version (see grader.version) differs from the one a record was
+graded with are run again, on the samples of the record. No conversion is run, so it costs no conversion tokens, and the LLM
+grader is asked again only when its prompts or model changed. The samples of
+adaptive runs stay the ones drawn while grading with the old graders.
+
+    python -m compose2kube.benchmark.regrade /tmp/benchmark.jsonl /tmp/regraded.jsonl
+"""
+
+import argparse
+import asyncio
+from collections import Counter
+from functools import lru_cache
+from logging import getLogger
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Iterable, Sequence
+
+from langchain_core.runnables import RunnableConfig
+
+from compose2kube import workkey
+from compose2kube.benchmark.grader import chains_grade_by
+from compose2kube.benchmark.grader.rule import INPUTS_JUDGES
+from compose2kube.benchmark.grader.version import grader_versions, outdated
+from compose2kube.concurrency import astream_bounded
+from compose2kube.runlog import ResultLog
+
+logger = getLogger(__name__)
+
+CONCURRENCY = 8
+
+
+@lru_cache
+def _judges() -> tuple[dict[str, Callable[[str], Any]], dict[str, Callable[[str], Any]]]:
+    """the judges of the inputs by name, and by the content hash of the compose file
+    of the inputs whose compose file no other input has"""
+
+    hashes = [workkey.content_hash(compose) for _, compose, _ in INPUTS_JUDGES]
+    by_name = {name: judge for name, _, judge in INPUTS_JUDGES}
+    by_hash = {
+        h: judge for h, (_, _, judge) in zip(hashes, INPUTS_JUDGES) if hashes.count(h) == 1
+    }
+    return by_name, by_hash
+
+
+def _judge(record: dict) -> Callable[[str], Any] | None:
+    """the judge of the input of a record, by its name
+
+    input4 and input9 have the same compose file but not the same judge, so the
+    records from before the name was recorded are judged by their compose file
+    only when it is of one input.
+    """
+
+    by_name, by_hash = _judges()
+    if name := record.get("input"):
+        return by_name.get(name)
+    return by_hash.get(workkey.content_hash(record["compose"]))
+
+
+def to_regrade(
+    record: dict, config: RunnableConfig | None = None, force: Sequence[str] = ()
+) -> tuple[Callable[[str], Any] | None, dict[str, str], list[str]]:
+    """(judge, current versions, graders to run again) of a record of astream_convert_grade
+
+    the graders in force are run again even if up to date. without a judge for
+    its input, the judge of a record is left as it is.
+    """
+
+    judge = _judge(record)
+    if judge is None:
+        logger.warning(f"no judge for the input of {record.get('key')}, grade_by_function is kept")
+    versions = grader_versions(judge, config)
+    names = outdated(record, versions)
+    names += [name for name in force if name in versions and name not in names]
+    return judge, versions, names
+
+
+async def aregrade(
+    records: Iterable[dict],
+    max_concurrency: int = CONCURRENCY,
+    config: RunnableConfig | None = None,
+    force: Sequence[str] = (),
+) -> AsyncIterator[tuple[dict, list[str]]]:
+    """(record, the graders run again) for each record, in the order they finish
+
+    the outputs of the graders that were run replace those in the record, and
+    their versions the ones in its "grader_versions".
+    """
+
+    async def run(record: dict) -> list[str]:
+        judge, versions, names = to_regrade(record, config, force)
+        if not names:
+            return names
+        x = dict(compose=record["compose"], judge=judge, output_parsed=record["output_parsed"])
+        graded = await chains_grade_by(names).ainvoke(x, config=config)
+        record.update({name: graded[name] for name in names})
+        record["grader_versions"] = {
+            **(record.get("grader_versions") or {}),
+            **{name: versions[name] for name in names},
+        }
+        return names
+
+    async for record, names in astream_bounded(run, records, max_concurrency):
+        yield record, names
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="compose2kube.benchmark.regrade", description=__doc__)
+    parser.formatter_class = argparse.RawDescriptionHelpFormatter
+    parser.add_argument("log", help="a result log of astream_convert_grade")
+    parser.add_argument("output", help="the result log to write the records to")
+    parser.add_argument("--grader-model", default=None)
+    parser.add_argument("--grader-batch-size", type=int, default=None)
+    parser.add_argument(
+        "--force", action="append", default=[], metavar="GRADER", help="e.g. grade_by_dryrun"
+    )
+    parser.add_argument("--concurrency", "-c", type=int, default=CONCURRENCY)
+    parser.add_argument("--check", action="store_true", help="only count the graders to run")
+    args = parser.parse_args(argv)
+    if Path(args.log).resolve() == Path(args.output).resolve():
+        parser.error("the output must not be the log being read")
+
+    configurable: dict[str, Any] = {}
+    if args.grader_model:
+        configurable["grader_model_name"] = args.grader_model
+    if args.grader_batch_size:
+        configurable["grader_batch_size"] = args.grader_batch_size
+    config = RunnableConfig(configurable=configurable)
+    counts: Counter[str] = Counter()
+
+    if args.check:
+        for record in ResultLog(args.log):
+            counts.update(to_regrade(record, config, args.force)[2])
+        print(f"to grade again: {dict(counts)}")
+        return
+
+    from compose2kube import cache, load_env
+
+    load_env()
+    cache.install_llm_cache()
+    output = ResultLog(args.output)
+    output.truncate()
+
+    async def run():
+        regraded = aregrade(ResultLog(args.log), args.concurrency, config, args.force)
+        async for record, names in regraded:
+            counts.update(names)
+            output.append(record)
+
+    asyncio.run(run())
+    print(f"graded again: {dict(counts)}, wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import asyncio
+import unittest
+
+from langchain_core.runnables import RunnableLambda
+
+from compose2kube.benchmark.adaptive import Adaptive, asample, merge, passes, wilson_interval
+from compose2kube.benchmark.grader.judgement import Judgement
+
+
+def _method(rate: float, seen: list[dict]):
+    """a fake method of chains_convert_grade: the first rate of the samples pass"""
+
+    def run(x: dict, config) -> dict:
+        configurable = config["configurable"]
+        seen.append(dict(n=configurable["n"], sample=configurable["sample"]))
+        oks = [i < rate * configurable["n"] for i in range(configurable["n"])]
+        return dict(
+            compose=x["compose"],
+            output_parsed=["kind: Pod"] * len(oks),
+            grade_by_function=[Judgement(ok=ok, metadata={}) for ok in oks],
+            grade_by_model=dict(model_graded=[dict(decision="Y") for _ in oks]),
+        )
+
+    return RunnableLambda(run)
+
+
+class TestAdaptive(unittest.TestCase):
+    def test_wilson_interval(self):
+        low, high = wilson_interval(10, 10)
+        self.assertAlmostEqual(low, 0.722, places=3)
+        self.assertEqual(high, 1.0)
+        low, high = wilson_interval(10, 20)
+        self.assertAlmostEqual(low + high, 1.0)
+        self.assertGreater(high - low, 0.4)
+        self.assertEqual(wilson_interval(0, 0), (0.0, 1.0))
+
+    def test_passes_merge(self):
+        a = dict(compose="c", grade_by_function=[Judgement(True, {})], grade_by_model={})
+        b = dict(
+            compose="c",
+            grade_by_function=[Judgement(False, {})],
+            grade_by_model=dict(model_graded=[dict(decision="N")]),
+        )
+        merged = merge(a, b)
+        self.assertEqual(merged["compose"], "c")
+        self.assertEqual(passes(merged), {"function": [True, False], "model": [False]})
+
+    def test_stop_early(self):
+        seen: list[dict] = []
+        adaptive = Adaptive(round_n=5, max_n=20, width=0.3)
+        graded = asyncio.run(asample(_method(1.0, seen), {"compose": "c"}, None, adaptive))
+        self.assertEqual(graded["n_used"], 10)
+        self.assertEqual(graded["rounds"], 2)
+        self.assertEqual(len(graded["grade_by_function"]), 10)
+        self.assertEqual(seen, [dict(n=5, sample=0), dict(n=5, sample=1)])
+
+    def test_max_n(self):
+        seen: list[dict] = []
+        adaptive = Adaptive(round_n=6, max_n=20, width=0.3)
+        config = {"configurable": {"sample": 10}}
+        graded = asyncio.run(asample(_method(0.5, seen), {"compose": "c"}, config, adaptive))
+        self.assertEqual(graded["n_used"], 20)
+        self.assertEqual([s["n"] for s in seen], [6, 6, 6, 2])
+        self.assertEqual([s["sample"] for s in seen], [10, 11, 12, 13])
+        self.assertEqual(len(passes(graded)["function"]), 20)
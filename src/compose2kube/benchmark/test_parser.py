@@ -1,11 +1,17 @@
 import glob
+import json
 import os
 from pathlib import Path
 import unittest
 
 import yaml
 
-from compose2kube.benchmark.parser import MDCodeBlockOutputParser
+from compose2kube.benchmark.parser import (
+    FenceScanner,
+    JSONArrayScanner,
+    MDCodeBlockOutputParser,
+    fenced_blocks,
+)
 
 parser = MDCodeBlockOutputParser()
 
@@ -108,3 +114,56 @@ a: 1
 
         self.assertEqual(count, 100)
         self.assertLessEqual(yaml_parse_failed, 2)
+
+
+class TestFenceScanner(unittest.TestCase):
+    def test_fences(self):
+        cases = [
+            # (input, want)
+            ("```yaml\na: 1\n```\n", ["a: 1\n"]),
+            ("  ```\n  a: 1\n    b: 2\n```", ["a: 1\n  b: 2\n"]),
+            ("~~~\n```\n~~~", ["```\n"]),
+            ("````\na\n```\n`````\n", ["a\n```\n"]),
+            ("```\r\na\r\n```\r\n", ["a\n"]),
+            ("    ```\na\n    ```", []),
+            ("inline ```code```", []),
+            ("```\nunclosed", ["unclosed"]),
+            # only at the top level, as marko found them
+            ("1. Part:\n\n   ```yaml\n   a: 1\n   ```", []),
+            ("1. Part:\n```yaml\na: 1\n```", ["a: 1\n"]),
+            ("- ```\na: 1\n```\nb: 2\n```", ["b: 2\n"]),
+            ("> ```\n> a: 1\n> ```", []),
+            ("<details>\n```yaml\na: 1\n```\n</details>", []),
+            ("<details>\n\n```yaml\na: 1\n```\n</details>", ["a: 1\n"]),
+            ("text\n2. item\n   ```\n   a: 1\n   ```", ["a: 1\n"]),
+        ]
+        for i, (input, want) in enumerate(cases):
+            with self.subTest(i=i):
+                self.assertEqual(fenced_blocks(input), want)
+
+    def test_feed(self):
+        text = "first:\n```yaml\na: 1\n```\nsecond:\n```\nb: 2\n"
+        scanner = FenceScanner()
+        closed = [scanner.feed(text[i : i + 3]) for i in range(0, len(text), 3)]
+        self.assertEqual([blocks for blocks in closed if blocks], [["a: 1\n"]])
+        self.assertEqual(scanner.close(), ["b: 2\n"])
+        self.assertEqual(scanner.blocks, fenced_blocks(text))
+
+    def test_documents(self):
+        scanner = FenceScanner()
+        scanner.feed("```yaml\na: 1\n---\n")
+        self.assertEqual(scanner.documents, ["a: 1"])
+        scanner.feed("b: 2\n  ---\n---\n```\n~~~\nc: 3")
+        self.assertEqual(scanner.documents, ["a: 1", "b: 2\n  ---"])
+        scanner.close()
+        self.assertEqual(scanner.documents, ["a: 1", "b: 2\n  ---", "c: 3"])
+
+
+class TestJSONArrayScanner(unittest.TestCase):
+    def test_feed(self):
+        items = ['a: "1"\n---\nb: [2]', {"x": [1, {"y": "]"}]}, "c"]
+        text = json.dumps({"manifests": items, "other": [4]})
+        scanner = JSONArrayScanner("manifests")
+        got = [scanner.feed(text[i : i + 3]) for i in range(0, len(text), 3)]
+        self.assertEqual([item for found in got for item in found], items)
+        self.assertEqual(scanner.items, items)
@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+
+from compose2kube.benchmark.grader.judgement import Judgement
+from compose2kube.benchmark.grader.rule import INPUTS_JUDGES
+from compose2kube.benchmark.grader.version import grader_versions
+from compose2kube.benchmark.regrade import aregrade, to_regrade
+
+# input3: the controller of db must be a StatefulSet
+NAME, COMPOSE, JUDGE = INPUTS_JUDGES[0]
+SAMPLES = [
+    "kind: StatefulSet\nmetadata:\n  name: db",
+    "kind: Deployment\nmetadata:\n  name: db",
+]
+
+
+def _record(**versions: str) -> dict:
+    return dict(
+        key="k",
+        input=NAME,
+        compose=COMPOSE,
+        output_parsed=SAMPLES,
+        # graded by an older judge
+        grade_by_function=[Judgement(ok=False, metadata={}) for _ in SAMPLES],
+        grade_by_model=dict(model_graded=[dict(decision="Y") for _ in SAMPLES]),
+        grade_by_dryrun=[Judgement(ok=True, metadata={}) for _ in SAMPLES],
+        grader_versions=dict(grader_versions(JUDGE), **versions),
+    )
+
+
+def _regrade(records: list[dict], **kwargs) -> list[tuple[dict, list[str]]]:
+    async def run():
+        return [got async for got in aregrade(records, **kwargs)]
+
+    return asyncio.run(run())
+
+
+class TestRegrade(unittest.TestCase):
+    def test_up_to_date(self):
+        record = _record()
+        self.assertEqual(to_regrade(record)[2], [])
+        ((got, names),) = _regrade([record])
+        self.assertEqual(names, [])
+        self.assertEqual([j.ok for j in got["grade_by_function"]], [False, False])
+
+    def test_outdated_judge(self):
+        record = _record(grade_by_function="old")
+        ((got, names),) = _regrade([record])
+        # only the judge is run again
+        self.assertEqual(names, ["grade_by_function"])
+        self.assertEqual([j.ok for j in got["grade_by_function"]], [True, False])
+        self.assertEqual(got["grade_by_model"], _record()["grade_by_model"])
+        self.assertEqual(got["grader_versions"], grader_versions(JUDGE))
+
+    def test_force(self):
+        record = _record()
+        self.assertEqual(to_regrade(record, force=["grade_by_function"])[2], ["grade_by_function"])
+        self.assertEqual(to_regrade(record, force=["nosuchgrader"])[2], [])
+
+    def test_same_compose(self):
+        names = [name for name, _, _ in INPUTS_JUDGES]
+        _, compose, judge9 = INPUTS_JUDGES[names.index("input9")]
+        record = dict(_record(), input="input9", compose=compose)
+        self.assertIs(to_regrade(record)[0], judge9)
+        # without a name, the compose file of input4 and input9 has no judge
+        del record["input"]
+        self.assertIsNone(to_regrade(record)[0])
+
+    def test_unknown_input(self):
+        record = dict(_record(), input="nosuchinput", grader_versions={})
+        judge, versions, names = to_regrade(record)
+        self.assertIsNone(judge)
+        self.assertNotIn("grade_by_function", names)
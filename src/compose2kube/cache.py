@@ -0,0 +1,288 @@
+"""On-disk caches shared by threads, processes and runs.
+
+`SQLiteStore` is a key-value table with size/age based eviction. The dry-run
+cache keys results by the canonicalized YAML, so generations that differ only
+in whitespace, key order or comments are not dry-run again. The LLM cache keeps
+all the generations of a chat request, so rerunning a benchmark costs no tokens.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from functools import lru_cache
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Sequence
+
+from langchain.globals import get_llm_cache, set_llm_cache
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+from compose2kube.manifest import ParsedManifest
+
+logger = getLogger(__name__)
+
+CACHE_DIR = Path(os.environ.get("C2K_CACHE_DIR", "/tmp/c2kcache"))
+
+
+class SQLiteStore:
+    """key-value store on sqlite, shareable between threads and processes
+
+    max_entries, max_bytes: least recently used entries are evicted beyond these
+    max_age: entries older than this (seconds) are evicted
+    """
+
+    EVICT_EVERY = 100
+
+    def __init__(
+        self,
+        path: str | Path,
+        table: str = "kv",
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+        max_age: float | None = None,
+    ):
+        self.path = Path(path)
+        self.table = table
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, created REAL, accessed REAL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_created ON {table} (created)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> bytes | None:
+        conn = self._conn()
+        row = conn.execute(
+            f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or (self.max_age is not None and row[1] < now - self.max_age):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self.hits += 1
+        return row[0]
+
+    def set(self, key: str, value: bytes) -> None:
+        now = time.time()
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, size, created, accessed) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(value), now, now),
+        )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """drop expired entries, then the least recently used ones over the limits"""
+
+        conn = self._conn()
+        deleted = 0
+        if self.max_age is not None:
+            deleted += conn.execute(
+                f"DELETE FROM {self.table} WHERE created < ?", (time.time() - self.max_age,)
+            ).rowcount
+        if self.max_entries is not None:
+            deleted += conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        if self.max_bytes is not None:
+            deleted += conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM ("
+                f"SELECT key, SUM(size) OVER (ORDER BY accessed DESC) AS total FROM {self.table}"
+                ") WHERE total > ?)",
+                (self.max_bytes,),
+            ).rowcount
+        if deleted:
+            logger.debug(f"evicted {deleted} entries from {self.path}:{self.table}")
+        return deleted
+
+    def clear(self) -> None:
+        self._conn().execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> dict[str, int]:
+        entries, size = self._conn().execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+        ).fetchone()
+        return dict(hits=self.hits, misses=self.misses, entries=entries, bytes=size)
+
+
+def canonical_yaml(spec: str) -> str:
+    """normalize whitespace, key order and comments of a multi-document YAML
+
+    The text is kept (with trailing spaces stripped) when it can't be parsed or
+    has duplicated keys, which kubectl does not silently drop, so that such
+    specs only share a key with the same text. So is the text of a mapping with
+    keys that can't be sorted together, e.g. ints and strings.
+    """
+
+    text = "\n".join(line.rstrip() for line in spec.strip().splitlines())
+    parsed = ParsedManifest.of(spec)
+    if parsed.error is not None or parsed.has_duplicated_keys:
+        return text
+    docs = [doc for doc in parsed.documents if doc is not None]
+    try:
+        return json.dumps(docs, sort_keys=True, separators=(",", ":"), default=str)
+    except TypeError:
+        return text
+
+
+class DryRunCache:
+    """dry-run results keyed by (canonical YAML, cluster version, dry-run mode)"""
+
+    def __init__(self, store: SQLiteStore):
+        self.store = store
+
+    @staticmethod
+    def key(spec: str, version: str, mode: str) -> str:
+        h = hashlib.sha256(f"{mode}\0{version}\0".encode())
+        h.update(canonical_yaml(spec).encode())
+        return h.hexdigest()
+
+    def get(self, spec: str, version: str, mode: str) -> dict | None:
+        value = self.store.get(self.key(spec, version, mode))
+        return None if value is None else json.loads(zlib.decompress(value))
+
+    def set(self, spec: str, version: str, mode: str, result: dict) -> None:
+        value = zlib.compress(json.dumps(result).encode())
+        self.store.set(self.key(spec, version, mode), value)
+
+    def stats(self) -> dict[str, int]:
+        return self.store.stats()
+
+
+@lru_cache
+def dry_run_cache() -> DryRunCache:
+    """the process-wide dry-run cache in CACHE_DIR"""
+
+    return DryRunCache(
+        SQLiteStore(
+            CACHE_DIR / "dryrun.sqlite",
+            table="dryrun",
+            max_entries=int(os.environ.get("C2K_DRYRUN_CACHE_ENTRIES", 1_000_000)),
+            max_age=float(os.environ.get("C2K_DRYRUN_CACHE_AGE", 30 * 24 * 3600)),
+        )
+    )
+
+
+class LLMCache(BaseCache):
+    """langchain's LLM cache on a SQLiteStore
+
+    An entry holds all the generations of a request (n of them for n > 1), with
+    their generation_info, compressed. It is keyed by the prompt messages and
+    the request parameters of the model: model, n, temperature, seed, functions
+    and the like. Settings that don't change the answer (cache, verbose,
+    retries, timeouts, the API key) and the model class are left out, so the
+    chat models of the chains share their entries.
+    """
+
+    IGNORED = frozenset(
+        {
+            "cache",
+            "verbose",
+            "callbacks",
+            "callback_manager",
+            "tags",
+            "metadata",
+            "openai_api_key",
+            "openai_organization",
+            "openai_proxy",
+            "max_retries",
+            "request_timeout",
+            "default_headers",
+            "default_query",
+            "http_client",
+        }
+    )
+
+    def __init__(self, store: SQLiteStore):
+        self.store = store
+
+    @classmethod
+    def key(cls, prompt: str, llm_string: str) -> str:
+        model, sep, rest = llm_string.partition("---")
+        try:
+            kwargs = json.loads(model)["kwargs"]
+        except (ValueError, KeyError, TypeError):
+            params = llm_string  # not a serializable model: key by all of it
+        else:
+            kept = {k: v for k, v in kwargs.items() if k not in cls.IGNORED}
+            params = json.dumps(kept, sort_keys=True) + sep + rest
+        h = hashlib.sha256(params.encode())
+        h.update(b"\0")
+        h.update(prompt.encode())
+        return h.hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Sequence[Generation] | None:
+        value = self.store.get(self.key(prompt, llm_string))
+        if value is None:
+            return None
+        try:
+            return [loads(g) for g in json.loads(zlib.decompress(value))]
+        except Exception as e:
+            logger.warning(f"broken LLM cache entry, ignored: {e}")
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        value = zlib.compress(json.dumps([dumps(g) for g in return_val]).encode())
+        self.store.set(self.key(prompt, llm_string), value)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+    def stats(self) -> dict[str, int]:
+        return self.store.stats()
+
+
+@lru_cache
+def llm_cache() -> LLMCache:
+    """the process-wide LLM cache in CACHE_DIR"""
+
+    max_bytes = os.environ.get("C2K_LLM_CACHE_BYTES", 4 * 1024**3)
+    return LLMCache(
+        SQLiteStore(CACHE_DIR / "llm.sqlite", table="llm", max_bytes=int(max_bytes))
+    )
+
+
+def install_llm_cache() -> BaseCache:
+    """make llm_cache() the global cache of the models with cache=True, unless one is set"""
+
+    if (current := get_llm_cache()) is not None:
+        return current
+    set_llm_cache(llm_cache())
+    return llm_cache()
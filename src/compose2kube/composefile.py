@@ -0,0 +1,487 @@
+"""In-process replacement of `docker compose config`.
+
+Compose files allow short forms (`"80:80"`, `./log:/log:ro`, `- KEY=value`,
+`interval: 1m`, ...) for many fields. `canonicalize()` expands them into the long
+forms `docker compose config` prints, and `load_project()` also merges override
+and included files the way compose does, without a Docker CLI.
+
+Variables are not interpolated, like `--no-interpolate`. Paths are resolved
+against the directory of the file only when loading files.
+"""
+
+import os
+import re
+import shlex
+from decimal import Decimal
+from pathlib import Path
+from typing import Any
+
+import yaml
+from dotenv import dotenv_values
+from glom import glom
+
+DEFAULT_PROJECT = "tmp"
+DEFAULT_FILES = ["compose.yaml", "compose.yml", "docker-compose.yaml", "docker-compose.yml"]
+
+# the field order of the long forms in `docker compose config`
+_TOP_ORDER = ["name", "services", "networks", "volumes", "secrets", "configs"]
+_PORT_ORDER = ["name", "mode", "host_ip", "target", "published", "protocol", "app_protocol"]
+_VOLUME_ORDER = ["type", "source", "target", "read_only", "consistency", "bind", "volume", "tmpfs"]
+_BUILD_ORDER = ["context", "dockerfile", "args"]
+_HEALTHCHECK_ORDER = [
+    "test", "timeout", "interval", "retries", "start_period", "start_interval", "disable"
+]  # fmt: skip
+_DEVICE_ORDER = ["capabilities", "driver", "count", "device_ids", "options"]
+_DEPENDS_ORDER = ["condition", "restart", "required"]
+_DURATIONS = ["interval", "timeout", "start_period", "start_interval"]
+_PROPAGATIONS = {"shared", "rshared", "slave", "rslave", "private", "rprivate"}
+_VOLUME_MODES = {"ro", "rw", "z", "Z", "nocopy", "consistent", "cached", "delegated"}
+_VOLUME_MODES |= _PROPAGATIONS
+_DURATION_UNITS = {
+    "ns": 1,
+    "us": 10**3,
+    "µs": 10**3,
+    "ms": 10**6,
+    "s": 10**9,
+    "m": 60 * 10**9,
+    "h": 3600 * 10**9,
+}
+_DURATION_RE = re.compile(r"(\d+(?:\.\d*)?|\.\d+)(ns|us|µs|ms|s|m|h)")
+
+
+class ComposeError(ValueError):
+    pass
+
+
+def _ordered(d: dict, order: list[str]) -> dict:
+    keys = [k for k in order if k in d] + [k for k in d if k not in order]
+    return {k: d[k] for k in keys}
+
+
+def _replaced(d: dict, path: list[str], value: Any) -> dict:
+    """a copy of d with the value at path replaced"""
+
+    if len(path) == 1:
+        return {**d, path[0]: value}
+    return {**d, path[0]: _replaced(d[path[0]], path[1:], value)}
+
+
+def _split(value: str, sep: str = ":") -> list[str]:
+    """split on sep outside of ${...} and [...] (IPv6 addresses)"""
+
+    parts, current, depth = [], "", 0
+    for i, c in enumerate(value):
+        if c == "{" and value[i - 1 : i] == "$" or c == "[":
+            depth += 1
+        elif c in "}]" and depth:
+            depth -= 1
+        elif c == sep and not depth:
+            parts.append(current)
+            current = ""
+            continue
+        current += c
+    return parts + [current]
+
+
+def _is_var(value: Any) -> bool:
+    return isinstance(value, str) and "$" in value
+
+
+def _to_str(value: Any) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _mapping(value: Any) -> dict[str, str | None]:
+    """environment, labels and build args: `KEY=value` lists into a mapping of strings"""
+
+    if isinstance(value, dict):
+        return {str(k): _to_str(v) for k, v in value.items()}
+    mapping: dict[str, str | None] = {}
+    for item in value or []:
+        key, sep, val = str(item).partition("=")
+        mapping[key] = val if sep else None
+    return mapping
+
+
+def go_duration(value: Any) -> Any:
+    """`1m` -> `1m0s`: a compose duration in the format of Go's time.Duration"""
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = f"{value}s"
+    if not isinstance(value, str) or _is_var(value):
+        return value
+    text = value.strip()
+    sign = -1 if text.startswith("-") else 1
+    text = text.lstrip("+-")
+    if not text or "".join(m.group(0) for m in _DURATION_RE.finditer(text)) != text:
+        raise ComposeError(f"invalid duration: {value!r}")
+    ns = sign * int(
+        sum(Decimal(n) * _DURATION_UNITS[unit] for n, unit in _DURATION_RE.findall(text))
+    )
+    return _format_duration(ns)
+
+
+def _format_duration(ns: int) -> str:
+    if ns == 0:
+        return "0s"
+    sign, ns = ("-" if ns < 0 else ""), abs(ns)
+
+    def fraction(n: int, size: int) -> str:
+        whole, rest = divmod(n, size)
+        digits = str(rest).rjust(len(str(size)) - 1, "0").rstrip("0")
+        return f"{whole}.{digits}" if digits else str(whole)
+
+    if ns < 10**9:
+        for unit, size in (("ms", 10**6), ("µs", 10**3), ("ns", 1)):
+            if ns >= size:
+                return f"{sign}{fraction(ns, size)}{unit}"
+    hours, ns = divmod(ns, 3600 * 10**9)
+    minutes, ns = divmod(ns, 60 * 10**9)
+    out = f"{hours}h" if hours else ""
+    if hours or minutes:
+        out += f"{minutes}m"
+    return f"{sign}{out}{fraction(ns, 10**9)}s"
+
+
+def _port_number(value: Any) -> Any:
+    return int(value) if isinstance(value, str) and value.isdigit() else value
+
+
+def _port_range(value: str) -> list[str]:
+    start, sep, end = value.partition("-")
+    if not sep or not (start.isdigit() and end.isdigit()):
+        return [value]
+    return [str(p) for p in range(int(start), int(end) + 1)]
+
+
+def ports(value: list) -> list[dict]:
+    """`[[host_ip:]published:]target[/protocol]` into the long form"""
+
+    expanded = []
+    for port in value or []:
+        if isinstance(port, dict):
+            long = dict(port)
+            long.setdefault("mode", "ingress")
+            long.setdefault("protocol", "tcp")
+            long["target"] = _port_number(long.get("target"))
+            if "published" in long:
+                long["published"] = _to_str(long["published"])
+            expanded.append(_ordered(long, _PORT_ORDER))
+            continue
+
+        spec, _, protocol = str(port).partition("/")
+        parts = _split(spec)
+        target = parts[-1]
+        published = parts[-2] if len(parts) >= 2 else None
+        host_ip = ":".join(parts[:-2]).strip("[]") if len(parts) >= 3 else None
+
+        targets = _port_range(target)
+        publisheds = _port_range(published) if published else [None]
+        if len(targets) > 1 and len(publisheds) not in (1, len(targets)):
+            raise ComposeError(f"port ranges don't match: {port}")
+        for i, t in enumerate(targets):
+            pub = publisheds[i] if len(publisheds) == len(targets) else published
+            long = {"mode": "ingress", "host_ip": host_ip, "target": _port_number(t)}
+            long |= {"published": pub, "protocol": protocol or "tcp"}
+            expanded.append({k: v for k, v in long.items() if v not in (None, "")})
+    return expanded
+
+
+def _is_modes(value: str) -> bool:
+    return set(value.split(",")) <= _VOLUME_MODES
+
+
+def _is_path(source: str) -> bool:
+    return source.startswith((".", "/", "~"))
+
+
+def volumes(value: list, base_dir: Path | None = None) -> list[dict]:
+    """`[source:]target[:mode]` into the long form"""
+
+    expanded = []
+    for volume in value or []:
+        if isinstance(volume, dict):
+            long = dict(volume)
+            if long.get("type") == "bind" and base_dir and long.get("source"):
+                long["source"] = _resolve(long["source"], base_dir)
+            expanded.append(_ordered(long, _VOLUME_ORDER))
+            continue
+
+        parts = _split(str(volume))
+        if len(parts) == 2 and not parts[1].startswith("/") and _is_modes(parts[1]):
+            parts = ["", *parts]  # target:mode of an anonymous volume
+        if len(parts) == 1:
+            parts = ["", parts[0]]
+        source, target, mode = parts[0], parts[1], ",".join(parts[2:])
+        modes = set(mode.split(",")) - {""}
+
+        long: dict[str, Any] = {}
+        if source and _is_path(source):
+            long |= {"type": "bind", "source": _resolve(source, base_dir) if base_dir else source}
+        else:
+            long |= {"type": "volume", "source": source or None}
+        long["target"] = target
+        if "ro" in modes:
+            long["read_only"] = True
+        if long["type"] == "bind":
+            bind: dict[str, Any] = {"create_host_path": True}
+            if selinux := modes & {"z", "Z"}:
+                bind["selinux"] = selinux.pop()
+            if propagation := modes & _PROPAGATIONS:
+                bind["propagation"] = propagation.pop()
+            long["bind"] = bind
+        else:
+            long["volume"] = {"nocopy": True} if "nocopy" in modes else {}
+        expanded.append({k: v for k, v in long.items() if v is not None})
+    return expanded
+
+
+def _resolve(path: str, base_dir: Path) -> str:
+    if _is_var(path) or "://" in path:
+        return path
+    return os.path.normpath(base_dir / os.path.expanduser(path))
+
+
+def _command(value: Any) -> Any:
+    return shlex.split(value) if isinstance(value, str) else value
+
+
+def _healthcheck(value: dict) -> dict:
+    long = dict(value)
+    if isinstance(long.get("test"), str):
+        long["test"] = ["CMD-SHELL", long["test"]]
+    for key in _DURATIONS:
+        if key in long:
+            long[key] = go_duration(long[key])
+    return _ordered(long, _HEALTHCHECK_ORDER)
+
+
+def _depends_on(value: Any) -> dict:
+    if isinstance(value, list):
+        value = {name: {} for name in value}
+    long = {}
+    for name, dep in value.items():
+        dep = {"condition": "service_started", **(dep or {})}
+        dep.setdefault("required", True)
+        long[name] = _ordered(dep, _DEPENDS_ORDER)
+    return long
+
+
+def _build(value: Any, base_dir: Path | None) -> dict:
+    long = {"context": value} if isinstance(value, str) else dict(value)
+    long.setdefault("context", ".")
+    long.setdefault("dockerfile", "Dockerfile")
+    if base_dir:
+        long["context"] = _resolve(str(long["context"]), base_dir)
+    if "args" in long:
+        long["args"] = _mapping(long["args"])
+    return _ordered(long, _BUILD_ORDER)
+
+
+def _env_files(value: Any, base_dir: Path | None) -> list[dict]:
+    files = [value] if isinstance(value, (str, dict)) else value or []
+    long = []
+    for f in files:
+        f = {"path": f} if isinstance(f, str) else dict(f)
+        f.setdefault("required", True)
+        if base_dir:
+            f["path"] = _resolve(str(f["path"]), base_dir)
+        long.append(f)
+    return long
+
+
+def _service(service: dict, base_dir: Path | None) -> dict:
+    long = dict(service or {})
+    for key in ("environment", "labels"):
+        if key in long:
+            long[key] = _mapping(long[key])
+    if "ports" in long:
+        long["ports"] = ports(long["ports"])
+    if "volumes" in long:
+        long["volumes"] = volumes(long["volumes"], base_dir)
+    if "expose" in long:
+        long["expose"] = [str(p) for p in long["expose"]]
+    for key in ("command", "entrypoint"):
+        if key in long:
+            long[key] = _command(long[key])
+    if "healthcheck" in long:
+        long["healthcheck"] = _healthcheck(long["healthcheck"])
+    if "depends_on" in long:
+        long["depends_on"] = _depends_on(long["depends_on"])
+    if "build" in long:
+        long["build"] = _build(long["build"], base_dir)
+    if "env_file" in long:
+        long["env_file"] = _env_files(long["env_file"], base_dir)
+    if isinstance(long.get("networks"), list):
+        long["networks"] = {name: None for name in long["networks"]}
+    return long
+
+
+def canonicalize(config: str | dict, base_dir: Path | None = None) -> dict:
+    """expand the short forms of one compose file. paths are resolved when base_dir is given"""
+
+    if isinstance(config, str):
+        config = yaml.safe_load(config)
+    if not isinstance(config, dict):
+        raise ComposeError("Top-level object must be a mapping")
+
+    long = {k: v for k, v in config.items() if k != "version"}
+    services = long.get("services") or {}
+    long["services"] = {name: _service(service, base_dir) for name, service in services.items()}
+    return long
+
+
+def _merge_volumes(base: list[dict], override: list[dict]) -> list[dict]:
+    # a mount replaces the one on the same target
+    merged = {v.get("target"): v for v in base}
+    merged |= {v.get("target"): v for v in override}
+    return list(merged.values())
+
+
+def merge(base: Any, override: Any, path: tuple[str, ...] = ()) -> Any:
+    """merge an override file into a canonicalized project like compose does"""
+
+    if isinstance(base, dict) and isinstance(override, dict):
+        merged = dict(base)
+        for key, value in override.items():
+            merged[key] = merge(base[key], value, path + (key,)) if key in base else value
+        return merged
+    if isinstance(base, list) and isinstance(override, list):
+        if path[-1:] in (("command",), ("entrypoint",), ("test",)):
+            return override
+        if path[:1] == ("services",) and path[-1:] == ("volumes",):
+            return _merge_volumes(base, override)
+        return base + [v for v in override if v not in base]
+    return override
+
+
+def _finalize(project: dict, name: str) -> dict:
+    """resolve env_file, add the default network and order the keys like compose"""
+
+    project = dict(project, name=project.get("name") or name)
+    name = project["name"]
+    services = {}
+    uses_default = False
+    for service_name, service in sorted((project.get("services") or {}).items()):
+        service = dict(service)
+        if env_files := service.get("env_file"):
+            # like compose, the variables are read into environment, but only when the
+            # files can be found: a file given in text has no directory to look in
+            paths = [Path(f["path"]) for f in env_files]
+            if all(p.is_absolute() and p.is_file() for p in paths):
+                env: dict[str, str | None] = {}
+                for p in paths:
+                    env |= dotenv_values(p, interpolate=False)
+                service["environment"] = env | service.get("environment", {})
+                del service["env_file"]
+        for key in ("environment", "labels"):
+            if key in service:
+                service[key] = dict(sorted(service[key].items()))
+        if args := service.get("build", {}).get("args"):
+            service["build"] = dict(service["build"], args=dict(sorted(args.items())))
+        if devices := glom(service, "deploy.resources.reservations.devices", default=None):
+            ordered = [_ordered(device, _DEVICE_ORDER) for device in devices]
+            path = ["resources", "reservations", "devices"]
+            service["deploy"] = _replaced(service["deploy"], path, ordered)
+        if "network_mode" not in service and "networks" not in service:
+            service["networks"] = {"default": None}
+        uses_default |= "default" in (service.get("networks") or {})
+        services[service_name] = dict(sorted(service.items()))
+    project["services"] = services
+
+    for key in ("networks", "volumes"):
+        defined = dict(project.get(key) or {})
+        if key == "networks" and uses_default:
+            defined.setdefault("default", None)
+        resources = {}
+        for resource, spec in sorted(defined.items()):
+            spec = dict(spec or {})
+            external = spec.get("external")
+            spec.setdefault("name", resource if external else f"{name}_{resource}")
+            resources[resource] = _ordered(spec, ["name"])
+        if resources:
+            project[key] = resources
+    return _ordered(project, _TOP_ORDER)
+
+
+def _project_name(directory: Path) -> str:
+    return re.sub(r"[^a-z0-9_-]", "", directory.resolve().name.lower()) or DEFAULT_PROJECT
+
+
+def _load_file(path: Path, resolve_paths: bool, seen: tuple[Path, ...] = ()) -> dict:
+    path = path.resolve()
+    if path in seen:
+        raise ComposeError(f"include cycle: {path}")
+    base_dir = path.parent if resolve_paths else None
+    raw = yaml.safe_load(path.read_text())
+    project = canonicalize(raw or {}, base_dir)
+
+    included: dict = {}
+    for entry in project.pop("include", None) or []:
+        files = entry if isinstance(entry, str) else entry.get("path")
+        for f in [files] if isinstance(files, str) else files:
+            sub = _load_file(path.parent / f, resolve_paths, seen + (path,))
+            sub.pop("name", None)
+            included = merge(included, sub)
+    return merge(included, project) if included else project
+
+
+def default_files(directory: Path) -> list[Path]:
+    """the compose file of a directory and its override, as `docker compose` picks them"""
+
+    for name in DEFAULT_FILES:
+        if (directory / name).is_file():
+            stem, suffix = name.rsplit(".", 1)
+            overrides = [directory / f"{stem}.override.{ext}" for ext in ("yaml", "yml")]
+            return [directory / name] + [o for o in overrides if o.is_file()][:1]
+    raise ComposeError(f"no compose file in {directory}")
+
+
+def load_project(
+    paths: str | Path | list[str | Path],
+    project_name: str | None = None,
+    resolve_paths: bool = True,
+) -> dict:
+    """the project of compose files, merged in order, like `docker compose -f ... config`
+
+    a directory stands for its compose file and the override of it.
+    """
+
+    files: list[Path] = []
+    for p in [paths] if isinstance(paths, (str, Path)) else paths:
+        p = Path(p)
+        files.extend(default_files(p) if p.is_dir() else [p])
+    project: dict = {}
+    for f in files:
+        project = merge(project, _load_file(f, resolve_paths))
+    return _finalize(project, project_name or _project_name(files[0].parent))
+
+
+def config(text: str, project_name: str = DEFAULT_PROJECT) -> dict:
+    """a compose file in text, like `docker compose -f - config --no-path-resolution`"""
+
+    return _finalize(canonicalize(text), project_name)
+
+
+class _Dumper(yaml.SafeDumper):
+    pass
+
+
+def _represent_str(dumper: yaml.SafeDumper, data: str) -> yaml.ScalarNode:
+    # quote the strings that would be read back as another type, as compose does
+    style = None
+    tag = dumper.resolve(yaml.ScalarNode, data, (True, False))
+    if data == "" or tag != "tag:yaml.org,2002:str":
+        style = '"'
+    return dumper.represent_scalar("tag:yaml.org,2002:str", data, style=style)
+
+
+_Dumper.add_representer(str, _represent_str)
+
+
+def dump(project: dict) -> str:
+    return yaml.dump(project, Dumper=_Dumper, sort_keys=False, allow_unicode=True)
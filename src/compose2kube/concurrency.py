@@ -0,0 +1,154 @@
+"""Bounded concurrency for benchmark runs.
+
+A run is limited globally by `amap_bounded` (how many matrix cells are in
+flight) and per stage by `stage()`/`astage()` (how many LLM calls, kompose or
+kubectl processes run at once, whatever cell they belong to). Stage limits are
+process-wide and shared by threads and the event loop.
+"""
+
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from logging import getLogger
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, TypeVar
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# stage name -> semaphore. unlimited when absent
+_stage_limits: dict[str, threading.BoundedSemaphore] = {}
+# stage name -> [entries, seconds waited for a slot]
+_queue: dict[str, list[float]] = {}
+_queue_lock = threading.Lock()
+
+
+def _record_wait(name: str, seconds: float) -> None:
+    with _queue_lock:
+        entry = _queue.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+
+def queue_stats() -> dict[str, dict[str, float]]:
+    """per stage: how many times work entered it and the seconds it waited for a slot"""
+
+    with _queue_lock:
+        return {name: dict(entries=n, queue_seconds=s) for name, (n, s) in _queue.items()}
+
+
+def reset_queue_stats() -> None:
+    with _queue_lock:
+        _queue.clear()
+
+
+def set_stage_limit(name: str, limit: int | None) -> None:
+    """limit concurrent work of a stage (e.g. "llm", "kompose", "dryrun"). None to unlimit"""
+
+    if limit is None:
+        _stage_limits.pop(name, None)
+    else:
+        _stage_limits[name] = threading.BoundedSemaphore(limit)
+
+
+def parse_stage_limits(specs: Iterable[str]) -> dict[str, int]:
+    """parse CLI values like ["llm=4", "kompose=2"]"""
+
+    limits = {}
+    for spec in specs:
+        name, _, limit = spec.partition("=")
+        if not name or not limit.isdigit() or int(limit) < 1:
+            raise ValueError(f"stage limit must be NAME=N (N >= 1): {spec}")
+        limits[name] = int(limit)
+    return limits
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    sem = _stage_limits.get(name)
+    if sem is None:
+        _record_wait(name, 0.0)
+        yield
+        return
+    start = time.perf_counter()
+    with sem:
+        _record_wait(name, time.perf_counter() - start)
+        yield
+
+
+@asynccontextmanager
+async def astage(name: str) -> AsyncIterator[None]:
+    sem = _stage_limits.get(name)
+    if sem is None:
+        _record_wait(name, 0.0)
+        yield
+        return
+    # poll instead of blocking, not to hold the loop or a worker thread while waiting
+    start = time.perf_counter()
+    delay = 0.001
+    while not sem.acquire(blocking=False):
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.1)
+    _record_wait(name, time.perf_counter() - start)
+    try:
+        yield
+    finally:
+        sem.release()
+
+
+async def astream_bounded(
+    fn: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    max_concurrency: int,
+) -> AsyncIterator[tuple[T, R]]:
+    """await fn(item) for items with at most max_concurrency in flight, yielding (item, result)
+
+    Results come in the order they finish. items are consumed lazily, so only
+    max_concurrency of them are held at a time. When one item fails or the run
+    is cancelled (e.g. Ctrl-C), the pending items are cancelled and the error is
+    raised.
+    """
+
+    it = iter(items)
+    pending: dict[asyncio.Future, T] = {}
+    try:
+        while True:
+            for item in it:
+                pending[asyncio.ensure_future(fn(item))] = item
+                if len(pending) >= max_concurrency:
+                    break
+            if not pending:
+                return
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = pending.pop(task)
+                yield item, task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def amap_bounded(
+    fn: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    max_concurrency: int,
+    on_result: Callable[[T, R], Any] | None = None,
+) -> list[R]:
+    """astream_bounded, but results are returned in the order of items
+
+    on_result is called as each item finishes.
+    """
+
+    async def indexed(pair: tuple[int, T]) -> R:
+        return await fn(pair[1])
+
+    results: dict[int, R] = {}
+    async for (i, item), got in astream_bounded(indexed, enumerate(items), max_concurrency):
+        if on_result is not None:
+            on_result(item, got)
+        results[i] = got
+    return [results[i] for i in range(len(results))]
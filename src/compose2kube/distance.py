@@ -0,0 +1,198 @@
+"""Structural distance between two manifests, in linear time.
+
+It replaces `DeepDiff(ignore_order=True, get_deep_distance=True)`, which pairs
+up every item of every list and is superlinear in the manifest size.
+
+API objects are matched by (kind, metadata.name). The objects left over are
+matched by their canonical hash (renamed copies), then in order within their
+kind. Each object is flattened into the multiset of its leaves, keyed by path
+where list items are keyed by their `name` (containers, ports, env) and other
+list items are unordered. Like the DeepDiff call it replaces, the paths through
+`metadata` are ignored. The distance is the number of leaves found on one side
+only, over all the leaves of both, so it is in [0, 1] and 0 for equal manifests.
+"""
+
+import time
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Iterable, Iterator
+
+from compose2kube.manifest import ParsedManifest
+
+Leaf = tuple[tuple[str, ...], str, Any]
+
+
+def leaves(node: Any, path: tuple[str, ...] = ()) -> Iterator[Leaf]:
+    """(path, type name, value) of the scalars in node, except under metadata"""
+
+    if isinstance(node, dict):
+        if not node:
+            yield path, "dict", None
+        for key, value in node.items():
+            key = str(key)
+            if "metadata" not in key:
+                yield from leaves(value, (*path, key))
+    elif isinstance(node, list):
+        if not node:
+            yield path, "list", None
+        for item in node:
+            name = item.get("name") if isinstance(item, dict) else None
+            step = f"[{name}]" if isinstance(name, (str, int)) else "[]"
+            yield from leaves(item, (*path, step))
+    else:
+        yield path, type(node).__name__, node
+
+
+@dataclass(frozen=True)
+class _Object:
+    kind: str
+    leaves: Counter
+    digest: int
+
+    @classmethod
+    def of(cls, doc: Any) -> "_Object":
+        counts = Counter(leaves(doc))
+        kind = str(doc.get("kind")) if isinstance(doc, dict) else type(doc).__name__
+        return cls(kind=kind, leaves=counts, digest=hash(frozenset(counts.items())))
+
+    @property
+    def size(self) -> int:
+        return self.leaves.total()
+
+
+def _name(doc: Any) -> str | None:
+    meta = doc.get("metadata") if isinstance(doc, dict) else None
+    name = meta.get("name") if isinstance(meta, dict) else None
+    return None if name is None else str(name)
+
+
+@lru_cache(maxsize=1024)
+def _profile(manifest: str) -> dict[tuple[str, str | None, int], _Object]:
+    """the objects of manifest by (kind, name, nth of the same kind and name)"""
+
+    objects: dict[tuple[str, str | None, int], _Object] = {}
+    for doc in ParsedManifest.of(manifest).iter_documents():
+        if doc is None:
+            continue
+        obj = _Object.of(doc)
+        key = (obj.kind, _name(doc), 0)
+        while key in objects:
+            key = (key[0], key[1], key[2] + 1)
+        objects[key] = obj
+    return objects
+
+
+def _difference(a: _Object, b: _Object) -> int:
+    if a.digest == b.digest:
+        return 0
+    return (a.leaves - b.leaves).total() + (b.leaves - a.leaves).total()
+
+
+def _pair_leftovers(left: list[_Object], right: list[_Object]) -> Iterator[tuple]:
+    """pairs of the unmatched objects: equal ones first, then in order by kind"""
+
+    by_digest: dict[int, list[_Object]] = defaultdict(list)
+    for obj in right:
+        by_digest[obj.digest].append(obj)
+    rest = []
+    for obj in left:
+        if same := by_digest.get(obj.digest):
+            yield obj, same.pop()
+        else:
+            rest.append(obj)
+    by_kind: dict[str, deque[_Object]] = defaultdict(deque)
+    for objs in by_digest.values():
+        for obj in objs:
+            by_kind[obj.kind].append(obj)
+    for obj in rest:
+        yield obj, (by_kind[obj.kind].popleft() if by_kind[obj.kind] else None)
+    for objs in by_kind.values():
+        for obj in objs:
+            yield None, obj
+
+
+def distance(target: str, human: str) -> float:
+    """the structural distance of two manifests, from 0 (equal) to 1
+
+    Raises the parse error of a manifest that isn't valid YAML.
+    """
+
+    t, h = _profile(str(target)), _profile(str(human))
+    total = sum(o.size for o in t.values()) + sum(o.size for o in h.values())
+    if not total:
+        return 0.0
+    diff = sum(_difference(obj, h[key]) for key, obj in t.items() if key in h)
+    left = [obj for key, obj in t.items() if key not in h]
+    right = [obj for key, obj in h.items() if key not in t]
+    for a, b in _pair_leftovers(left, right):
+        if a is None or b is None:
+            diff += (a or b).size
+        else:
+            diff += _difference(a, b)
+    return diff / total
+
+
+def deep_distance(target: str, human: str) -> float:
+    """the distance that evaluator.report computed with DeepDiff before"""
+
+    from deepdiff import DeepDiff
+
+    diff = DeepDiff(
+        t1=ParsedManifest.of(target).documents,
+        t2=ParsedManifest.of(human).documents,
+        exclude_regex_paths=r".*metadata.*",
+        ignore_order=True,
+        get_deep_distance=True,
+        cutoff_intersection_for_pairs=1,
+        cutoff_distance_for_pairs=1,
+    )
+    return diff.get("deep_distance", 0)
+
+
+def _ranks(values: list[float]) -> list[float]:
+    order = sorted(range(len(values)), key=values.__getitem__)
+    ranks = [0.0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2
+        i = j + 1
+    return ranks
+
+
+def _pearson(xs: list[float], ys: list[float]) -> float:
+    n = len(xs)
+    mx, my = sum(xs) / n, sum(ys) / n
+    cov = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+    vx = sum((x - mx) ** 2 for x in xs)
+    vy = sum((y - my) ** 2 for y in ys)
+    return cov / (vx * vy) ** 0.5 if vx and vy else 0.0
+
+
+def benchmark(pairs: Iterable[tuple[str, str]]) -> dict[str, float]:
+    """time distance() against deep_distance() and correlate them over pairs"""
+
+    pairs = [(ParsedManifest.of(a), ParsedManifest.of(b)) for a, b in pairs]
+    for a, b in pairs:  # parse outside the timings
+        _ = a.documents, b.documents
+
+    start = time.perf_counter()
+    deep = [deep_distance(a, b) for a, b in pairs]
+    deep_seconds = time.perf_counter() - start
+    _profile.cache_clear()
+    start = time.perf_counter()
+    ours = [distance(a, b) for a, b in pairs]
+    seconds = time.perf_counter() - start
+
+    return dict(
+        pairs=len(pairs),
+        seconds=seconds,
+        deep_seconds=deep_seconds,
+        speedup=deep_seconds / seconds if seconds else float("inf"),
+        pearson=_pearson(ours, deep),
+        spearman=_pearson(_ranks(ours), _ranks(deep)),
+    )
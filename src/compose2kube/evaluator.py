@@ -1,15 +1,14 @@
 import logging
 import subprocess
+from functools import lru_cache
 from operator import itemgetter
 from pathlib import Path
-from tempfile import NamedTemporaryFile
-from typing import cast
+from typing import AsyncIterator, Container, Iterable, Sequence, cast
 
-import yaml
-from deepdiff import DeepDiff
 from langchain.chains.openai_functions import get_openai_output_parser
 from langchain_core.runnables import (
     Runnable,
+    RunnableConfig,
     RunnableLambda,
     RunnableParallel,
     RunnablePassthrough,
@@ -19,11 +18,14 @@ from langchain_core.runnables import (
 )
 from langchain_openai import ChatOpenAI
 
-from compose2kube import llm, templates
+from compose2kube import composefile, distance, llm, templates, tools, workkey
+from compose2kube.concurrency import amap_bounded, astream_bounded
 from compose2kube.llm import Compose, Manifests, ManifestScore
+from compose2kube.selection import select, select_steps
 
 N = 20
 MODEL = llm.GPT35TURBO
+SEED = 1
 logger = logging.getLogger(__name__)
 
 
@@ -39,99 +41,91 @@ def readtext(path: str) -> str:
     return Path(path).read_text()
 
 
+# The chains with LLM clients are built on first use (see __getattr__): importing
+# this module stays fast and doesn't need OPENAI_API_KEY.
+
+
 # 1st layer
-enrich_by_llm = llm.make_llm_runnable(tools=[Compose], model=MODEL, n=N)
+@lru_cache
+def _enrich_by_llm() -> Runnable:
+    return llm.make_llm_runnable(tools=[Compose], model=MODEL, n=N, seed=SEED)
 
 
 def enrich_by_config(content: str) -> str:
     """TODO: 当面はあらかじめ変換し匿名加工済みのファイルを用いるため使用しない"""
-    tmp = NamedTemporaryFile("w", prefix="composetmp", suffix=".yaml", delete=False)
-    tmp.write(content)
-    tmp.close()
-    print(tmp.name)
-    got = subprocess.check_output(
-        f"docker compose -f {tmp.name} config", shell=True, universal_newlines=True
-    )
-    return got
+    return composefile.dump(composefile.config(content))
 
 
 # 2nd layer
 @chain_decorator
 def convert_by_kompose(content: str) -> Manifests | Exception:
     assert isinstance(content, str), type(content)
-    tmp = NamedTemporaryFile("w", prefix="composetmp", suffix=".yaml", delete=False)
-    tmp.write(content)
-    tmp.close()
-    print(tmp.name)
-    cmd = f"kompose convert -f {tmp.name} --stdout --controller=Deployment --volumes persistentVolumeClaim --with-kompose-annotation=false"
-
-    try:
-        got = subprocess.check_output(cmd, shell=True, universal_newlines=True)
-        return Manifests(manifests=[got])
-    except subprocess.CalledProcessError as e:
-        return e
-
-
-convert_by_llm = llm.make_llm_runnable(tools=[Manifests], n=N, model=MODEL)
-
-ops = RunnableParallel(
-    #
-    # method1
-    canonical_kompose=canonicalize | readtext | convert_by_kompose | (lambda ms: [ms]),
-    #
-    # method2
-    canonical_llm1_kompose=canonicalize
-    | readtext
-    | dict(
-        input=lambda x: x,
-        target=lambda _: "AWS EKS",
-    )
-    | templates.prompt1_for_kompose
-    | enrich_by_llm  # Compose[]
-    | (lambda xs: [x for x in xs if isinstance(x, Compose)])
-    | (lambda cs: [c.spec for c in cast(list, cs)])  # Compose[] -> str[]
-    | convert_by_kompose.map(),
-    #
-    # method3
-    canonical_llm2=canonicalize
-    | readtext
-    | dict(
-        input=lambda x: x,
-        target=lambda _: "AWS EKS",
-    )
-    | templates.prompt_zeroshot
-    | convert_by_llm,
-    #
-    # method4
-    llm2=readtext
-    | dict(
-        input=lambda x: x,
-        target=lambda _: "AWS EKS",
+    cmd = "kompose convert -f compose.yaml --stdout --controller=Deployment --volumes persistentVolumeClaim --with-kompose-annotation=false"
+
+    with tools.workspace(prefix="kompose") as workdir:
+        (workdir / "compose.yaml").write_text(content)
+        try:
+            proc = tools.run(cmd, stage_name="kompose", cwd=workdir, check=True)
+        except subprocess.CalledProcessError as e:
+            return e
+    return Manifests(manifests=[proc.stdout])
+
+
+@lru_cache
+def _convert_by_llm() -> Runnable:
+    return llm.make_llm_runnable(tools=[Manifests], n=N, model=MODEL, seed=SEED)
+
+
+@lru_cache
+def _ops() -> RunnableParallel:
+    enrich_by_llm, convert_by_llm = _enrich_by_llm(), _convert_by_llm()
+    return RunnableParallel(
+        #
+        # method1
+        canonical_kompose=canonicalize | readtext | convert_by_kompose | (lambda ms: [ms]),
+        #
+        # method2
+        canonical_llm1_kompose=canonicalize
+        | readtext
+        | dict(
+            input=lambda x: x,
+            target=lambda _: "AWS EKS",
+        )
+        | templates.prompt1_for_kompose
+        | enrich_by_llm  # Compose[]
+        | (lambda xs: [x for x in xs if isinstance(x, Compose)])
+        | (lambda cs: [c.spec for c in cast(list, cs)])  # Compose[] -> str[]
+        | convert_by_kompose.map(),
+        #
+        # method3
+        canonical_llm2=canonicalize
+        | readtext
+        | dict(
+            input=lambda x: x,
+            target=lambda _: "AWS EKS",
+        )
+        | templates.prompt_zeroshot
+        | convert_by_llm,
+        #
+        # method4
+        llm2=readtext
+        | dict(
+            input=lambda x: x,
+            target=lambda _: "AWS EKS",
+        )
+        | templates.prompt_zeroshot
+        | convert_by_llm,
     )
-    | templates.prompt_zeroshot
-    | convert_by_llm,
-)
 
 
 @chain_decorator
 def report(args: dict) -> dict:
-    def compare(target: Manifests, human: Manifests) -> dict[str, int]:
-        t1 = list(yaml.full_load_all(target.join()))
-        t2 = list(yaml.full_load_all(human.join()))
-        diff = DeepDiff(
-            t1=t1,
-            t2=t2,
-            exclude_regex_paths=r".*metadata.*",
-            ignore_order=True,
-            get_deep_distance=True,
-            cutoff_intersection_for_pairs=1,
-            cutoff_distance_for_pairs=1,
-        )
-        return dict(deep_distance=diff.get("deep_distance", 0))
+    def compare(target: Manifests, human: Manifests) -> dict[str, float]:
+        return dict(distance=distance.distance(target.parsed(), human.parsed()))
 
     answer: Manifests = args["answer"]
     generates = [m for m in args["generates"] if isinstance(m, Manifests)]
-    generates_features = [m.feature() for m in generates]
+    generates_features = Manifests.features(generates)
     compares_to_answer = [compare(m, answer) for m in generates]
 
     return dict(
@@ -141,21 +135,151 @@ def report(args: dict) -> dict:
     )
 
 
-convert_chain = (
-    # this chain accepts dict { input, answer }
-    RunnablePassthrough.assign(
-        answer=itemgetter("answer") | RunnableLambda(Manifests.from_file),
-        manifests=itemgetter("input") | ops,  # key-value
-    )
-    | RunnableLambda(
-        lambda dic: [
-            {"input": dic["input"], "answer": dic["answer"], "op": k, "generates": v}  # type: ignore
-            for k, v in dic["manifests"].items()  # type: ignore
-        ]
+def ops_for(methods: Sequence[str] | None = None) -> RunnableParallel:
+    """ops with only the methods chosen by selectors (see selection)"""
+
+    return select_steps(_ops(), methods)
+
+
+def input_name(path: str) -> str:
+    """the name of an input for the selectors: the directory of its compose file"""
+
+    return Path(path).parent.name
+
+
+@lru_cache
+def _convert_chain() -> Runnable:
+    return convert_chain_for()
+
+
+def convert_chain_for(methods: Sequence[str] | None = None) -> Runnable:
+    """convert_chain running only the selected methods"""
+
+    return (
+        # this chain accepts dict { input, answer }
+        RunnablePassthrough.assign(
+            answer=itemgetter("answer") | RunnableLambda(Manifests.from_file),
+            manifests=itemgetter("input") | ops_for(methods),  # key-value
+        )
+        | RunnableLambda(
+            lambda dic: [
+                dict(input=dic["input"], answer=dic["answer"], op=k, generates=v)  # type: ignore
+                for k, v in dic["manifests"].items()  # type: ignore
+            ]
+        )
     )
+
+
+_LAZY = dict(
+    enrich_by_llm=_enrich_by_llm,
+    convert_by_llm=_convert_by_llm,
+    ops=_ops,
+    convert_chain=_convert_chain,
 )
 
 
+def __getattr__(name: str):
+    if name in _LAZY:
+        return _LAZY[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def convert_key(input: str, op: str) -> str:
+    """the work key of the (input file, method) cell of ops"""
+
+    key = workkey.WorkKey(
+        input=workkey.content_hash(Path(input).read_text()),
+        method=op,
+        model=MODEL,
+        n=N,
+        seed=SEED,
+        prompt=_prompt_version(op),
+    )
+    return str(key)
+
+
+@lru_cache
+def _prompt_version(op: str) -> str:
+    return workkey.prompt_version(_ops().steps__[op])
+
+
+async def astream_convert(
+    inputs: Iterable[dict],
+    max_concurrency: int,
+    config: RunnableConfig | None = None,
+    skip: Container[str] = (),
+    methods: Sequence[str] | None = None,
+) -> AsyncIterator[dict]:
+    """convert_chain for many inputs, running each (input, method) cell of ops on its own
+
+    at most max_concurrency cells are in flight. yields the items of
+    `convert_chain` ({input, answer, op, generates}) and the work key of the
+    cell as each cell finishes. cells whose key is in skip are not run, and
+    only the methods chosen by the selectors in methods are.
+    """
+
+    ops = _ops()
+    methods = select(ops.steps__, methods)
+
+    async def run(cell: tuple[dict, str, str]):
+        x, op, _ = cell
+        return await ops.steps__[op].ainvoke(x["input"], config=config)
+
+    cells = (
+        (x, op, key)
+        for x in inputs
+        for op in methods
+        if (key := convert_key(x["input"], op)) not in skip
+    )
+    async for (x, op, key), generates in astream_bounded(run, cells, max_concurrency):
+        answer = Manifests.from_file(x["answer"])
+        yield dict(input=x["input"], answer=answer, op=op, generates=generates, key=key)
+
+
+async def aconvert(
+    inputs: list[dict],
+    max_concurrency: int,
+    config: RunnableConfig | None = None,
+    methods: Sequence[str] | None = None,
+) -> list[list[dict]]:
+    """astream_convert collected into the same as `convert_chain_for(methods).batch(inputs)`"""
+
+    got = {}
+    async for item in astream_convert(inputs, max_concurrency, config=config, methods=methods):
+        item.pop("key")
+        got[(item["input"], item["op"])] = item
+    return [[got[(x["input"], op)] for op in select(_ops().steps__, methods)] for x in inputs]
+
+
+async def astream_evaluate(
+    items: Iterable[dict],
+    max_concurrency: int,
+    config: RunnableConfig | None = None,
+    skip: Container[str] = (),
+) -> AsyncIterator[dict]:
+    """eval_chain for many items with at most max_concurrency in flight, in finishing order
+
+    results carry the work key of their item. items whose key is in skip are not run.
+    """
+
+    async def run(item: dict) -> dict:
+        return await eval_chain.ainvoke(item, config=config)
+
+    todo = (item for item in items if item.get("key") is None or item["key"] not in skip)
+    async for item, got in astream_bounded(run, todo, max_concurrency):
+        yield {**got, "key": item.get("key")}
+
+
+async def aevaluate(
+    items: list[dict], max_concurrency: int, config: RunnableConfig | None = None
+) -> list[dict]:
+    """eval_chain for many items with at most max_concurrency in flight"""
+
+    return await amap_bounded(
+        lambda item: eval_chain.ainvoke(item, config=config), items, max_concurrency
+    )
+
+
 def dict_to_eval_prompt(dic: dict, n_samples: int) -> list[str]:
     compose_file = dic["input"]
     compose = Path(compose_file).read_text()
@@ -0,0 +1,435 @@
+"""A local stand-in for the OpenAI chat-completions API, for offline load tests.
+
+It answers `POST /v1/chat/completions` like the API does, including `n` choices,
+function calls (`functions`/`function_call` and `tools`/`tool_choice`) and
+streamed answers (`stream`, `stream_options`).
+Answers are replayed from a recording, keyed by the request, or made up by a
+responder. Latency is drawn from a distribution and 429s are injected at a
+rate or beyond a concurrency limit, so the retries and the scaling of the real
+chains can be measured without the API:
+
+    python -m compose2kube.fakeopenai --port 8080 --latency lognormal:2:0.5 \\
+        --error-rate 0.05 --record /tmp/recording.jsonl
+    OPENAI_API_BASE=http://127.0.0.1:8080/v1 OPENAI_API_KEY=fake \\
+        python -m compose2kube --convert --no-langfuse
+
+With `--upstream https://api.openai.com/v1` the requests that aren't recorded
+yet are forwarded and their answers recorded, so a real run can be replayed.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Callable
+
+logger = getLogger(__name__)
+
+# request, the random numbers of the server -> seconds
+Latency = Callable[[dict, random.Random], float]
+# request, index of the choice -> the content, or the arguments of the function call
+Responder = Callable[[dict, int], str | dict]
+
+MANIFEST = """```yaml
+apiVersion: v1
+kind: Service
+metadata:
+  name: web
+spec:
+  ports:
+    - port: 80
+```"""
+
+
+def fixed(seconds: float) -> Latency:
+    return lambda *_: seconds
+
+
+def uniform(low: float, high: float) -> Latency:
+    return lambda _, rng: rng.uniform(low, high)
+
+
+def lognormal(median: float, sigma: float) -> Latency:
+    """long-tailed like the API: median seconds, sigma of the log"""
+
+    return lambda _, rng: rng.lognormvariate(0, sigma) * median
+
+
+def parse_latency(spec: str) -> Latency:
+    """CLI values: "0.5", "uniform:0.1:2", "lognormal:2:0.5" """
+
+    name, *args = spec.split(":")
+    if not args:
+        return fixed(float(name))
+    factories: dict[str, Callable[..., Latency]] = dict(uniform=uniform, lognormal=lognormal)
+    if name not in factories:
+        raise ValueError(f"unknown latency distribution: {spec}")
+    return factories[name](*map(float, args))
+
+
+def _function_of(request: dict) -> dict | None:
+    """the function the request asks to call, if any"""
+
+    functions = list(request.get("functions") or [])
+    functions += [t["function"] for t in request.get("tools") or [] if t.get("type") == "function"]
+    choice = request.get("function_call") or request.get("tool_choice")
+    if isinstance(choice, dict):
+        name = choice.get("name") or choice.get("function", {}).get("name")
+        return next((f for f in functions if f.get("name") == name), None)
+    return functions[0] if functions and choice not in ("none", None) else None
+
+
+def default_responder(request: dict, index: int) -> str | dict:
+    """a Service manifest, as text or as the arguments of the function"""
+
+    function = _function_of(request)
+    if function is None:
+        return MANIFEST
+    args: dict[str, Any] = {}
+    properties = function.get("parameters", {}).get("properties", {})
+    for name in function.get("parameters", {}).get("required", []):
+        kind = properties.get(name, {}).get("type")
+        body = MANIFEST.strip("`").removeprefix("yaml\n")
+        args[name] = [body] if kind == "array" else body
+    return args
+
+
+def request_key(request: dict) -> str:
+    """what decides the answer: the model, messages, n, seed, temperature and functions"""
+
+    keys = ["model", "messages", "n", "seed", "temperature", "functions", "function_call"]
+    keys += ["tools", "tool_choice"]
+    h = hashlib.sha256(json.dumps({k: request.get(k) for k in keys}, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def stream_chunks(response: dict, size: int = 16) -> list[dict]:
+    """a chat completion as the chunks of its stream: each choice in pieces of size
+    characters, the choices interleaved, then the usage"""
+
+    def chunk(choices: list[dict], **extra) -> dict:
+        keys = ["id", "created", "model", "system_fingerprint"]
+        common = {k: response.get(k) for k in keys}
+        return dict(common, object="chat.completion.chunk", choices=choices, **extra)
+
+    def pieces(text: str) -> list[str]:
+        return [text[i : i + size] for i in range(0, len(text), size)]
+
+    def deltas(message: dict) -> list[dict]:
+        if message.get("content") is not None:
+            first = {"role": "assistant", "content": ""}
+            return [first] + [{"content": piece} for piece in pieces(message["content"])]
+        if message.get("tool_calls"):
+            call = message["tool_calls"][0]
+            function = dict(name=call["function"]["name"], arguments="")
+            head = dict(index=0, id=call["id"], type="function", function=function)
+            return [{"role": "assistant", "tool_calls": [head]}] + [
+                {"tool_calls": [dict(index=0, function=dict(arguments=piece))]}
+                for piece in pieces(call["function"]["arguments"])
+            ]
+        call = message["function_call"]
+        first = {"role": "assistant", "function_call": dict(name=call["name"], arguments="")}
+        return [first] + [
+            {"function_call": {"arguments": piece}} for piece in pieces(call["arguments"])
+        ]
+
+    streams = [deltas(choice["message"]) for choice in response["choices"]]
+    chunks = []
+    for step in range(max(map(len, streams), default=0)):
+        choices = [
+            dict(index=c["index"], delta=stream[step], logprobs=None, finish_reason=None)
+            for c, stream in zip(response["choices"], streams)
+            if step < len(stream)
+        ]
+        chunks.append(chunk(choices))
+    finished = [
+        dict(index=c["index"], delta={}, logprobs=None, finish_reason=c["finish_reason"])
+        for c in response["choices"]
+    ]
+    chunks.append(chunk(finished))
+    chunks.append(chunk([], usage=response.get("usage")))
+    return chunks
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _error(e: Exception) -> tuple[int, dict]:
+    """the answer to a request that failed: the upstream's error as it is, else a 5xx"""
+
+    if isinstance(e, urllib.error.HTTPError):
+        try:
+            return e.code, json.loads(e.read() or b"{}")
+        except ValueError:
+            return e.code, {"error": {"message": str(e), "type": "upstream", "code": None}}
+    logger.warning("answering a request failed", exc_info=True)
+    status = 502 if isinstance(e, urllib.error.URLError) else 500
+    message = f"{type(e).__name__}: {e}"
+    return status, {"error": {"message": message, "type": "server_error", "code": None}}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 drops connections under load, which stalls clients
+    request_queue_size = 1024
+
+
+@dataclass
+class ServerStats:
+    requests: int = 0
+    replayed: int = 0
+    forwarded: int = 0
+    rate_limited: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+    statuses: dict[int, int] = field(default_factory=dict)
+
+
+class FakeOpenAI:
+    """the server, run in a thread of this process as a context manager
+
+    recording: JSONL of {key, response} to replay, and to append to with upstream
+    upstream: the API base URL to forward unrecorded requests to
+    error_rate: the share of requests answered with 429
+    seed: of the latencies and the 429s of error_rate
+    max_in_flight: requests beyond this many at once are answered with 429
+    chunk_latency: seconds between the chunks of a streamed answer
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: Latency = fixed(0.0),
+        responder: Responder = default_responder,
+        recording: str | Path | None = None,
+        upstream: str | None = None,
+        error_rate: float = 0.0,
+        max_in_flight: int | None = None,
+        seed: int | None = None,
+        chunk_latency: float = 0.0,
+    ):
+        self.latency = latency
+        self.responder = responder
+        self.recording = Path(recording) if recording else None
+        self.upstream = upstream
+        self.error_rate = error_rate
+        self.max_in_flight = max_in_flight
+        self.chunk_latency = chunk_latency
+        self.stats = ServerStats()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recorded: dict[str, dict] = {}
+        if self.recording and self.recording.exists():
+            for line in self.recording.read_text().splitlines():
+                if line.strip():
+                    entry = json.loads(line)
+                    self._recorded[entry["key"]] = entry["response"]
+        self.server = _Server((host, port), self._handler())
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def environ(self) -> dict[str, str]:
+        """environment variables that point the OpenAI clients made afterwards here"""
+
+        url = self.base_url
+        return {"OPENAI_API_BASE": url, "OPENAI_BASE_URL": url, "OPENAI_API_KEY": "fake"}
+
+    def start(self) -> "FakeOpenAI":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeOpenAI":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._send(404, {"error": {"message": f"not found: {self.path}"}})
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                request = json.loads(body or b"{}")
+                status, payload = fake.handle(request)
+                if status == 200 and request.get("stream"):
+                    return self._stream(request, payload)
+                self._send(status, payload)
+
+            def _stream(self, request: dict, payload: dict):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                chunks = stream_chunks(payload)
+                if not (request.get("stream_options") or {}).get("include_usage"):
+                    chunks.pop()
+                events = [f"data: {json.dumps(c)}\n\n" for c in chunks] + ["data: [DONE]\n\n"]
+                for event in events:
+                    data = event.encode()
+                    self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+                    time.sleep(fake.chunk_latency)
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _send(self, status: int, payload: dict):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if status == 429:
+                    self.send_header("Retry-After-Ms", "10")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def handle(self, request: dict) -> tuple[int, dict]:
+        """the status and the body of the answer to a chat-completions request"""
+
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.in_flight += 1
+            self.stats.max_in_flight = max(self.stats.max_in_flight, self.stats.in_flight)
+            limited = (
+                self.max_in_flight is not None and self.stats.in_flight > self.max_in_flight
+            ) or self._random.random() < self.error_rate
+            delay = 0.0 if limited else self.latency(request, self._random)
+        status = 500
+        try:
+            if limited:
+                status, payload = 429, {
+                    "error": {"message": "Rate limit reached", "type": "requests", "code": None}
+                }
+            else:
+                time.sleep(max(0.0, delay))
+                status, payload = 200, self._answer(request)
+        except Exception as e:
+            status, payload = _error(e)
+        finally:
+            with self._lock:
+                self.stats.in_flight -= 1
+                self.stats.rate_limited += status == 429
+                self.stats.statuses[status] = self.stats.statuses.get(status, 0) + 1
+        return status, payload
+
+    def _answer(self, request: dict) -> dict:
+        key = request_key(request)
+        with self._lock:
+            recorded = self._recorded.get(key)
+        if recorded is not None:
+            with self._lock:
+                self.stats.replayed += 1
+            return recorded
+        response = self._forward(request) if self.upstream else self._make_up(request)
+        if self.recording:
+            with self._lock:
+                self._recorded[key] = response
+                with self.recording.open("a") as f:
+                    f.write(json.dumps(dict(key=key, response=response)) + "\n")
+        return response
+
+    def _forward(self, request: dict) -> dict:
+        req = urllib.request.Request(
+            f"{self.upstream}/chat/completions",
+            data=json.dumps(request).encode(),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY', '')}",
+            },
+        )
+        with urllib.request.urlopen(req) as res:
+            response = json.load(res)
+        with self._lock:
+            self.stats.forwarded += 1
+        return response
+
+    def _make_up(self, request: dict) -> dict:
+        function = _function_of(request)
+        use_tools = bool(request.get("tools"))
+        choices = []
+        for i in range(request.get("n") or 1):
+            answer = self.responder(request, i)
+            message: dict[str, Any] = {"role": "assistant", "content": None}
+            call = {"name": function["name"] if function else "", "arguments": json.dumps(answer)}
+            if isinstance(answer, str):
+                message["content"], finish = answer, "stop"
+            elif use_tools:
+                message["tool_calls"] = [dict(id=f"call_{i}", type="function", function=call)]
+                finish = "tool_calls"
+            else:
+                message["function_call"], finish = call, "function_call"
+            choices.append(dict(index=i, message=message, finish_reason=finish, logprobs=None))
+
+        prompt = json.dumps(request.get("messages", []))
+        completion = sum(_tokens(json.dumps(c["message"])) for c in choices)
+        return {
+            "id": f"chatcmpl-fake-{request_key(request)[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-3.5-turbo"),
+            "system_fingerprint": "fp_fake",
+            "choices": choices,
+            "usage": {
+                "prompt_tokens": _tokens(prompt),
+                "completion_tokens": completion,
+                "total_tokens": _tokens(prompt) + completion,
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="compose2kube.fakeopenai", description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=parse_latency, default=fixed(0.0), help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 429s")
+    parser.add_argument("--max-in-flight", type=int, default=None)
+    parser.add_argument("--record", dest="recording", default=None, help="JSONL to replay")
+    parser.add_argument("--upstream", default=None, help="API to forward unrecorded requests")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--chunk-latency", type=float, default=0.0, help="seconds between streamed chunks"
+    )
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(**vars(args))
+    print(f"serving on {fake.base_url}", flush=True)
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+        print(f"stats: {fake.stats}")
+
+
+if __name__ == "__main__":
+    main()
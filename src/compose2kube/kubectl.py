@@ -0,0 +1,275 @@
+import json
+import re
+import shlex
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from logging import getLogger
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+from compose2kube import tools
+from compose2kube.cache import dry_run_cache
+
+logger = getLogger(__name__)
+
+KUBECTL = "kubectl"
+BATCH_SIZE = 200
+# of the way batched results are made, a part of the dry-run cache key
+RESULTS_VERSION = 2
+
+# kubectl reports the object in errors as `Deployment.apps "db"` or `name: "db"`
+_OBJECT_RE = re.compile(r'(?:(\w+)(?:\.[\w.-]+)? |name: )"([^"]*)"')
+
+
+@dataclass
+class DryRunResult:
+    """result of `kubectl apply --dry-run` for one multi-document spec"""
+
+    ok: bool
+    stdout: str
+    stderr: str
+    # index of the YAML documents that the errors point to
+    documents: list[int] = field(default_factory=list)
+
+
+@lru_cache
+def cluster_version(kubectl: str = KUBECTL) -> str:
+    """kubectl and cluster versions, a part of the dry-run cache key"""
+
+    proc = tools.run(f"{kubectl} version -o json", stage_name="dryrun")
+    try:
+        versions = json.loads(proc.stdout)
+    except json.JSONDecodeError:
+        versions = {}
+    client = versions.get("clientVersion", {}).get("gitVersion", "unknown")
+    server = versions.get("serverVersion", {}).get("gitVersion", "unknown")
+    return f"{kubectl} client={client} server={server}"
+
+
+def _cacheable(version: str, mode: str) -> bool:
+    # a server dry-run without a reachable server only tells about the connection
+    return mode != "server" or "server=unknown" not in version
+
+
+def dry_run(
+    spec: str, mode: str = "server", kubectl: str = KUBECTL, cache: bool = True
+) -> DryRunResult:
+    """execute kubectl apply --dry-run for a single spec"""
+
+    if not cache:
+        return _dry_run(spec, mode=mode, kubectl=kubectl)
+    return dry_run_batch([spec], mode=mode, kubectl=kubectl)[0]
+
+
+def _dry_run(spec: str, mode: str, kubectl: str) -> DryRunResult:
+    proc = tools.run(f"{kubectl} apply -f - --dry-run={mode}", input=spec, stage_name="dryrun")
+    return DryRunResult(ok=proc.returncode == 0, stdout=proc.stdout, stderr=proc.stderr)
+
+
+def dry_run_batch(
+    specs: list[str],
+    mode: str = "server",
+    kubectl: str = KUBECTL,
+    batch_size: int = BATCH_SIZE,
+    cache: bool = True,
+) -> list[DryRunResult]:
+    """execute kubectl apply --dry-run once for many specs
+
+    Each spec is written to its own file in a scratch directory and the whole
+    directory is applied by one kubectl process. kubectl keeps going after an
+    error and names the offending file in every message, so the errors are
+    attributed back to the spec (and the document inside it) they came from.
+    As for a single spec, a spec fails only when kubectl fails and an error is
+    about it; warnings are kept in its stderr. The success lines of stdout are
+    attributed by the order kubectl applies the documents in.
+
+    Results are looked up in and stored to the shared dry-run cache first.
+    """
+
+    results: dict[int, DryRunResult] = {}
+    store = dry_run_cache() if cache else None
+    version = f"{cluster_version(kubectl)} results={RESULTS_VERSION}" if store else ""
+    if store:
+        for i, spec in enumerate(specs):
+            if (hit := store.get(spec, version, mode)) is not None:
+                results[i] = DryRunResult(**hit)
+
+    # the same spec appears many times in n samples
+    misses: dict[str, list[int]] = {}
+    for i, spec in enumerate(specs):
+        if i not in results:
+            misses.setdefault(spec, []).append(i)
+    todo = list(misses)
+
+    def run_chunk(chunk: list[str]) -> list[DryRunResult]:
+        if len(chunk) == 1:
+            return [_dry_run(chunk[0], mode=mode, kubectl=kubectl)]
+        return _dry_run_chunk(chunk, mode=mode, kubectl=kubectl)
+
+    chunks = [todo[start : start + batch_size] for start in range(0, len(todo), batch_size)]
+    for chunk, got in zip(chunks, tools.parallel_map(run_chunk, chunks)):
+        for spec, result in zip(chunk, got):
+            for i in misses[spec]:
+                results[i] = result
+            if store and _cacheable(version, mode):
+                store.set(spec, version, mode, asdict(result))
+
+    return [results[i] for i in range(len(specs))]
+
+
+def _dry_run_chunk(specs: list[str], mode: str, kubectl: str) -> list[DryRunResult]:
+    documents = [_load_documents(spec) for spec in specs]
+    results: list[DryRunResult | None] = [None] * len(specs)
+
+    with tools.workspace(prefix="dryrun") as tmpdir:
+        paths = {}
+        for i, (spec, docs) in enumerate(zip(specs, documents)):
+            if docs == []:
+                # kubectl refuses a run without objects, which a batch would hide
+                results[i] = DryRunResult(
+                    ok=False, stdout="", stderr="error: no objects passed to apply\n"
+                )
+                continue
+            path = Path(tmpdir) / f"{i:06d}.yaml"
+            path.write_text(spec)
+            paths[str(path)] = i
+
+        if not paths:
+            return results  # type: ignore
+
+        argv = [*shlex.split(kubectl), "apply", "-f", str(tmpdir), f"--dry-run={mode}"]
+        proc = tools.run(argv, stage_name="dryrun")
+        stderr = proc.stderr
+
+    errors, warnings = _attribute_stderr(stderr, paths, documents)
+    if proc.returncode == 0:
+        # kubectl succeeded, so whatever it said was only warnings
+        warnings = {i: errors.get(i, []) + warnings.get(i, []) for i in paths.values()}
+        errors = {}
+    elif not errors:
+        # failed without telling which file, so nothing passed
+        errors = {i: [stderr or f"kubectl exited with {proc.returncode}\n"] for i in paths.values()}
+    stdout = _attribute_stdout(proc.stdout, paths, documents)
+
+    for i in paths.values():
+        lines = errors.get(i, [])
+        results[i] = DryRunResult(
+            ok=not lines,
+            stdout="".join(stdout.get(i, [])),
+            stderr="".join(warnings.get(i, []) + lines),
+            documents=_error_documents(lines, documents[i]),
+        )
+    return results  # type: ignore
+
+
+def _attribute_stderr(
+    stderr: str, paths: dict[str, int], documents: list[list | None]
+) -> tuple[dict[int, list[str]], dict[int, list[str]]]:
+    """split kubectl's stderr into the (errors, warnings) of each spec
+
+    An error names the spec file it is about, and the lines without a file name
+    continue the previous message. Errors that name no file (e.g. connection
+    errors) concern the whole run and are copied to every spec. A warning
+    ("Warning: ...") goes to the spec it names, or else to the specs with a
+    document of the apiVersion and kind it mentions (deprecations), or else to
+    every spec. Warnings don't fail a spec.
+    """
+
+    pattern = re.compile("|".join(re.escape(p) for p in sorted(paths, key=len, reverse=True)))
+    errors: dict[int, list[str]] = {}
+    warnings: dict[int, list[str]] = {}
+    # the specs and the kind of the message that the next line continues
+    targets: list[int] = list(paths.values())
+    found = errors
+    for line in stderr.splitlines(keepends=True):
+        m = pattern.search(line)
+        if line.startswith("Warning:"):
+            found = warnings
+            if m:
+                targets = [paths[m.group(0)]]
+            else:
+                targets = [
+                    i for i in paths.values() if _mentions(line, documents[i])
+                ] or list(paths.values())
+        elif m:
+            found, targets = errors, [paths[m.group(0)]]
+        elif line.lower().startswith("error"):
+            found, targets = errors, list(paths.values())
+        for i in targets:
+            found.setdefault(i, []).append(line)
+    return errors, warnings
+
+
+def _mentions(line: str, documents: list | None) -> bool:
+    """whether line mentions the apiVersion and kind of one of documents"""
+
+    return any(
+        isinstance(doc, dict) and f"{doc.get('apiVersion')} {doc.get('kind')}" in line
+        for doc in documents or []
+    )
+
+
+def _attribute_stdout(
+    stdout: str, paths: dict[str, int], documents: list[list | None]
+) -> dict[int, list[str]]:
+    """split kubectl's stdout (`deployment.apps/web created (server dry run)`) by spec
+
+    The lines don't name the file, but kubectl applies the files in the order of
+    their names and the documents in their order, so each line goes to the next
+    document of its kind and name, the documents that failed having no line.
+    """
+
+    order = [
+        (i, kind, name)
+        for _, i in sorted(paths.items())
+        for kind, name in map(_kind_name, documents[i] or [])
+    ]
+    found: dict[int, list[str]] = {}
+    next_ = 0
+    for line in stdout.splitlines(keepends=True):
+        resource, _, rest = line.partition("/")
+        name = rest.split(" ", 1)[0]
+        kind = resource.split(".", 1)[0]
+        for k in range(next_, len(order)):
+            i, doc_kind, doc_name = order[k]
+            if doc_kind == kind and doc_name == name:
+                found.setdefault(i, []).append(line)
+                next_ = k + 1
+                break
+        else:
+            logger.debug(f"dry-run output of no document: {line.rstrip()}")
+    return found
+
+
+def _kind_name(doc: Any) -> tuple[str, str | None]:
+    if not isinstance(doc, dict):
+        return "", None
+    return str(doc.get("kind")).lower(), (doc.get("metadata") or {}).get("name")
+
+
+def _load_documents(spec: str) -> list | None:
+    """documents kubectl would see, or None when the YAML is broken"""
+
+    try:
+        return [doc for doc in yaml.safe_load_all(spec) if doc is not None]
+    except yaml.YAMLError:
+        return None
+
+
+def _error_documents(lines: list[str], documents: list | None) -> list[int]:
+    if not documents:
+        return []
+
+    def name_of(doc) -> str | None:
+        return (doc.get("metadata") or {}).get("name") if isinstance(doc, dict) else None
+
+    found: set[int] = set()
+    for line in lines:
+        for kind, name in _OBJECT_RE.findall(line):
+            candidates = [i for i, doc in enumerate(documents) if name_of(doc) == name]
+            # prefer the document of the same kind when names collide (e.g. svc and deploy)
+            same_kind = [i for i in candidates if str(documents[i].get("kind")) == kind]
+            found.update(same_kind or candidates)
+    return sorted(found)
@@ -1,12 +1,9 @@
-import subprocess
-import tempfile
+import os
 from collections import Counter
 from logging import getLogger
 from typing import Any
 
 import glom
-import joblib
-import yaml
 from langchain.chains.openai_functions import (
     convert_to_openai_function,
     get_openai_output_parser,
@@ -15,15 +12,19 @@ from langchain_core.prompt_values import PromptValue
 from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain_core.runnables import (
     Runnable,
+    RunnableConfig,
 )
 from langchain_core.runnables import (
     chain as chain_decorator,
 )
-from langchain_openai import ChatOpenAI
+
+from compose2kube import kubectl, openapi
+from compose2kube.concurrency import stage
+from compose2kube.manifest import ParsedManifest
+from compose2kube.model import ChatOpenAIMultiGenerations
 
 logger = getLogger(__name__)
-joblib_cachedir = "/tmp/joblibcache"
-memory = joblib.Memory(joblib_cachedir, compress=True)
+MICROK8S_KUBECTL = "microk8s.kubectl"
 
 # Turbo models
 GPT4_1106 = "gpt-4-1106-preview"
@@ -36,25 +37,34 @@ GPT4_0613 = "gpt-4-0613"
 GPT4o_0513 = "gpt-4o-2024-05-13"
 
 
-@memory.cache
+def _message(result: kubectl.DryRunResult) -> str:
+    return result.stdout + result.stderr
+
+
 def _dry_run(spec: str, server: bool) -> tuple[bool, str]:
-    dryrun_opt = "client"
-    if server:
-        dryrun_opt = "server"
-
-    try:
-        with tempfile.NamedTemporaryFile(
-            "w", prefix="genmani", suffix=".yaml", delete=False
-        ) as f:
-            f.write(spec)
-            f.close()
-            cmd = f"microk8s.kubectl apply -f {f.name} --dry-run={dryrun_opt}"
-            got = subprocess.check_output(
-                cmd, shell=True, universal_newlines=True, stderr=subprocess.STDOUT
-            )
-            return True, got
-    except subprocess.CalledProcessError as e:
-        return False, e.output
+    result = kubectl.dry_run(
+        spec, mode="server" if server else "client", kubectl=MICROK8S_KUBECTL
+    )
+    return result.ok, _message(result)
+
+
+def _client_validator() -> openapi.SchemaValidator | None:
+    """in-process replacement of the client dry-run, enabled by K8S_OPENAPI_VERSION"""
+
+    version = os.environ.get("K8S_OPENAPI_VERSION")
+    return openapi.SchemaValidator.for_version(version) if version else None
+
+
+def _dry_run_batch(specs: list[str], server: bool) -> list[tuple[bool, str]]:
+    """`_dry_run` for many specs in one kubectl process"""
+
+    if not server and (validator := _client_validator()):
+        return [validator.validate(spec) for spec in specs]
+
+    results = kubectl.dry_run_batch(
+        specs, mode="server" if server else "client", kubectl=MICROK8S_KUBECTL
+    )
+    return [(result.ok, _message(result)) for result in results]
 
 
 class Manifests(BaseModel):
@@ -75,10 +85,15 @@ class Manifests(BaseModel):
 
         return "\n---\n".join(self.manifests)
 
-    def feature(self) -> dict[str, Any]:
+    def feature(
+        self,
+        client: tuple[bool, str] | None = None,
+        server: tuple[bool, str] | None = None,
+    ) -> dict[str, Any]:
         # マニフェストの特徴抽出
-        dry_run_client_success, client_msg = self.dry_run(False)
-        dry_run_server_success, server_msg = self.dry_run(True)
+        # client, server: dry-run results when they are already known
+        dry_run_client_success, client_msg = client or self.dry_run(False)
+        dry_run_server_success, server_msg = server or self.dry_run(True)
         line_length = len(self.join().splitlines())
         return dict(
             line_length=line_length,
@@ -89,17 +104,33 @@ class Manifests(BaseModel):
             **self.count(),
         )
 
+    @staticmethod
+    def features(manifests: list["Manifests"]) -> list[dict[str, Any]]:
+        """feature() of many manifests with batched dry-runs"""
+
+        specs = [m.join() for m in manifests]
+        clients = _dry_run_batch(specs, server=False)
+        servers = _dry_run_batch(specs, server=True)
+        return [m.feature(c, s) for m, c, s in zip(manifests, clients, servers)]
+
+    def parsed(self) -> ParsedManifest:
+        """join() parsed once, shared by count() and the diffing in evaluator.report"""
+        return ParsedManifest.of(self.join())
+
     def dry_run(self, server: bool) -> tuple[bool, str]:
+        if not server and (validator := _client_validator()):
+            return validator.validate(self.join())
         return _dry_run(spec=self.join(), server=server)
 
     def count(self) -> dict[str, int]:
         # count api objects
         api_objects = []
         try:
-            api_objects = list(yaml.full_load_all(self.join()))
+            api_objects = self.parsed().documents
         except Exception as e:
             logger.error(e)
-        api_objects = filter(lambda x: x is not None, api_objects)
+        # a list, not a filter: it is iterated twice below
+        api_objects = [x for x in api_objects if x is not None]
 
         kinds: list[str] = [
             api.get("kind") for api in api_objects if isinstance(api, dict)
@@ -156,7 +187,7 @@ def make_llm_runnable(tools, n: int, model: str, seed=1) -> Runnable:
     """use generate() instead of .invoke() to get n>1 generations"""
 
     openai_functions = [convert_to_openai_function(f) for f in tools]
-    llm2 = ChatOpenAI(
+    llm2 = ChatOpenAIMultiGenerations(
         model=model,
         cache=True,
         temperature=0.8,
@@ -172,10 +203,11 @@ def make_llm_runnable(tools, n: int, model: str, seed=1) -> Runnable:
     output_parser = get_openai_output_parser(tools)
 
     @chain_decorator
-    def myllm(text: PromptValue) -> list[Manifests]:
+    def myllm(text: PromptValue, config: RunnableConfig) -> list[Manifests]:
         msgs = text.to_messages()
 
-        llmresult = llm2.generate([msgs])
+        with stage("llm"):
+            llmresult = llm2.generate([msgs], callbacks=config.get("callbacks"))
         messages = [gen.message for gen in llmresult.generations[0]]  # type: ignore
 
         parsed = []
@@ -0,0 +1,93 @@
+from functools import cached_property, lru_cache
+from typing import Any, Iterator
+
+import yaml
+
+# not CSafeLoader: its error messages differ, and they end up in the judgements
+
+
+class _Loader(yaml.SafeLoader):
+    """SafeLoader that remembers whether a mapping has duplicated keys"""
+
+    duplicated = False
+
+    def construct_mapping(self, node, deep=False):
+        keys = [(k.tag, k.value) for k, _ in node.value if isinstance(k, yaml.ScalarNode)]
+        if len(keys) != len(set(keys)):
+            self.duplicated = True
+        return super().construct_mapping(node, deep=deep)
+
+
+class ParsedManifest(str):
+    """a multi-document YAML string that is parsed at most once
+
+    It is a str, so it goes anywhere a manifest string goes (prompts, dry-run,
+    `splitlines()`), while features, judges and diffing share its documents.
+    Use `ParsedManifest.of()` so that equal strings share one parse.
+    """
+
+    @classmethod
+    def of(cls, text: str) -> "ParsedManifest":
+        if isinstance(text, ParsedManifest):
+            return text
+        return _parse(str(text))
+
+    def __reduce__(self):
+        # don't pickle the parsed documents
+        return (_parse, (str(self),))
+
+    @cached_property
+    def _loaded(self) -> tuple[list[Any], Exception | None, bool]:
+        docs: list[Any] = []
+        loader = _Loader(str(self))
+        try:
+            while loader.check_data():
+                docs.append(loader.get_data())
+        except Exception as e:
+            return docs, e, loader.duplicated
+        finally:
+            loader.dispose()
+        return docs, None, loader.duplicated
+
+    @property
+    def error(self) -> Exception | None:
+        """the parse error, if any"""
+        return self._loaded[1]
+
+    @property
+    def has_duplicated_keys(self) -> bool:
+        return self._loaded[2]
+
+    def iter_documents(self) -> Iterator[Any]:
+        """same as iterating `yaml.safe_load_all()`: the documents, then the parse error"""
+
+        docs, error, _ = self._loaded
+        yield from docs
+        if error is not None:
+            raise error
+
+    @property
+    def documents(self) -> list[Any]:
+        """same as `list(yaml.safe_load_all())`, including None for empty documents"""
+        return list(self.iter_documents())
+
+    @cached_property
+    def objects(self) -> list[dict]:
+        """API objects parsed before any error"""
+        return [doc for doc in self._loaded[0] if isinstance(doc, dict)]
+
+    @cached_property
+    def index(self) -> dict[tuple[str, str], dict]:
+        """(kind, metadata.name) -> the first API object"""
+
+        index: dict[tuple[str, str], dict] = {}
+        for obj in self.objects:
+            meta = obj.get("metadata")
+            name = meta.get("name") if isinstance(meta, dict) else None
+            index.setdefault((str(obj.get("kind")), str(name)), obj)
+        return index
+
+
+@lru_cache(maxsize=4096)
+def _parse(text: str) -> ParsedManifest:
+    return ParsedManifest(text)
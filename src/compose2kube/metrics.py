@@ -0,0 +1,170 @@
+"""Where a benchmark run spends its time, without a tracing backend.
+
+`MetricsHandler` is a langchain callback handler. Pass it in the callbacks of a
+run, and it sums up, for each stage, the runs, errors, wall time, prompt and
+completion tokens and cache hits. Runs are assigned to stages by their name:
+prompt rendering, LLM calls, output parsing, kompose, dry-run, the rule judges
+and the LLM grader. `summary()` adds the time spent waiting for a stage slot
+(concurrency.queue_stats) and the external tool latency (tools.stats), and it
+can be written as JSON or as Prometheus text.
+"""
+
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass
+from logging import getLogger
+from pathlib import Path
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from compose2kube import concurrency, tools
+
+logger = getLogger(__name__)
+
+# run name -> stage, for the runs that aren't prompts, parsers or models
+STAGES = {
+    "convert_by_kompose": "kompose",
+    "kompose": "kompose",
+    "dryrun_batch": "dryrun",
+    "dryrun_str": "dryrun",
+    "grade_by_function": "judge",
+    "chain_grader": "grader",
+    "chain_batch_grader": "grader",
+    "report": "report",
+}
+
+
+def stage_of(name: str) -> str | None:
+    """the stage of a chain run, None for the runs that only compose others"""
+
+    if name.endswith("PromptTemplate"):
+        return "prompt"
+    if name.endswith("Parser") or name == "grader parser":
+        return "parse"
+    return STAGES.get(name)
+
+
+@dataclass
+class StageMetrics:
+    runs: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cache_hits: int = 0
+    # the tokens the cache hits would have cost
+    cached_tokens: int = 0
+
+
+class MetricsHandler(BaseCallbackHandler):
+    """per-stage metrics of the runs it is a callback of"""
+
+    def __init__(self) -> None:
+        self.stages: dict[str, StageMetrics] = {}
+        self._started: dict[UUID, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, stage: str | None) -> None:
+        if stage is not None:
+            with self._lock:
+                self._started[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id: UUID, error: bool = False) -> StageMetrics | None:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started is None:
+                return None
+            stage, start = started
+            seconds = time.perf_counter() - start
+            m = self.stages.setdefault(stage, StageMetrics())
+            m.runs += 1
+            m.errors += error
+            m.seconds += seconds
+            m.max_seconds = max(m.max_seconds, seconds)
+            return m
+
+    def on_chain_start(
+        self, serialized: dict[str, Any], inputs: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        if name is None and serialized and serialized.get("id"):
+            name = serialized["id"][-1]
+        self._start(run_id, stage_of(str(name)))
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=True)
+
+    def on_llm_start(
+        self, serialized: dict[str, Any], prompts: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._start(run_id, "llm")
+
+    def on_chat_model_start(
+        self, serialized: dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._start(run_id, "llm")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get("token_usage")
+        # a cached result has no llm_output. ChatOpenAIMultiGenerations keeps the
+        # usage of the request in its first generation
+        cached = response.llm_output is None
+        if cached:
+            first = response.generations[0][0] if response.generations[0] else None
+            usage = ((first and first.generation_info) or {}).get("token_usage")
+        usage = usage or {}
+        m = self._end(run_id)
+        if m is None:
+            return
+        with self._lock:
+            if cached:
+                m.cache_hits += 1
+                m.cached_tokens += usage.get("total_tokens", 0)
+            else:
+                m.prompt_tokens += usage.get("prompt_tokens", 0)
+                m.completion_tokens += usage.get("completion_tokens", 0)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=True)
+
+    def summary(self) -> dict[str, Any]:
+        """{stages: {stage: metrics}, tools: tools.stats()}"""
+
+        with self._lock:
+            stages = {name: dict(asdict(m), queue_seconds=0.0) for name, m in self.stages.items()}
+        for name, queued in concurrency.queue_stats().items():
+            empty = asdict(StageMetrics())
+            stages.setdefault(name, empty)["queue_seconds"] = queued["queue_seconds"]
+        return dict(stages=dict(sorted(stages.items())), tools=tools.stats())
+
+    def write(self, path: str | Path) -> None:
+        """the summary as Prometheus text for a .prom path, JSON otherwise"""
+
+        summary = self.summary()
+        text = to_prometheus(summary) if str(path).endswith(".prom") else json.dumps(summary)
+        Path(path).write_text(text)
+
+
+def to_prometheus(summary: dict[str, Any]) -> str:
+    """a summary() in the Prometheus text exposition format"""
+
+    lines: list[str] = []
+    groups = [("stage", "c2k_stage", summary["stages"]), ("tool", "c2k_tool", summary["tools"])]
+    for label, prefix, metrics in groups:
+        fields = sorted({field for m in metrics.values() for field in m})
+        for field in fields:
+            name = f"{prefix}_{field}"
+            kind = "gauge" if field.startswith(("max_", "mean_")) else "counter"
+            lines.append(f"# TYPE {name} {kind}")
+            for key, m in metrics.items():
+                if field in m:
+                    lines.append(f'{name}{{{label}="{key}"}} {float(m[field]):g}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,231 @@
+"""Microbenchmarks of the grading hot paths that don't call an LLM.
+
+Synthetic LLM outputs and manifests of 1 to 200 services (a Deployment and a
+Service each, spread over several fenced blocks) are timed through the output
+parser, `_join_manifests`, `Manifests.count`/`feature`, `evaluator.report` and
+the rule judges. The caches of parsed manifests are cleared before each call,
+and the kubectl dry-runs are stubbed out: their cost is kubectl's, recorded by
+tools.stats(). The import time of the CLI and the main modules, and the time
+of `python -m compose2kube --help`, are measured in new interpreters.
+
+    python -m compose2kube.microbench --save      # record a baseline
+    python -m compose2kube.microbench             # compare with it
+
+The best of `repeat` runs is compared with the baseline, and a case slower by
+more than `threshold` times is reported as a regression (exit status 1).
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Callable, Iterable
+from unittest.mock import patch
+
+import yaml
+
+SIZES = (1, 10, 50, 200)
+IMPORTS = (
+    "compose2kube",
+    "compose2kube.__main__",
+    "compose2kube.evaluator",
+    "compose2kube.benchmark.benchmark",
+)
+BASELINE = Path("microbench-baseline.json")
+THRESHOLD = 1.25
+
+
+def synthetic_manifest(services: int, variant: int = 0) -> str:
+    """a Deployment and a Service per service. variant changes some fields"""
+
+    docs: list[dict] = []
+    for i in range(services):
+        name = f"svc{i}"
+        container = {
+            "name": name,
+            "image": f"registry.example.com/{name}:{1 + (i + variant) % 3}",
+            "ports": [{"containerPort": 8000 + i}],
+            "env": [{"name": f"VAR{j}", "value": str(j * (1 + variant))} for j in range(4)],
+            "livenessProbe": {"httpGet": {"path": "/health", "port": 8000 + i}},
+            "resources": {"limits": {"cpu": "500m", "memory": "256Mi"}},
+        }
+        docs.append(
+            {
+                "apiVersion": "apps/v1",
+                "kind": "StatefulSet" if i % 5 == 0 else "Deployment",
+                "metadata": {"name": name, "labels": {"app": name}},
+                "spec": {
+                    "replicas": 1 + variant % 2,
+                    "selector": {"matchLabels": {"app": name}},
+                    "template": {
+                        "metadata": {"labels": {"app": name}},
+                        "spec": {"containers": [container]},
+                    },
+                },
+            }
+        )
+        ports = [{"port": 80, "targetPort": 8000 + i}]
+        docs.append(
+            {
+                "apiVersion": "v1",
+                "kind": "Service",
+                "metadata": {"name": name},
+                "spec": {"selector": {"app": name}, "ports": ports},
+            }
+        )
+    return yaml.safe_dump_all(docs, sort_keys=False)
+
+
+def synthetic_output(services: int, blocks: int = 3, variant: int = 0) -> str:
+    """an LLM answer: prose around the manifest split into fenced blocks"""
+
+    docs = synthetic_manifest(services, variant).split("---\n")
+    blocks = max(1, min(blocks, len(docs)))
+    size = -(-len(docs) // blocks)
+    parts = ["Here are the Kubernetes manifests for the compose file.\n"]
+    for b in range(blocks):
+        chunk = "---\n".join(docs[b * size : (b + 1) * size])
+        parts.append(f"{b + 1}. Part {b + 1}:\n\n```yaml\n{chunk.strip()}\n```\n")
+    parts.append("Apply them with `kubectl apply -f`.\n")
+    return "\n".join(parts)
+
+
+def _clear_caches() -> None:
+    from compose2kube import distance, manifest
+
+    manifest._parse.cache_clear()
+    distance._profile.cache_clear()
+
+
+def cases(size: int) -> dict[str, Callable[[], Any]]:
+    """name -> a call to time, on inputs of size services"""
+
+    from compose2kube import evaluator
+    from compose2kube.benchmark.benchmark import _join_manifests
+    from compose2kube.benchmark.grader import rule
+    from compose2kube.benchmark.parser import MDCodeBlockOutputParser
+    from compose2kube.llm import Manifests
+
+    parser = MDCodeBlockOutputParser()
+    output = synthetic_output(size)
+    text = synthetic_manifest(size)
+    docs = list(yaml.safe_load_all(text))
+    answer = Manifests(manifests=[text])
+    generates = [Manifests(manifests=[synthetic_manifest(size, variant=v)]) for v in range(1, 4)]
+    found: dict[str, Callable[[], Any]] = {
+        "parse": lambda: parser.parse(output),
+        "join_manifests/dict": lambda: _join_manifests(docs),
+        "join_manifests/str": lambda: _join_manifests(text.split("---\n")),
+        "count": lambda: answer.count(),
+        "feature": lambda: answer.feature((True, ""), (True, "")),
+        "report": lambda: evaluator.report.invoke(dict(answer=answer, generates=generates)),
+    }
+    for name, _, judge in rule.INPUTS_JUDGES:
+        found[f"judge/{name}"] = lambda judge=judge: judge(text)
+    return found
+
+
+def _python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True)
+
+
+def import_time(module: str) -> float:
+    """seconds to import module in a new interpreter, by -X importtime"""
+
+    proc = _python("-X", "importtime", "-c", f"import {module}")
+    if proc.returncode != 0:
+        raise RuntimeError(f"failed to import {module}: {proc.stderr[-1000:]}")
+    for line in proc.stderr.splitlines():
+        _, _, fields = line.partition("import time:")
+        parts = fields.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1e6
+    raise RuntimeError(f"{module} was imported already: {proc.stderr[-1000:]}")
+
+
+def cli_time() -> float:
+    """seconds of `python -m compose2kube --help`, startup of the interpreter included"""
+
+    start = time.perf_counter()
+    _python("-m", "compose2kube", "--help").check_returncode()
+    return time.perf_counter() - start
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        _clear_caches()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(
+    sizes: Iterable[int] = SIZES, repeat: int = 5, only: str | None = None
+) -> dict[str, float]:
+    """"case@size" -> the best seconds of repeat calls"""
+
+    from compose2kube import llm
+
+    results = {}
+    with ExitStack() as stack:
+        # the dry-runs of feature() and report()
+        stack.enter_context(
+            patch.object(llm, "_dry_run_batch", lambda specs, server: [(True, "")] * len(specs))
+        )
+        for size in sizes:
+            for name, fn in cases(size).items():
+                if only is None or only in f"{name}@{size}":
+                    results[f"{name}@{size}"] = _time(fn, repeat)
+    startup: dict[str, Callable[[], float]] = {"cli/--help": cli_time}
+    startup |= {f"import/{m}": lambda m=m: import_time(m) for m in IMPORTS}
+    for name, measure in startup.items():
+        if only is None or only in name:
+            results[name] = min(measure() for _ in range(repeat))
+    return results
+
+
+def compare(
+    results: dict[str, float], baseline: dict[str, float], threshold: float = THRESHOLD
+) -> dict[str, float]:
+    """"case@size" -> how many times slower than the baseline, for the regressions"""
+
+    return {
+        case: seconds / baseline[case]
+        for case, seconds in results.items()
+        if baseline.get(case) and seconds / baseline[case] > threshold
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="compose2kube.microbench", description=__doc__)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="write the results as the baseline")
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--only", default=None, help="the cases whose name contains this")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat, args.only)
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    for case, seconds in results.items():
+        ratio = f"{seconds / baseline[case]:6.2f}x" if baseline.get(case) else "      -"
+        print(f"{case:40s} {seconds * 1000:10.3f} ms {ratio}")
+
+    if args.save:
+        args.baseline.write_text(json.dumps(baseline | results, indent=2, sort_keys=True))
+        print(f"wrote {args.baseline}")
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for case, ratio in regressions.items():
+        print(f"REGRESSION {case}: {ratio:.2f}x the baseline", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,58 @@
 import unittest
-from typing import Any, List, Optional, cast
+from typing import Any, Iterator, List, Optional, cast
 from unittest.mock import patch
 
+from langchain_core.callbacks import CallbackManager
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache
 from langchain_core.language_models.base import LanguageModelInput
+from langchain_core.load import dumpd, dumps
 from langchain_core.messages.base import BaseMessage
+from langchain_core.outputs import ChatResult, LLMResult
 from langchain_core.outputs.chat_generation import ChatGeneration
 from langchain_core.runnables import RunnableConfig, ensure_config
 from langchain_openai import ChatOpenAI
 
+from compose2kube import load_env
+from compose2kube.concurrency import astage, stage
+
+# the clients built with these models read OPENAI_API_KEY etc., maybe from .env
+load_env()
+
+
+def _messages(generations: List[Any]) -> List[BaseMessage]:
+    """the messages of the generations, with the token usage of the request in the
+    response_metadata of the first one, so that it is kept in the result logs"""
+    messages = [cast(ChatGeneration, g).message for g in generations]
+    usage = ((generations and generations[0].generation_info) or {}).get("token_usage")
+    if usage:
+        messages[0].response_metadata["token_usage"] = usage
+    return messages
+
 
 class ChatOpenAIMultiGenerations(ChatOpenAI):
+    def _sample_kwargs(self, config: RunnableConfig) -> dict[str, Any]:
+        """the seed of round `sample` (configurable) of sampling, see benchmark.adaptive
+
+        Round 0 keeps the seed of model_kwargs, and the requests and cache keys of
+        the runs that don't sample in rounds.
+        """
+        sample = config.get("configurable", {}).get("sample", 0)
+        seed = self.model_kwargs.get("seed")
+        if not sample or seed is None:
+            return {}
+        return {"seed": seed + sample}
+
+    def _create_chat_result(self, response: Any) -> ChatResult:
+        # the token usage of the request goes in the generation_info of its first
+        # generation too, because llm_output isn't cached
+        result = super()._create_chat_result(response)
+        if result.generations and result.llm_output:
+            info = result.generations[0].generation_info or {}
+            info["token_usage"] = result.llm_output.get("token_usage", {})
+            result.generations[0].generation_info = info
+        return result
+
     def invoke(
         self,
         input: LanguageModelInput,
@@ -19,13 +62,166 @@ class ChatOpenAIMultiGenerations(ChatOpenAI):
         **kwargs: Any,
     ) -> List[BaseMessage]:
         config = ensure_config(config)
-        gens = self.generate_prompt(
-            [self._convert_input(input)],
-            stop=stop,
-            callbacks=config.get("callbacks"),
-            tags=config.get("tags"),
-            metadata=config.get("metadata"),
-            run_name=config.get("run_name"),
-            **kwargs,
-        ).generations[0]
-        return [cast(ChatGeneration, g).message for g in gens]
+        kwargs = {**self._sample_kwargs(config), **kwargs}
+        with stage("llm"):
+            gens = self.generate_prompt(
+                [self._convert_input(input)],
+                stop=stop,
+                callbacks=config.get("callbacks"),
+                tags=config.get("tags"),
+                metadata=config.get("metadata"),
+                run_name=config.get("run_name"),
+                **kwargs,
+            ).generations[0]
+        return _messages(gens)
+
+    async def ainvoke(
+        self,
+        input: LanguageModelInput,
+        config: Optional[RunnableConfig] = None,
+        *,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[BaseMessage]:
+        config = ensure_config(config)
+        kwargs = {**self._sample_kwargs(config), **kwargs}
+        async with astage("llm"):
+            llm_result = await self.agenerate_prompt(
+                [self._convert_input(input)],
+                stop=stop,
+                callbacks=config.get("callbacks"),
+                tags=config.get("tags"),
+                metadata=config.get("metadata"),
+                run_name=config.get("run_name"),
+                **kwargs,
+            )
+        return _messages(llm_result.generations[0])
+
+    def _cache(self) -> BaseCache | None:
+        if isinstance(self.cache, BaseCache):
+            return self.cache
+        return get_llm_cache() if self.cache or self.cache is None else None
+
+    def stream_generations(
+        self,
+        input: LanguageModelInput,
+        config: Optional[RunnableConfig] = None,
+        *,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> Iterator[tuple[int, str]]:
+        """(index of the generation, its new text) as the n generations are streamed
+
+        The text is the content, or the arguments of the function call. The LLM
+        cache is looked up and updated like invoke() does it, and the generations
+        of a cache hit come whole.
+        """
+        config = ensure_config(config)
+        kwargs = {**self._sample_kwargs(config), **kwargs}
+        messages = self._convert_input(input).to_messages()
+        callback_manager = CallbackManager.configure(
+            config.get("callbacks"),
+            self.callbacks,
+            self.verbose,
+            config.get("tags"),
+            self.tags,
+            config.get("metadata"),
+            self.metadata,
+        )
+        (run_manager,) = callback_manager.on_chat_model_start(
+            dumpd(self),
+            [messages],
+            invocation_params=self._get_invocation_params(stop=stop, **kwargs),
+            options={"stop": stop},
+            name=config.get("run_name"),
+            batch_size=1,
+        )
+        llm_cache = self._cache()
+        prompt, llm_string = dumps(messages), self._get_llm_string(stop=stop, **kwargs)
+        cached = llm_cache.lookup(prompt, llm_string) if llm_cache else None
+        if isinstance(cached, list):
+            for i, generation in enumerate(cached):
+                yield i, _text(cast(ChatGeneration, generation).message)
+            run_manager.on_llm_end(LLMResult(generations=[cached]))
+            return
+
+        message_dicts, params = self._create_message_dicts(messages, stop)
+        params = {**params, **kwargs, "stream": True, "stream_options": {"include_usage": True}}
+        stream = _StreamedCompletion()
+        try:
+            with stage("llm"):
+                for chunk in self.client.create(messages=message_dicts, **params):
+                    for index, text in stream.add(chunk.model_dump()):
+                        run_manager.on_llm_new_token(text)
+                        yield index, text
+        except BaseException as e:
+            run_manager.on_llm_error(e, response=LLMResult(generations=[]))
+            raise
+        result = self._create_chat_result(stream.response())
+        if llm_cache:
+            llm_cache.update(prompt, llm_string, result.generations)
+        run_manager.on_llm_end(
+            LLMResult(generations=[result.generations], llm_output=result.llm_output)
+        )
+
+
+def _text(message: BaseMessage) -> str:
+    """the content of a message, or the arguments of its function call"""
+
+    kwargs = message.additional_kwargs
+    if call := kwargs.get("function_call"):
+        return call.get("arguments", "")
+    if calls := kwargs.get("tool_calls"):
+        return calls[0]["function"].get("arguments", "")
+    return cast(str, message.content)
+
+
+class _StreamedCompletion:
+    """the chunks of a streamed chat completion, put together as the completion"""
+
+    def __init__(self) -> None:
+        self.choices: dict[int, dict[str, Any]] = {}
+        self.usage: dict[str, int] = {}
+
+    def add(self, chunk: dict[str, Any]) -> Iterator[tuple[int, str]]:
+        """(index of the choice, its new text) of a chunk"""
+
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+        for delta_choice in chunk["choices"]:
+            index, delta = delta_choice["index"], delta_choice["delta"]
+            choice = self.choices.setdefault(
+                index, dict(index=index, message=dict(role="assistant"), logprobs=None)
+            )
+            choice["finish_reason"] = delta_choice.get("finish_reason")
+            message = choice["message"]
+            if text := delta.get("content"):
+                message["content"] = message.get("content", "") + text
+                yield index, text
+            if call := delta.get("function_call"):
+                if text := self._extend(message.setdefault("function_call", {}), call):
+                    yield index, text
+            for tool in delta.get("tool_calls") or []:
+                calls = message.setdefault("tool_calls", [])
+                if tool["index"] == len(calls):
+                    calls.append(dict(id=tool.get("id"), type="function", function={}))
+                text = self._extend(calls[tool["index"]]["function"], tool.get("function") or {})
+                # the text is the arguments of the first tool call
+                if text and tool["index"] == 0:
+                    yield index, text
+
+    @staticmethod
+    def _extend(call: dict[str, str], delta: dict[str, Any]) -> str:
+        """adds the delta to a function call, and returns the new arguments"""
+
+        if delta.get("name"):
+            call["name"] = call.get("name", "") + delta["name"]
+        text = delta.get("arguments") or ""
+        call["arguments"] = call.get("arguments", "") + text
+        return text
+
+    def response(self) -> dict[str, Any]:
+        choices = [choice for _, choice in sorted(self.choices.items())]
+        for choice in choices:
+            choice["message"].setdefault("content", None)
+        return dict(choices=choices, usage=self.usage)
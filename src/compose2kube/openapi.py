@@ -0,0 +1,242 @@
+"""In-process client-side validation of Kubernetes manifests.
+
+The checks follow the ones kubectl runs against the OpenAPI (swagger v2) schema
+before `apply --dry-run=client`: unknown fields, missing required fields and
+primitive types, so that the result can stand in for a client dry-run without
+kubectl or a cluster.
+"""
+
+import datetime
+import json
+import urllib.request
+from functools import lru_cache
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Callable
+
+from compose2kube.manifest import ParsedManifest
+
+logger = getLogger(__name__)
+
+SCHEMA_URL = (
+    "https://raw.githubusercontent.com/kubernetes/kubernetes"
+    "/v{version}/api/openapi-spec/swagger.json"
+)
+SCHEMA_CACHE_DIR = Path("/tmp/k8s-openapi")
+
+# (value, path, errors) -> None
+Check = Callable[[Any, str, list[str]], None]
+
+# YAML timestamps are plain strings to kubectl
+_JSON_TYPES = {
+    bool: "boolean",
+    int: "integer",
+    float: "number",
+    str: "string",
+    datetime.date: "string",
+    datetime.datetime: "string",
+}
+
+
+def load_swagger(version: str) -> dict:
+    """load swagger.json of the given kubernetes version, downloading it on first use"""
+
+    path = SCHEMA_CACHE_DIR / version / "swagger.json"
+    if not path.exists():
+        url = SCHEMA_URL.format(version=version.removeprefix("v"))
+        logger.info(f"download {url}")
+        with urllib.request.urlopen(url) as res:
+            body = res.read()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(body)
+    return json.loads(path.read_text())
+
+
+def _type_of(value: Any) -> str:
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, list):
+        return "array"
+    return _JSON_TYPES.get(type(value), type(value).__name__)
+
+
+class SchemaValidator:
+    """validate parsed documents against precompiled per-kind checks"""
+
+    def __init__(self, swagger: dict):
+        self.definitions: dict[str, dict] = swagger.get("definitions", {})
+        self._compiled: dict[str, Check] = {}
+        # (apiVersion, kind) -> definition name
+        self.kinds: dict[tuple[str, str], str] = {}
+        for name, schema in self.definitions.items():
+            for gvk in schema.get("x-kubernetes-group-version-kind", []):
+                group, version = gvk.get("group", ""), gvk["version"]
+                api_version = f"{group}/{version}" if group else version
+                self.kinds[(api_version, gvk["kind"])] = name
+
+    @classmethod
+    @lru_cache
+    def for_version(cls, version: str) -> "SchemaValidator":
+        return cls(load_swagger(version))
+
+    def validate(self, spec: str) -> tuple[bool, str]:
+        """validate a multi-document YAML string. the same shape as `llm._dry_run`"""
+
+        # parsed as kubectl does, which rejects the duplicated keys of a mapping
+        manifest = ParsedManifest.of(spec)
+        parse_error = "error: error parsing STDIN: error converting YAML to JSON: yaml:"
+        if manifest.error is not None:
+            msg = str(manifest.error).replace("\n", " ")
+            return False, f"{parse_error} {msg}\n"
+        if manifest.has_duplicated_keys:
+            return False, f"{parse_error} unmarshal errors: a key is already set in a map\n"
+        documents = [doc for doc in manifest.documents if doc is not None]
+        if not documents:
+            return False, "error: no objects passed to apply\n"
+
+        ok = True
+        lines = []
+        for doc in documents:
+            errors = self.validate_document(doc)
+            if errors:
+                ok = False
+                lines.append(
+                    'error: error validating "STDIN": error validating data: '
+                    f"[{', '.join(errors)}]; if you choose to ignore these errors, "
+                    "turn validation off with --validate=false"
+                )
+            else:
+                kind = doc["kind"]
+                group = str(doc["apiVersion"]).rpartition("/")[0]
+                resource = f"{kind.lower()}.{group}" if group else kind.lower()
+                name = (doc.get("metadata") or {}).get("name", "")
+                lines.append(f"{resource}/{name} created (dry run)")
+        return ok, "\n".join(lines) + "\n"
+
+    def validate_document(self, doc: Any) -> list[str]:
+        """return the validation errors of one API object"""
+
+        if not isinstance(doc, dict):
+            return [f"invalid object to validate: got {_type_of(doc)}"]
+
+        errors = []
+        api_version, kind = doc.get("apiVersion"), doc.get("kind")
+        if not api_version:
+            errors.append("apiVersion not set")
+        if not kind:
+            errors.append("kind not set")
+        if errors:
+            return errors
+
+        name = self.kinds.get((str(api_version), str(kind)))
+        if name is None:
+            return [f'no matches for kind "{kind}" in version "{api_version}"']
+        self._ref(name)(doc, str(kind), errors)
+        return errors
+
+    def _ref(self, name: str) -> Check:
+        check = self._compiled.get(name)
+        if check is None:
+            # placeholder for the recursive definitions like JSONSchemaProps
+            self._compiled[name] = lambda v, p, e: self._compiled[name](v, p, e)
+            check = self._compiled[name] = self._compile(self.definitions.get(name, {}), name)
+        return check
+
+    def _compile(self, schema: dict, name: str) -> Check:
+        if "$ref" in schema:
+            return self._ref(schema["$ref"].rpartition("/")[2])
+        if "allOf" in schema:
+            return self._compile(schema["allOf"][0], name)
+        if schema.get("x-kubernetes-preserve-unknown-fields"):
+            return _accept
+
+        match schema.get("type"):
+            case "object" if "properties" in schema:
+                return self._compile_kind(schema, name)
+            case "object" if isinstance(schema.get("additionalProperties"), dict):
+                return _compile_map(self._compile(schema["additionalProperties"], name))
+            case "object":
+                return _compile_map(_accept)
+            case "array":
+                return _compile_array(self._compile(schema.get("items", {}), name))
+            case "string" | "integer" | "number" | "boolean" as typ:
+                return _compile_primitive(typ, name)
+            case _:
+                return _accept
+
+    def _compile_kind(self, schema: dict, name: str) -> Check:
+        fields = {k: self._compile(v, f"{name}.{k}") for k, v in schema["properties"].items()}
+        required = schema.get("required", [])
+
+        def check(value: Any, path: str, errors: list[str]) -> None:
+            if not isinstance(value, dict):
+                errors.append(
+                    f"ValidationError({path}): invalid type for {name}: "
+                    f'got "{_type_of(value)}", expected "map"'
+                )
+                return
+            for key, child in value.items():
+                field = fields.get(key)
+                if field is None:
+                    errors.append(f'ValidationError({path}): unknown field "{key}" in {name}')
+                elif child is not None:
+                    field(child, f"{path}.{key}", errors)
+            for key in required:
+                if key not in value:
+                    errors.append(
+                        f'ValidationError({path}): missing required field "{key}" in {name}'
+                    )
+
+        return check
+
+
+def _accept(value: Any, path: str, errors: list[str]) -> None:
+    pass
+
+
+def _compile_map(values: Check) -> Check:
+    def check(value: Any, path: str, errors: list[str]) -> None:
+        if not isinstance(value, dict):
+            errors.append(
+                f'ValidationError({path}): invalid type: got "{_type_of(value)}", expected "map"'
+            )
+            return
+        for key, child in value.items():
+            if child is not None:
+                values(child, f"{path}.{key}", errors)
+
+    return check
+
+
+def _compile_array(items: Check) -> Check:
+    def check(value: Any, path: str, errors: list[str]) -> None:
+        if not isinstance(value, list):
+            errors.append(
+                f'ValidationError({path}): invalid type: got "{_type_of(value)}", expected "array"'
+            )
+            return
+        for i, child in enumerate(value):
+            if child is not None:
+                items(child, f"{path}[{i}]", errors)
+
+    return check
+
+
+def _compile_primitive(typ: str, name: str) -> Check:
+    # same leniency as kubectl: any primitive can be a string, an integer can be a number
+    accepted = {
+        "string": ("string", "integer", "number", "boolean"),
+        "integer": ("integer", "number"),
+        "number": ("integer", "number"),
+        "boolean": ("boolean",),
+    }[typ]
+
+    def check(value: Any, path: str, errors: list[str]) -> None:
+        actual = _type_of(value)
+        if actual not in accepted:
+            errors.append(
+                f"ValidationError({path}): invalid type for {name}: "
+                f'got "{actual}", expected "{typ}"'
+            )
+
+    return check
@@ -0,0 +1,258 @@
+"""Result logs as a columnar Parquet table, for analysis.
+
+The records of a run are nested (messages, Documents, Judgements, lists per
+sample), so plotting anything meant loading and reshaping all of them. Here
+they are flattened into one row per sample, typed by SCHEMA:
+
+- input, method, model, key, round, sample: which sample of which work unit
+- judge_ok, dryrun_ok, client_dryrun_ok, grader_decision, distance: its grades
+- line_length, livenessProbe, readinessProbe, n_containers, kinds: the features
+  of Manifests.feature, with the count of the objects of each kind in kinds
+- prompt_tokens, completion_tokens, seconds: of the whole work unit, the same on
+  each of its rows; sum them over the distinct keys
+- text, manifest, grader_explanation: the raw texts, read only when asked for
+
+The records of benchmark.astream_convert_grade (and workqueue merge) and of
+evaluator.astream_evaluate are both read; what a record doesn't have is null.
+read() maps the file, reads only the given columns and skips the row groups
+that its filters rule out by their statistics:
+
+    read("/tmp/benchmark.parquet", ["method", "judge_ok"], [("model", "=", "gpt-4o")])
+
+    python -m compose2kube.results /tmp/benchmark.jsonl /tmp/benchmark.parquet
+"""
+
+import argparse
+import json
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from compose2kube.runlog import ResultLog
+
+ROW_GROUP_SIZE = 10_000
+
+SCHEMA = pa.schema(
+    [
+        ("input", pa.string()),
+        ("method", pa.string()),
+        ("model", pa.string()),
+        ("key", pa.string()),
+        ("round", pa.int32()),
+        ("sample", pa.int32()),
+        ("judge_ok", pa.bool_()),
+        ("dryrun_ok", pa.bool_()),
+        ("client_dryrun_ok", pa.bool_()),
+        ("grader_decision", pa.string()),
+        ("distance", pa.float64()),
+        ("line_length", pa.int32()),
+        ("livenessProbe", pa.int32()),
+        ("readinessProbe", pa.int32()),
+        ("n_containers", pa.int32()),
+        ("kinds", pa.map_(pa.string(), pa.int32())),
+        ("prompt_tokens", pa.int64()),
+        ("completion_tokens", pa.int64()),
+        ("seconds", pa.float64()),
+        ("text", pa.string()),
+        ("manifest", pa.string()),
+        ("grader_explanation", pa.string()),
+    ]
+)
+
+_COUNTS = ("livenessProbe", "readinessProbe", "n_containers")
+# the features that are not counts of a kind
+_NOT_KINDS = (
+    *("line_length", *_COUNTS),
+    *("dry_run_client_success", "client_msg", "dry_run_server_success", "server_msg"),
+)
+
+
+@lru_cache
+def _input_names() -> dict[str, str]:
+    """content hash -> name of the benchmark inputs whose content no other input has
+
+    for the records written before they had the name of their input.
+    """
+
+    from compose2kube import workkey
+    from compose2kube.benchmark.grader.rule import INPUTS_JUDGES
+
+    hashes = {name: workkey.content_hash(compose) for name, compose, _ in INPUTS_JUDGES}
+    counts = Counter(hashes.values())
+    return {h: name for name, h in hashes.items() if counts[h] == 1}
+
+
+def _input_name(record: dict, key: dict) -> str | None:
+    if name := record.get("input") or key.get("name"):
+        return name
+    return _input_names().get(key.get("input"), key.get("input"))
+
+
+def _at(xs: Any, i: int) -> Any:
+    return xs[i] if isinstance(xs, list) and i < len(xs) else None
+
+
+def _text(output: Any) -> str | None:
+    """the text of a generation: a message, its function call, a Document or a str"""
+
+    if output is None or isinstance(output, str):
+        return output
+    if hasattr(output, "page_content"):
+        return output.page_content
+    if call := getattr(output, "additional_kwargs", {}).get("function_call"):
+        return call.get("arguments")
+    content = getattr(output, "content", None)
+    return content if isinstance(content, str) else None
+
+
+def _usage(outputs: Any) -> dict[str, int | None]:
+    """the tokens of the requests, kept in the first message of each (see model)"""
+
+    found = [
+        usage
+        for m in outputs or []
+        if (usage := (getattr(m, "response_metadata", None) or {}).get("token_usage"))
+    ]
+    return {
+        k: sum(usage.get(k, 0) for usage in found) if found else None
+        for k in ("prompt_tokens", "completion_tokens")
+    }
+
+
+def _features(feature: dict[str, Any]) -> dict[str, Any]:
+    """the columns of a Manifests.feature()"""
+
+    return dict(
+        line_length=feature.get("line_length"),
+        **{k: feature.get(k) for k in _COUNTS},
+        kinds={k: v for k, v in feature.items() if isinstance(k, str) and k not in _NOT_KINDS},
+    )
+
+
+def _manifest_features(manifest: str) -> dict[str, Any]:
+    """Manifests.feature() of a sample without its dry-runs, which are graded apart"""
+
+    from compose2kube.llm import Manifests
+
+    m = Manifests(manifests=[manifest])
+    return _features(dict(line_length=len(m.join().splitlines()), **m.count()))
+
+
+def benchmark_rows(record: dict) -> Iterator[dict]:
+    """the rows of a record of astream_convert_grade, one per sample"""
+
+    key = json.loads(record["key"]) if record.get("key") else {}
+    outputs = record.get("output")
+    decisions = (record.get("grade_by_model") or {}).get("model_graded")
+    unit = dict(
+        input=_input_name(record, key),
+        method=record.get("method"),
+        model=record.get("model"),
+        key=record.get("key"),
+        round=key.get("sample"),
+        seconds=record.get("seconds"),
+        **_usage(outputs),
+    )
+    for i, manifest in enumerate(record.get("output_parsed") or []):
+        decision = _at(decisions, i) or {}
+        yield dict(
+            unit,
+            sample=i,
+            judge_ok=getattr(_at(record.get("grade_by_function"), i), "ok", None),
+            dryrun_ok=getattr(_at(record.get("grade_by_dryrun"), i), "ok", None),
+            grader_decision=decision.get("decision"),
+            grader_explanation=decision.get("explanation"),
+            text=_text(_at(outputs, i)),
+            manifest=str(manifest),
+            **_manifest_features(str(manifest)),
+        )
+
+
+def evaluation_rows(record: dict) -> Iterator[dict]:
+    """the rows of a record of astream_evaluate, one per generation"""
+
+    from compose2kube.evaluator import input_name
+    from compose2kube.llm import Manifests
+
+    item = record.get("inputs") or {}
+    reports = record.get("reports") or {}
+    unit = dict(input=input_name(item["input"]), method=item.get("op"), key=record.get("key"))
+    # the features and distances are of the generations that are Manifests
+    j = 0
+    for i, generated in enumerate(item.get("generates") or []):
+        row = dict(unit, sample=i)
+        if isinstance(generated, Manifests):
+            feature = _at(reports.get("generates_features"), j) or {}
+            distance = _at(reports.get("compares_to_answer"), j) or {}
+            row.update(
+                client_dryrun_ok=feature.get("dry_run_client_success"),
+                dryrun_ok=feature.get("dry_run_server_success"),
+                distance=distance.get("distance"),
+                manifest=generated.join(),
+                **(_features(feature) if feature else {}),
+            )
+            j += 1
+        else:
+            row["text"] = str(generated)
+        yield row
+
+
+def rows(records: Iterable[dict]) -> Iterator[dict]:
+    """the rows of the records of either kind"""
+
+    for record in records:
+        if "inputs" in record and "reports" in record:
+            yield from evaluation_rows(record)
+        else:
+            yield from benchmark_rows(record)
+
+
+def to_parquet(
+    records: Iterable[dict], path: str | Path, row_group_size: int = ROW_GROUP_SIZE
+) -> int:
+    """write the rows of the records, a row group at a time. returns how many rows"""
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    batch: list[dict] = []
+    with pq.ParquetWriter(path, SCHEMA) as writer:
+        for row in rows(records):
+            batch.append(row)
+            if len(batch) == row_group_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=SCHEMA))
+                count, batch = count + len(batch), []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=SCHEMA))
+            count += len(batch)
+    return count
+
+
+def read(
+    path: str | Path,
+    columns: Sequence[str] | None = None,
+    filters: list[tuple] | None = None,
+) -> pa.Table:
+    """the columns of the rows that pass the filters, e.g. [("method", "=", "zeroshot_txt")]
+
+    `.to_pandas()` it for plotting.
+    """
+
+    return pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="compose2kube.results", description=__doc__)
+    parser.formatter_class = argparse.RawDescriptionHelpFormatter
+    parser.add_argument("log", help="a result log (JSON lines)")
+    parser.add_argument("output", help="the Parquet file to write")
+    args = parser.parse_args(argv)
+
+    print(f"wrote {to_parquet(ResultLog(args.log), args.output)} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
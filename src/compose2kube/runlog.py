@@ -0,0 +1,130 @@
+"""Append-only JSON lines logs of run results.
+
+Each finished item is written as one line as soon as it is done, so a crashed
+run keeps everything finished before the crash, and a log is read back lazily
+one record at a time. Documents, messages, pydantic models (Manifests, ...),
+dataclasses (Judgement, ...) and exceptions are encoded so that they can be
+loaded back.
+"""
+
+import dataclasses
+import importlib
+import json
+import os
+import threading
+import warnings
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from langchain_core.load import dumpd, load
+from langchain_core.load.serializable import Serializable
+from langchain_core.pydantic_v1 import BaseModel
+
+logger = getLogger(__name__)
+
+TYPE_KEY = "__type__"
+
+
+class RecordedError(Exception):
+    """an exception loaded from a log. the original class is not restored"""
+
+    def __init__(self, cls: str, message: str):
+        super().__init__(f"{cls}: {message}")
+        self.cls = cls
+        self.message = message
+
+
+def _qualname(obj: Any) -> str:
+    return f"{type(obj).__module__}.{type(obj).__qualname__}"
+
+
+def _import(qualname: str) -> Any:
+    module, _, name = qualname.rpartition(".")
+    return getattr(importlib.import_module(module), name)
+
+
+def encode(obj: Any) -> Any:
+    """convert obj into JSON-able values"""
+
+    if obj is None or isinstance(obj, (bool, int, float)):
+        return obj
+    if isinstance(obj, str):
+        return str(obj)
+    if isinstance(obj, dict):
+        return {str(k): encode(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [encode(v) for v in obj]
+    if isinstance(obj, Serializable):
+        return dumpd(obj)
+    if isinstance(obj, BaseModel):
+        return {TYPE_KEY: "pydantic", "cls": _qualname(obj), "data": encode(obj.dict())}
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        data = {f.name: encode(getattr(obj, f.name)) for f in dataclasses.fields(obj)}
+        return {TYPE_KEY: "dataclass", "cls": _qualname(obj), "data": data}
+    if isinstance(obj, BaseException):
+        cls = obj.cls if isinstance(obj, RecordedError) else _qualname(obj)
+        message = obj.message if isinstance(obj, RecordedError) else str(obj)
+        return {TYPE_KEY: "exception", "cls": cls, "message": message}
+    raise TypeError(f"can't encode {type(obj)}: {obj!r}")
+
+
+def decode(obj: Any) -> Any:
+    """the inverse of encode()"""
+
+    if isinstance(obj, list):
+        return [decode(v) for v in obj]
+    if not isinstance(obj, dict):
+        return obj
+    if obj.get("lc") == 1 and "type" in obj:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return load(obj)
+    match obj.get(TYPE_KEY):
+        case "pydantic" | "dataclass":
+            return _import(obj["cls"])(**decode(obj["data"]))
+        case "exception":
+            return RecordedError(obj["cls"], obj["message"])
+        case _:
+            return {k: decode(v) for k, v in obj.items()}
+
+
+class ResultLog:
+    """append-only JSON lines file of result records"""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def truncate(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text("")
+
+    def append(self, record: dict) -> None:
+        line = json.dumps(encode(record), ensure_ascii=False) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def extend(self, records: Iterable[dict]) -> None:
+        for record in records:
+            self.append(record)
+
+    def __iter__(self) -> Iterator[dict]:
+        """read records lazily. a line cut by a crash is skipped"""
+
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    raw = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"skip a broken record at {self.path}:{lineno}")
+                    continue
+                yield decode(raw)
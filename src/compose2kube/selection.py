@@ -0,0 +1,46 @@
+"""Selection of the methods and inputs of a run by names and glob patterns.
+
+A selector is a name or an fnmatch pattern ("llm*", "canonical_*"), or one of
+those after "!" to leave the matches out. Without any selector all are selected;
+with only "!" selectors, all but their matches. A selector that matches nothing
+is an error rather than an empty run, to catch typos.
+
+    select(["kompose", "llm1", "llm2"], ["llm*", "!llm2"]) == ["llm1"]
+"""
+
+from fnmatch import fnmatchcase
+from typing import TYPE_CHECKING, Iterable, Sequence
+
+# not imported at run time, for the CLI to stay quick to start
+if TYPE_CHECKING:
+    from langchain_core.runnables import RunnableParallel
+
+
+def select(names: Iterable[str], selectors: Sequence[str] | None = None) -> list[str]:
+    """the names chosen by the selectors, in their order"""
+
+    names = list(names)
+    if not selectors:
+        return names
+    included = [s for s in selectors if not s.startswith("!")]
+    excluded = [s[1:] for s in selectors if s.startswith("!")]
+    for pattern in included + excluded:
+        if not any(fnmatchcase(name, pattern) for name in names):
+            raise ValueError(f"{pattern!r} matches none of {', '.join(names)}")
+    return [
+        name
+        for name in names
+        if (not included or any(fnmatchcase(name, p) for p in included))
+        and not any(fnmatchcase(name, p) for p in excluded)
+    ]
+
+
+def select_steps(
+    parallel: "RunnableParallel", selectors: Sequence[str] | None
+) -> "RunnableParallel":
+    """a RunnableParallel of only the selected branches of parallel"""
+
+    from langchain_core.runnables import RunnableParallel
+
+    names = select(parallel.steps__, selectors)
+    return RunnableParallel({name: parallel.steps__[name] for name in names})
@@ -0,0 +1,160 @@
+"""Conversions streamed from the LLM, for interactive use.
+
+The methods wait for the n whole completions before parsing them. Here the n
+generations are streamed instead (ChatOpenAIMultiGenerations.stream_generations)
+and each YAML document is yielded as soon as it is closed: by a `---` line or
+the end of its fenced block, or, for a function call, by the end of its item of
+the `manifests` array. The client dry-run of a document starts right away in a
+thread, so parsing and validation overlap with the generation. The last events
+are the results of the generations, the same as the non-streaming chain gives.
+
+    python -m compose2kube.streaming compose.yaml -n 3 --model gpt-4o-2024-05-13
+"""
+
+import argparse
+import sys
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+import yaml
+from langchain_core.documents import Document
+from langchain_core.language_models.base import LanguageModelInput
+from langchain_core.runnables import RunnableConfig, ensure_config
+
+from compose2kube import llm
+from compose2kube.benchmark.parser import FenceScanner, JSONArrayScanner, MDCodeBlockOutputParser
+from compose2kube.model import ChatOpenAIMultiGenerations
+
+DRYRUN_WORKERS = 4
+
+
+@dataclass
+class Event:
+    """something that happened to generation `index`
+
+    kind "document": value is a YAML document of it, the `document`-th one
+    kind "dryrun": value is (ok, message) of the client dry-run of that document
+    kind "done": value is the result of the whole generation
+    """
+
+    index: int
+    kind: str
+    value: Any
+    document: int | None = None
+
+
+class _Manifests:
+    """the manifests of a streamed Manifests function call, like FenceScanner"""
+
+    def __init__(self) -> None:
+        self.scanner = JSONArrayScanner("manifests")
+        self.documents: list[str] = []
+
+    def feed(self, text: str) -> None:
+        for item in self.scanner.feed(text):
+            self.documents.append(item if isinstance(item, str) else yaml.safe_dump(item))
+
+    def close(self) -> None:
+        pass
+
+
+def _dry_run(document: str) -> tuple[bool, str]:
+    return llm._dry_run_batch([document], server=False)[0]
+
+
+def stream_documents(
+    model: ChatOpenAIMultiGenerations,
+    input: LanguageModelInput,
+    config: RunnableConfig | None = None,
+    function: bool = False,
+    dry_run: bool = True,
+) -> Iterator[Event]:
+    """the events of the generations of model: their documents, the dry-runs of
+    those, and at the end the whole text of each generation
+
+    function: the model calls the Manifests function instead of answering markdown
+    """
+
+    scanners: dict[int, FenceScanner | _Manifests] = defaultdict(
+        _Manifests if function else FenceScanner
+    )
+    texts: dict[int, list[str]] = defaultdict(list)
+    # dry-runs in flight -> (index, document)
+    pending: dict[Future, tuple[int, int]] = {}
+
+    with ThreadPoolExecutor(max_workers=DRYRUN_WORKERS) as pool:
+
+        def emit(index: int, seen: int) -> Iterator[Event]:
+            for k, document in enumerate(scanners[index].documents[seen:], seen):
+                yield Event(index, "document", document, k)
+                if dry_run:
+                    pending[pool.submit(_dry_run, document)] = (index, k)
+
+        def dry_runs(wait: bool) -> Iterator[Event]:
+            for future, (index, k) in list(pending.items()):
+                if wait or future.done():
+                    del pending[future]
+                    yield Event(index, "dryrun", future.result(), k)
+
+        for index, text in model.stream_generations(input, config):
+            texts[index].append(text)
+            seen = len(scanners[index].documents)
+            scanners[index].feed(text)
+            yield from emit(index, seen)
+            yield from dry_runs(wait=False)
+        for index in sorted(texts):
+            seen = len(scanners[index].documents)
+            scanners[index].close()
+            yield from emit(index, seen)
+        for index in sorted(texts):
+            yield Event(index, "done", "".join(texts[index]))
+        yield from dry_runs(wait=True)
+
+
+def stream_zeroshottext(
+    doc: Document, config: RunnableConfig | None = None, dry_run: bool = True
+) -> Iterator[Event]:
+    """chain_zeroshottext streamed: the "done" events are the Documents it gives
+
+    config: "model_name" and "n" are read from its configurable, like the chain does
+    """
+
+    from compose2kube.benchmark.methods import prompt_zeroshot
+
+    config = ensure_config(config)
+    configurable = config.get("configurable", {})
+    fields = {k: configurable[k] for k in ("model_name", "n") if k in configurable}
+    model = ChatOpenAIMultiGenerations(cache=True, model_kwargs={"seed": 1}, **fields)
+    prompt = prompt_zeroshot.invoke({"compose": doc.page_content})
+    parser = MDCodeBlockOutputParser()
+    for event in stream_documents(model, prompt, config, dry_run=dry_run):
+        if event.kind == "done":
+            text = event.value
+            event.value = Document(page_content=parser.parse(text), metadata=dict(output_str=text))
+        yield event
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="compose2kube.streaming", description=__doc__)
+    parser.add_argument("compose", type=argparse.FileType())
+    parser.add_argument("-n", type=int, default=1)
+    parser.add_argument("--model", default=llm.GPT35TURBO)
+    parser.add_argument("--no-dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    config = RunnableConfig(configurable=dict(model_name=args.model, n=args.n))
+    doc = Document(page_content=args.compose.read())
+    for event in stream_zeroshottext(doc, config, dry_run=not args.no_dry_run):
+        if event.kind == "document":
+            print(f"# generation {event.index}, document {event.document}\n{event.value}\n---")
+        elif event.kind == "dryrun":
+            ok, message = event.value
+            status = "ok" if ok else f"failed: {message.strip()}"
+            print(f"# generation {event.index}, document {event.document}: dry-run {status}")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration
+
+from compose2kube import kubectl
+from compose2kube.cache import DryRunCache, LLMCache, SQLiteStore, canonical_yaml
+from compose2kube.model import ChatOpenAIMultiGenerations
+
+SPEC = """
+# generated
+kind: Service
+metadata:
+  name: web
+spec:
+  ports: [{port: 80}]
+"""
+
+# the same objects in another layout
+SPEC_REFORMATTED = """kind:    Service
+spec:
+  ports:
+    - port: 80
+metadata: {name: web}   # name
+"""
+
+
+class TestCanonicalYAML(unittest.TestCase):
+    def test_cosmetic_changes(self):
+        self.assertEqual(canonical_yaml(SPEC), canonical_yaml(SPEC_REFORMATTED))
+        self.assertNotEqual(canonical_yaml(SPEC), canonical_yaml(SPEC.replace("80", "81")))
+        self.assertNotEqual(canonical_yaml(SPEC), canonical_yaml(SPEC.replace("80", '"80"')))
+
+    def test_keep_text_of_broken_yaml(self):
+        self.assertEqual(canonical_yaml("a: [  \n"), "a: [")
+        # kubectl rejects duplicated keys, so they must not share a key with the valid one
+        duplicated = SPEC + "kind: Service\n"
+        self.assertNotEqual(canonical_yaml(duplicated), canonical_yaml(SPEC))
+        # keys that json.dumps can't sort
+        mixed = "kind: ConfigMap\ndata:\n  1: a\n  b: c  \n"
+        self.assertEqual(canonical_yaml(mixed), mixed.replace("  \n", "\n").strip())
+
+
+class TestSQLiteStore(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "cache.sqlite"
+
+    def test_get_set(self):
+        store = SQLiteStore(self.path)
+        self.assertIsNone(store.get("a"))
+        store.set("a", b"1")
+        self.assertEqual(store.get("a"), b"1")
+        # shared with another instance on the same file
+        self.assertEqual(SQLiteStore(self.path).get("a"), b"1")
+        self.assertEqual(store.stats(), dict(hits=1, misses=1, entries=1, bytes=1))
+
+    def test_evict_lru(self):
+        store = SQLiteStore(self.path, max_entries=2)
+        for key in "abc":
+            store.set(key, b"x")
+            time.sleep(0.01)
+        store.get("a")
+        store.evict()
+        self.assertEqual([store.get(k) is not None for k in "abc"], [True, False, True])
+
+    def test_evict_bytes(self):
+        store = SQLiteStore(self.path, max_bytes=10)
+        for key in "abc":
+            store.set(key, b"12345")
+            time.sleep(0.01)
+        store.evict()
+        self.assertEqual(store.stats()["bytes"], 10)
+        self.assertIsNone(store.get("a"))
+
+    def test_evict_age(self):
+        store = SQLiteStore(self.path, max_age=60)
+        store.set("a", b"x")
+        with patch("time.time", return_value=time.time() + 61):
+            self.assertIsNone(store.get("a"))
+            self.assertEqual(store.evict(), 1)
+
+
+class TestDryRunCache(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = DryRunCache(SQLiteStore(Path(tmp.name) / "cache.sqlite"))
+
+    def test_key(self):
+        key = DryRunCache.key
+        self.assertEqual(key(SPEC, "v1", "server"), key(SPEC_REFORMATTED, "v1", "server"))
+        self.assertNotEqual(key(SPEC, "v1", "server"), key(SPEC, "v2", "server"))
+        self.assertNotEqual(key(SPEC, "v1", "server"), key(SPEC, "v1", "client"))
+
+    def test_dry_run_batch_uses_cache(self):
+        with (
+            patch.object(kubectl, "dry_run_cache", return_value=self.cache),
+            patch.object(kubectl, "cluster_version", return_value="kubectl server=v1.29.0"),
+            patch.object(
+                kubectl, "_dry_run_chunk", side_effect=lambda specs, **_: [
+                    kubectl.DryRunResult(ok=True, stdout="", stderr="") for _ in specs
+                ]
+            ) as run,
+        ):
+            kubectl.dry_run_batch([SPEC, SPEC.replace("web", "db")])
+            got = kubectl.dry_run_batch([SPEC_REFORMATTED, SPEC.replace("web", "db")])
+
+        self.assertEqual(run.call_count, 1)
+        self.assertTrue(all(r.ok for r in got))
+        self.assertEqual(self.cache.stats()["hits"], 2)
+
+
+class TestLLMCache(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = LLMCache(SQLiteStore(Path(tmp.name) / "llm.sqlite", max_entries=2))
+
+    @staticmethod
+    def llm_string(**kwargs) -> str:
+        params = dict(cache=True, model_name="gpt-3.5-turbo", n=2, model_kwargs={"seed": 1})
+        chat = ChatOpenAIMultiGenerations(openai_api_key="dummy", **params | kwargs)
+        return chat._get_llm_string()
+
+    def test_key(self):
+        key = LLMCache.key("prompt", self.llm_string())
+        self.assertEqual(key, LLMCache.key("prompt", self.llm_string(verbose=True, max_retries=9)))
+        self.assertEqual(key, LLMCache.key("prompt", self.llm_string(cache=False)))
+        for changed in [dict(n=3), dict(model_kwargs={"seed": 2}), dict(model_name="gpt-4")]:
+            with self.subTest(changed=changed):
+                self.assertNotEqual(key, LLMCache.key("prompt", self.llm_string(**changed)))
+        self.assertNotEqual(key, LLMCache.key("other", self.llm_string()))
+        self.assertNotEqual(LLMCache.key("p", "not json"), LLMCache.key("p", "not json either"))
+
+    def test_generations_roundtrip(self):
+        message = AIMessage(content="", additional_kwargs={"function_call": {"name": "f"}})
+        usage = {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}
+        generations = [
+            ChatGeneration(message=message, generation_info={"token_usage": usage}),
+            ChatGeneration(message=AIMessage(content="second")),
+        ]
+        self.assertIsNone(self.cache.lookup("p", "llm"))
+        self.cache.update("p", "llm", generations)
+        self.assertEqual(self.cache.lookup("p", "llm"), generations)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+        self.assertGreater(self.cache.stats()["bytes"], 0)
+
+        for prompt in ["a", "b", "c"]:
+            self.cache.update(prompt, "llm", generations)
+        self.cache.store.evict()
+        self.assertEqual(self.cache.stats()["entries"], 2)
+
+    @patch("openai.resources.chat.completions.Completions.create", autospec=True)
+    def test_chat_model(self, mock_create):
+        from openai.types.chat.chat_completion import ChatCompletion, Choice
+        from openai.types.chat.chat_completion_message import ChatCompletionMessage
+        from openai.types.completion_usage import CompletionUsage
+
+        choices = [
+            Choice(
+                finish_reason="stop",
+                index=i,
+                message=ChatCompletionMessage(content=f"answer {i}", role="assistant"),
+            )
+            for i in range(2)
+        ]
+        mock_create.return_value = ChatCompletion(
+            id="test",
+            choices=choices,
+            created=1,
+            model="gpt-3.5-turbo",
+            object="chat.completion",
+            usage=CompletionUsage(prompt_tokens=5, completion_tokens=6, total_tokens=11),
+        )
+        chat = ChatOpenAIMultiGenerations(openai_api_key="dummy", n=2, cache=self.cache)
+        first = chat.generate([[HumanMessage(content="hello")]]).generations[0]
+        again = chat.generate([[HumanMessage(content="hello")]]).generations[0]
+        self.assertEqual(mock_create.call_count, 1)
+        self.assertEqual([g.message.content for g in again], ["answer 0", "answer 1"])
+        self.assertEqual(again, first)
+        self.assertEqual(again[0].generation_info["token_usage"]["total_tokens"], 11)
@@ -0,0 +1,181 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import yaml
+
+from compose2kube import composefile
+from compose2kube.composefile import ComposeError, go_duration
+
+DATASET = Path(__file__).parents[2] / "dataset" / "deployments_anonymized"
+
+SHORT = """
+version: "3"
+services:
+  web:
+    image: nginx
+    command: nginx -g 'daemon off;'
+    ports:
+      - 80
+      - "8080:80"
+      - "127.0.0.1:5000-5001:6000-6001/udp"
+      - "${PORT:-80}:80"
+    volumes:
+      - /data
+      - ./conf:/etc/nginx:ro
+      - cache:/cache:nocopy
+    environment:
+      - DEBUG
+      - MODE=prod
+    env_file: .env
+    labels:
+      enabled: true
+    healthcheck:
+      test: curl -f http://localhost
+      interval: 90s
+      timeout: 1.5s
+      start_period: 500ms
+    depends_on: [db]
+  db:
+    image: postgres
+    environment:
+      PORT: 5432
+volumes:
+  cache:
+"""
+
+
+class TestComposeFile(unittest.TestCase):
+    def test_short_forms(self):
+        got = composefile.config(SHORT)
+        web = got["services"]["web"]
+        udp = {"mode": "ingress", "host_ip": "127.0.0.1"}
+        self.assertEqual(got["name"], "tmp")
+        self.assertNotIn("version", got)
+        self.assertEqual(web["command"], ["nginx", "-g", "daemon off;"])
+        self.assertEqual(
+            web["ports"],
+            [
+                {"mode": "ingress", "target": 80, "protocol": "tcp"},
+                {"mode": "ingress", "target": 80, "published": "8080", "protocol": "tcp"},
+                {**udp, "target": 6000, "published": "5000", "protocol": "udp"},
+                {**udp, "target": 6001, "published": "5001", "protocol": "udp"},
+                {"mode": "ingress", "target": 80, "published": "${PORT:-80}", "protocol": "tcp"},
+            ],
+        )
+        self.assertEqual(
+            web["volumes"],
+            [
+                {"type": "volume", "target": "/data", "volume": {}},
+                {
+                    "type": "bind",
+                    "source": "./conf",
+                    "target": "/etc/nginx",
+                    "read_only": True,
+                    "bind": {"create_host_path": True},
+                },
+                {
+                    "type": "volume",
+                    "source": "cache",
+                    "target": "/cache",
+                    "volume": {"nocopy": True},
+                },
+            ],
+        )
+        self.assertEqual(web["environment"], {"DEBUG": None, "MODE": "prod"})
+        self.assertEqual(web["env_file"], [{"path": ".env", "required": True}])
+        self.assertEqual(web["labels"], {"enabled": "true"})
+        self.assertEqual(
+            web["healthcheck"],
+            {
+                "test": ["CMD-SHELL", "curl -f http://localhost"],
+                "timeout": "1.5s",
+                "interval": "1m30s",
+                "start_period": "500ms",
+            },
+        )
+        self.assertEqual(
+            web["depends_on"], {"db": {"condition": "service_started", "required": True}}
+        )
+        self.assertEqual(web["networks"], {"default": None})
+        self.assertEqual(got["services"]["db"]["environment"], {"PORT": "5432"})
+        self.assertEqual(got["networks"], {"default": {"name": "tmp_default"}})
+        self.assertEqual(got["volumes"], {"cache": {"name": "tmp_cache"}})
+
+    def test_dump(self):
+        text = composefile.dump(composefile.config(SHORT))
+        self.assertEqual(yaml.safe_load(text), composefile.config(SHORT))
+        self.assertIn('published: "8080"', text)
+        self.assertTrue(text.startswith("name: tmp\nservices:\n  db:\n"))
+
+    def test_go_duration(self):
+        cases = {"1m": "1m0s", "90s": "1m30s", "1h": "1h0m0s", "2h3s": "2h0m3s", "0s": "0s"}
+        cases |= {"1.5s": "1.5s", "100ms": "100ms", "1500ms": "1.5s", 10: "10s", "${T}": "${T}"}
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(go_duration(value), expected)
+        with self.assertRaises(ComposeError):
+            go_duration("10 seconds")
+
+    def test_invalid(self):
+        with self.assertRaises(ComposeError):
+            composefile.config("- a list")
+
+    def test_override(self):
+        got = composefile.load_project(DATASET / "ai-operation-process-analysis" / "act-sdk")
+        build = got["services"]["act-sdk_exec"]["build"]
+        # from docker-compose.override.yml
+        self.assertEqual(build["args"]["HTTP_PROXY"], "${ENV_HTTP_PROXY}")
+        # from docker-compose.yml
+        self.assertEqual(build["args"]["UID"], "${EXEC_UID}")
+        self.assertEqual(got["services"]["act-sdk_exec"]["restart"], "always")
+
+    def test_merge(self):
+        base = composefile.canonicalize(SHORT)
+        override = composefile.canonicalize(
+            """
+services:
+  web:
+    command: ["nginx"]
+    ports: ["9090:90"]
+    volumes: ["./other:/etc/nginx"]
+    environment: {MODE: dev}
+"""
+        )
+        web = composefile.merge(base, override)["services"]["web"]
+        self.assertEqual(web["command"], ["nginx"])
+        self.assertEqual(len(web["ports"]), 6)
+        self.assertEqual(len(web["volumes"]), 3)
+        self.assertEqual(web["volumes"][1]["source"], "./other")
+        self.assertEqual(web["environment"], {"DEBUG": None, "MODE": "dev"})
+
+    def test_env_file_is_read(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            Path(tmp, ".env").write_text("MODE=from-file\nTOKEN=secret\n")
+            Path(tmp, "compose.yaml").write_text(SHORT)
+            web = composefile.load_project(tmp)["services"]["web"]
+        self.assertNotIn("env_file", web)
+        self.assertEqual(web["environment"], {"DEBUG": None, "MODE": "prod", "TOKEN": "secret"})
+        conf = os.path.join(os.path.realpath(tmp), "conf")
+        self.assertEqual(web["volumes"][1]["source"], conf)
+
+    def test_same_as_docker_compose(self):
+        # compose.config.yaml is the output of `docker compose config`,
+        # with the variables interpolated and the project directory in /tmp
+        for name in ["ai-operation-process-analysis", "ai-rule-editor"]:
+            with self.subTest(name=name):
+                directory = DATASET / name
+                expected = yaml.safe_load((directory / "compose.config.yaml").read_text())
+                text = composefile.dump(composefile.load_project(directory))
+                got = yaml.safe_load(
+                    text.replace(str(directory.resolve()), f"/tmp/{expected['name']}")
+                )
+                self.assertEqual(got["services"].keys(), expected["services"].keys())
+                self.assertEqual(got["volumes"].keys(), expected["volumes"].keys())
+                # the services without variables, but in the image
+                for service in ["postgres", "superset", "data", "rules", "tools"]:
+                    if service in expected["services"]:
+                        got["services"][service].pop("image")
+                        expected["services"][service].pop("image")
+                        self.assertEqual(got["services"][service], expected["services"][service])
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from compose2kube import concurrency
+from compose2kube.concurrency import amap_bounded, astage, parse_stage_limits, stage
+
+
+class TestAmapBounded(unittest.TestCase):
+    def test_order_and_limit(self):
+        running = 0
+        peak = 0
+        finished = []
+
+        async def fn(x):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01 * (5 - x))
+            running -= 1
+            return x * 2
+
+        got = asyncio.run(
+            amap_bounded(fn, range(5), max_concurrency=2, on_result=lambda x, _: finished.append(x))
+        )
+        self.assertEqual(got, [0, 2, 4, 6, 8])
+        self.assertEqual(peak, 2)
+        self.assertEqual(sorted(finished), [0, 1, 2, 3, 4])
+
+    def test_cancel_pending_on_error(self):
+        started = []
+
+        async def fn(x):
+            started.append(x)
+            if x == 0:
+                raise ValueError("boom")
+            await asyncio.sleep(1)
+
+        with self.assertRaises(ValueError):
+            asyncio.run(amap_bounded(fn, range(10), max_concurrency=2))
+        self.assertLess(len(started), 10)
+
+
+class TestStage(unittest.TestCase):
+    def tearDown(self) -> None:
+        concurrency.set_stage_limit("test", None)
+
+    def test_stage_limit_shared_by_threads_and_loop(self):
+        concurrency.set_stage_limit("test", 2)
+        lock = threading.Lock()
+        running = 0
+        peak = 0
+
+        def enter():
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+
+        def leave():
+            nonlocal running
+            with lock:
+                running -= 1
+
+        def work():
+            with stage("test"):
+                enter()
+                time.sleep(0.02)
+                leave()
+
+        async def awork(_):
+            async with astage("test"):
+                enter()
+                await asyncio.sleep(0.02)
+                leave()
+
+        with ThreadPoolExecutor(4) as pool:
+            futures = [pool.submit(work) for _ in range(4)]
+            asyncio.run(amap_bounded(awork, range(4), max_concurrency=4))
+            for f in futures:
+                f.result()
+        self.assertLessEqual(peak, 2)
+
+    def test_unlimited(self):
+        with stage("not configured"):
+            pass
+
+    def test_parse_stage_limits(self):
+        self.assertEqual(parse_stage_limits(["llm=4", "kompose=1"]), dict(llm=4, kompose=1))
+        for bad in ["llm", "llm=0", "=1", "llm=x"]:
+            with self.subTest(bad=bad), self.assertRaises(ValueError):
+                parse_stage_limits([bad])
@@ -0,0 +1,85 @@
+import glob
+import unittest
+from pathlib import Path
+
+from compose2kube import distance
+from compose2kube.benchmark.parser import MDCodeBlockOutputParser
+from compose2kube.manifest import ParsedManifest
+
+MANIFESTS = Path(__file__).parent / "benchmark" / "test_manifests"
+
+DEPLOYMENT = """
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: web
+spec:
+  replicas: 1
+  template:
+    metadata:
+      labels: {app: web}
+    spec:
+      containers:
+        - name: web
+          image: nginx
+          ports: [{containerPort: 80}, {containerPort: 443}]
+        - name: sidecar
+          image: busybox
+---
+apiVersion: v1
+kind: Service
+metadata:
+  name: web
+spec:
+  ports: [{port: 80}]
+"""
+
+
+def _generated() -> list[str]:
+    parser = MDCodeBlockOutputParser()
+    texts = [parser.parse(Path(f).read_text()) for f in sorted(glob.glob(f"{MANIFESTS}/*.yaml"))]
+    return [t for t in texts if ParsedManifest.of(t).error is None]
+
+
+class TestDistance(unittest.TestCase):
+    def test_equal(self):
+        self.assertEqual(distance.distance(DEPLOYMENT, DEPLOYMENT), 0.0)
+        self.assertEqual(distance.distance("", ""), 0.0)
+
+    def test_ignores_order_and_metadata(self):
+        ports = "{containerPort: 80}, {containerPort: 443}"
+        reordered = DEPLOYMENT.replace(ports, ", ".join(reversed(ports.split(", "))))
+        reordered = reordered.replace("app: web", "app: other")
+        docs = reordered.split("---")
+        self.assertEqual(distance.distance(docs[1] + "---" + docs[0], DEPLOYMENT), 0.0)
+
+    def test_field_changes(self):
+        one = distance.distance(DEPLOYMENT.replace("replicas: 1", "replicas: 2"), DEPLOYMENT)
+        changed = DEPLOYMENT.replace("replicas: 1", "replicas: 2")
+        two = distance.distance(changed.replace("image: nginx", "image: httpd"), DEPLOYMENT)
+        self.assertGreater(one, 0)
+        self.assertLess(one, two)
+        self.assertEqual(distance.distance(DEPLOYMENT, ""), 1.0)
+
+    def test_renamed_objects_are_paired(self):
+        renamed = DEPLOYMENT.replace("name: web\nspec:\n  ports", "name: web-svc\nspec:\n  ports")
+        self.assertEqual(distance.distance(renamed, DEPLOYMENT), 0.0)
+        changed = renamed.replace("port: 80}", "port: 8080}")
+        self.assertLess(distance.distance(changed, DEPLOYMENT), 0.2)
+
+    def test_containers_are_matched_by_name(self):
+        swapped = DEPLOYMENT.replace("image: nginx", "image: X")
+        swapped = swapped.replace("image: busybox", "image: nginx")
+        swapped = swapped.replace("image: X", "image: busybox")
+        self.assertGreater(distance.distance(swapped, DEPLOYMENT), 0.0)
+
+    def test_parse_error(self):
+        with self.assertRaises(Exception):
+            distance.distance("a: [", DEPLOYMENT)
+
+    def test_correlates_with_deep_distance(self):
+        texts = _generated()[:40]
+        got = distance.benchmark(zip(texts[::2], texts[1::2]))
+        self.assertEqual(got["pairs"], 20)
+        self.assertGreater(got["spearman"], 0.8)
+        self.assertGreater(got["pearson"], 0.8)
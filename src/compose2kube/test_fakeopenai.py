@@ -0,0 +1,121 @@
+import asyncio
+import random
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import openai
+from langchain.globals import get_llm_cache, set_llm_cache
+from langchain_core.caches import InMemoryCache
+from langchain_core.messages import HumanMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+from compose2kube import llm
+from compose2kube.fakeopenai import FakeOpenAI, fixed, parse_latency
+from compose2kube.model import ChatOpenAIMultiGenerations
+
+MESSAGES = [[HumanMessage(content="convert")]]
+
+
+def _chat(fake: FakeOpenAI, **kwargs) -> ChatOpenAIMultiGenerations:
+    return ChatOpenAIMultiGenerations(
+        openai_api_base=fake.base_url, openai_api_key="fake", cache=False, **kwargs
+    )
+
+
+class TestFakeOpenAI(unittest.TestCase):
+    def test_n(self):
+        with FakeOpenAI() as fake:
+            result = _chat(fake, n=3).generate(MESSAGES)
+        self.assertEqual(len(result.generations[0]), 3)
+        self.assertIn("kind: Service", result.generations[0][0].message.content)
+        self.assertGreater(result.llm_output["token_usage"]["total_tokens"], 0)
+
+    def test_function_call(self):
+        cache = get_llm_cache()
+        set_llm_cache(InMemoryCache())
+        self.addCleanup(set_llm_cache, cache)
+        prompt = ChatPromptTemplate.from_messages([("human", "{compose}")])
+        with FakeOpenAI() as fake, patch.dict("os.environ", fake.environ()):
+            chain = prompt | llm.make_llm_runnable(tools=[llm.Manifests], n=2, model="gpt-4")
+            got = chain.invoke({"compose": "services: {}"})
+        self.assertEqual(len(got), 2)
+        self.assertIsInstance(got[0], llm.Manifests)
+        self.assertIn("kind: Service", got[0].manifests[0])
+
+    def test_rate_limit(self):
+        with FakeOpenAI(error_rate=1.0) as fake:
+            with self.assertRaises(openai.RateLimitError):
+                _chat(fake, max_retries=0).generate(MESSAGES)
+
+        with FakeOpenAI(latency=fixed(0.05), max_in_flight=1) as fake:
+            chat = _chat(fake, max_retries=10)
+
+            async def run():
+                return await asyncio.gather(*[chat.agenerate(MESSAGES) for _ in range(3)])
+
+            self.assertEqual(len(asyncio.run(run())), 3)
+        self.assertGreater(fake.stats.rate_limited, 0)
+        self.assertEqual(fake.stats.statuses[200], 3)
+
+    def test_concurrent_requests(self):
+        with FakeOpenAI(latency=fixed(0.2)) as fake:
+            chat = _chat(fake)
+
+            async def run():
+                await asyncio.gather(*[chat.agenerate(MESSAGES) for _ in range(8)])
+
+            start = time.perf_counter()
+            asyncio.run(run())
+            elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 8 * 0.2 / 2)
+        self.assertGreater(fake.stats.max_in_flight, 1)
+
+    def test_record_replay(self):
+        def answer(request, i):
+            return f"recorded {i}"
+
+        def unreachable(request, i):
+            raise AssertionError("not replayed")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            recording = Path(tmp) / "recording.jsonl"
+            with FakeOpenAI(responder=answer) as upstream:
+                with FakeOpenAI(recording=recording, upstream=upstream.base_url) as fake:
+                    first = _chat(fake, n=2).generate(MESSAGES)
+                self.assertEqual(fake.stats.forwarded, 1)
+            with FakeOpenAI(recording=recording, responder=unreachable) as fake:
+                again = _chat(fake, n=2).generate(MESSAGES)
+            self.assertEqual(fake.stats.replayed, 1)
+        contents = [g.message.content for g in again.generations[0]]
+        self.assertEqual(contents, [g.message.content for g in first.generations[0]])
+        self.assertEqual(contents, ["recorded 0", "recorded 1"])
+
+    def test_failed_answer(self):
+        def broken(request, i):
+            raise ValueError("broken responder")
+
+        with FakeOpenAI(responder=broken) as fake:
+            with self.assertRaises(openai.InternalServerError):
+                _chat(fake, max_retries=0).generate(MESSAGES)
+        self.assertEqual((fake.stats.statuses, fake.stats.in_flight), ({500: 1}, 0))
+
+        # the error of the upstream is passed on
+        with FakeOpenAI(error_rate=1.0) as upstream:
+            with FakeOpenAI(upstream=upstream.base_url) as fake:
+                with self.assertRaises(openai.RateLimitError):
+                    _chat(fake, max_retries=0).generate(MESSAGES)
+        self.assertEqual((fake.stats.statuses, fake.stats.rate_limited), ({429: 1}, 1))
+
+    def test_parse_latency(self):
+        rng = random.Random(1)
+        self.assertEqual(parse_latency("0.5")({}, rng), 0.5)
+        self.assertTrue(0.1 <= parse_latency("uniform:0.1:0.2")({}, rng) <= 0.2)
+        self.assertGreater(parse_latency("lognormal:1:0.5")({}, rng), 0)
+        # the same with the same seed
+        latency = parse_latency("lognormal:1:0.5")
+        self.assertEqual(latency({}, random.Random(7)), latency({}, random.Random(7)))
+        with self.assertRaises(ValueError):
+            parse_latency("gamma:1:2")
@@ -0,0 +1,119 @@
+import os
+import stat
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from compose2kube import kubectl
+
+# a stand-in for `kubectl apply -f PATH|- --dry-run=MODE` that rejects kind: Bad
+FAKE_KUBECTL = """
+import glob, os, sys
+import yaml
+
+path = sys.argv[3]
+if path == "-":
+    files = ["STDIN"]
+else:
+    files = sorted(glob.glob(f"{path}/*.yaml")) if os.path.isdir(path) else [path]
+failed = False
+n_objects = 0
+for name in files:
+    try:
+        text = sys.stdin.read() if name == "STDIN" else open(name).read()
+        docs = [d for d in yaml.safe_load_all(text) if d is not None]
+    except yaml.YAMLError as e:
+        print(f"error: error parsing {name}: {e}".replace("\\n", " "), file=sys.stderr)
+        failed = True
+        continue
+    n_objects += len(docs)
+    for doc in docs:
+        kind, name_ = doc["kind"], doc["metadata"]["name"]
+        if kind == "Old":
+            print(f"Warning: {doc['apiVersion']} Old is deprecated", file=sys.stderr)
+        if kind == "Bad":
+            print(
+                f'Error from server (BadRequest): error when creating "{name}": '
+                f'{kind} "{name_}" is invalid',
+                file=sys.stderr,
+            )
+            failed = True
+        else:
+            print(f"{kind.lower()}/{name_} created (server dry run)")
+if n_objects == 0 and not failed:
+    print("error: no objects passed to apply", file=sys.stderr)
+    failed = True
+sys.exit(1 if failed else 0)
+"""
+
+GOOD = """
+kind: Service
+metadata:
+  name: web
+---
+kind: Deployment
+metadata:
+  name: web
+"""
+
+BAD = """
+kind: Service
+metadata:
+  name: web
+---
+kind: Bad
+metadata:
+  name: web
+"""
+
+
+class TestDryRunBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        script = Path(tmp.name) / "kubectl"
+        script.write_text(f"#!{sys.executable}\n{FAKE_KUBECTL}")
+        script.chmod(script.stat().st_mode | stat.S_IXUSR)
+        self.kubectl = os.fspath(script)
+
+    def test_same_as_single(self):
+        specs = [GOOD, BAD, "a: [", "", GOOD]
+        singles = [kubectl.dry_run(s, kubectl=self.kubectl, cache=False) for s in specs]
+        batched = kubectl.dry_run_batch(specs, kubectl=self.kubectl, cache=False)
+        self.assertEqual([r.ok for r in batched], [r.ok for r in singles])
+        self.assertEqual([r.ok for r in batched], [True, False, False, False, True])
+
+    def test_attribute_documents(self):
+        got = kubectl.dry_run_batch([GOOD, BAD, BAD], kubectl=self.kubectl, cache=False)
+        self.assertEqual([r.documents for r in got], [[], [1], [1]])
+        self.assertIn('Bad "web" is invalid', got[1].stderr)
+        self.assertEqual(got[0].stderr, "")
+
+    def test_batch_size(self):
+        got = kubectl.dry_run_batch(
+            [BAD, GOOD, BAD], kubectl=self.kubectl, batch_size=2, cache=False
+        )
+        self.assertEqual([r.ok for r in got], [False, True, False])
+
+    def test_stdout(self):
+        specs = [GOOD, BAD, GOOD.replace("web", "db")]
+        singles = [kubectl.dry_run(s, kubectl=self.kubectl, cache=False) for s in specs]
+        batched = kubectl.dry_run_batch(specs, kubectl=self.kubectl, cache=False)
+        self.assertEqual([r.stdout for r in batched], [r.stdout for r in singles])
+        self.assertEqual(batched[1].stdout, "service/web created (server dry run)\n")
+
+    def test_warnings(self):
+        old = "apiVersion: v1beta1\nkind: Old\nmetadata:\n  name: web\n"
+        # warnings don't fail a spec, and go to the spec with the deprecated object
+        got = kubectl.dry_run_batch([GOOD, old], kubectl=self.kubectl, cache=False)
+        self.assertEqual([r.ok for r in got], [True, True])
+        self.assertEqual(got[0].stderr, "")
+        self.assertIn("Old is deprecated", got[1].stderr)
+        got = kubectl.dry_run_batch([old, BAD], kubectl=self.kubectl, cache=False)
+        self.assertEqual([r.ok for r in got], [True, False])
+
+    def test_error_without_file(self):
+        specs = [GOOD, GOOD.replace("web", "db")]
+        got = kubectl.dry_run_batch(specs, kubectl="false", cache=False)
+        self.assertEqual([r.ok for r in got], [False, False])
@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+import unittest
+
+# imported by the chains and clients, not needed for parsing the arguments
+HEAVY = ["langchain_openai", "langfuse", "deepdiff", "compose2kube.evaluator", "dotenv"]
+
+
+class TestMain(unittest.TestCase):
+    def test_light_import(self):
+        code = f"import sys, compose2kube.__main__; print([m for m in {HEAVY} if m in sys.modules])"
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        self.assertEqual(proc.stdout.strip(), "[]", proc.stderr)
+
+    def test_help_without_key(self):
+        env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+        args = [sys.executable, "-m", "compose2kube", "--help"]
+        proc = subprocess.run(args, capture_output=True, text=True, env=env)
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        self.assertIn("--convert", proc.stdout)
@@ -0,0 +1,71 @@
+import copy
+import pickle
+import unittest
+from unittest.mock import patch
+
+import yaml
+
+from compose2kube import manifest
+from compose2kube.manifest import ParsedManifest
+
+SPEC = """
+kind: Service
+metadata:
+  name: web
+---
+---
+kind: Deployment
+metadata:
+  name: web
+"""
+
+
+class TestParsedManifest(unittest.TestCase):
+    def test_is_str(self):
+        m = ParsedManifest.of(SPEC)
+        self.assertEqual(m, SPEC)
+        self.assertEqual(m.splitlines(), SPEC.splitlines())
+        self.assertIs(ParsedManifest.of(m), m)
+
+    def test_same_as_safe_load_all(self):
+        for spec in [SPEC, "", "a: 1\n---\n- b\n", SPEC + "---\na: [\n"]:
+            with self.subTest(spec=spec):
+                want, want_error = [], None
+                try:
+                    for doc in yaml.safe_load_all(spec):
+                        want.append(doc)
+                except yaml.YAMLError as e:
+                    want_error = e
+
+                got = []
+                m = ParsedManifest.of(spec)
+                try:
+                    for doc in m.iter_documents():
+                        got.append(doc)
+                except yaml.YAMLError as e:
+                    self.assertIsNotNone(want_error)
+                    self.assertIs(e, m.error)
+                self.assertEqual(got, want)
+
+    def test_parse_once(self):
+        m = ParsedManifest.of(SPEC + "# once\n")
+        with patch.object(manifest, "_Loader", wraps=manifest._Loader) as loader:
+            m.documents, m.objects, m.index
+            ParsedManifest.of(SPEC + "# once\n").documents
+        self.assertEqual(loader.call_count, 1)
+
+    def test_index(self):
+        m = ParsedManifest.of(SPEC)
+        self.assertEqual(sorted(m.index), [("Deployment", "web"), ("Service", "web")])
+        self.assertEqual(len(m.objects), 2)
+
+    def test_duplicated_keys(self):
+        self.assertFalse(ParsedManifest.of(SPEC).has_duplicated_keys)
+        self.assertTrue(ParsedManifest.of(SPEC + "kind: Pod\n").has_duplicated_keys)
+
+    def test_pickle(self):
+        m = ParsedManifest.of(SPEC)
+        m.documents
+        for got in [pickle.loads(pickle.dumps(m)), copy.deepcopy(m)]:
+            self.assertIsInstance(got, ParsedManifest)
+            self.assertEqual(got, SPEC)
@@ -0,0 +1,104 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from langchain_core.caches import InMemoryCache
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import RunnableLambda
+from openai.types.chat.chat_completion import ChatCompletion, Choice
+from openai.types.chat.chat_completion_message import ChatCompletionMessage
+from openai.types.completion_usage import CompletionUsage
+
+from compose2kube import concurrency, tools
+from compose2kube.metrics import MetricsHandler, stage_of, to_prometheus
+from compose2kube.model import ChatOpenAIMultiGenerations
+
+COMPLETION = ChatCompletion(
+    id="test",
+    choices=[
+        Choice(
+            finish_reason="stop",
+            index=0,
+            message=ChatCompletionMessage(content="kind: Pod", role="assistant"),
+        )
+    ],
+    created=1,
+    model="gpt-3.5-turbo",
+    object="chat.completion",
+    usage=CompletionUsage(prompt_tokens=7, completion_tokens=3, total_tokens=10),
+)
+
+
+def _kompose(text: str) -> str:
+    if "broken" in text:
+        raise ValueError("kompose failed")
+    return text
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self) -> None:
+        tools.reset_stats()
+        concurrency.reset_queue_stats()
+
+    def test_stage_of(self):
+        self.assertEqual(stage_of("ChatPromptTemplate"), "prompt")
+        self.assertEqual(stage_of("JsonOutputParser"), "parse")
+        self.assertEqual(stage_of("dryrun_batch"), "dryrun")
+        self.assertIsNone(stage_of("RunnableSequence"))
+
+    @patch("openai.resources.chat.completions.Completions.create", autospec=True)
+    def test_chain(self, mock_create):
+        mock_create.return_value = COMPLETION
+        llm = ChatOpenAIMultiGenerations(openai_api_key="dummy", cache=InMemoryCache())
+        chain = (
+            PromptTemplate.from_template("convert {compose}")
+            | llm.with_config(run_name="llm")
+            | (lambda messages: messages[0])
+            | StrOutputParser()
+            | RunnableLambda(_kompose, name="convert_by_kompose")
+        )
+        metrics = MetricsHandler()
+        config = {"callbacks": [metrics]}
+        chain.invoke({"compose": "services: {}"}, config)
+        chain.invoke({"compose": "services: {}"}, config)  # from the cache
+        with self.assertRaises(ValueError):
+            RunnableLambda(_kompose, name="convert_by_kompose").invoke("broken", config)
+
+        stages = metrics.summary()["stages"]
+        self.assertEqual(mock_create.call_count, 1)
+        self.assertEqual(stages["prompt"]["runs"], 2)
+        self.assertEqual(stages["parse"]["runs"], 2)
+        self.assertEqual(stages["llm"]["runs"], 2)
+        self.assertEqual(stages["llm"]["prompt_tokens"], 7)
+        self.assertEqual(stages["llm"]["completion_tokens"], 3)
+        self.assertEqual(stages["llm"]["cache_hits"], 1)
+        self.assertEqual(stages["llm"]["cached_tokens"], 10)
+        self.assertEqual(stages["kompose"]["runs"], 3)
+        self.assertEqual(stages["kompose"]["errors"], 1)
+        self.assertGreater(stages["kompose"]["seconds"], 0)
+        self.assertIn("queue_seconds", stages["kompose"])
+
+    def test_queue_time(self):
+        concurrency.set_stage_limit("dryrun", 1)
+        self.addCleanup(concurrency.set_stage_limit, "dryrun", None)
+        with concurrency.stage("dryrun"):
+            pass
+        stages = MetricsHandler().summary()["stages"]
+        self.assertEqual(stages["dryrun"]["runs"], 0)
+        self.assertGreaterEqual(stages["dryrun"]["queue_seconds"], 0)
+
+    def test_write(self):
+        metrics = MetricsHandler()
+        RunnableLambda(_kompose, name="dryrun_str").invoke("x", {"callbacks": [metrics]})
+        with tempfile.TemporaryDirectory() as tmp:
+            metrics.write(Path(tmp) / "metrics.json")
+            metrics.write(Path(tmp) / "metrics.prom")
+            summary = json.loads((Path(tmp) / "metrics.json").read_text())
+            prom = (Path(tmp) / "metrics.prom").read_text()
+        self.assertEqual(summary["stages"]["dryrun"]["runs"], 1)
+        self.assertIn('c2k_stage_runs{stage="dryrun"} 1\n', prom)
+        self.assertIn("# TYPE c2k_stage_max_seconds gauge\n", prom)
+        self.assertEqual(to_prometheus({"stages": {}, "tools": {}}), "\n")
@@ -0,0 +1,41 @@
+import unittest
+
+import yaml
+
+from compose2kube import microbench
+from compose2kube.benchmark.parser import MDCodeBlockOutputParser
+
+
+class TestMicrobench(unittest.TestCase):
+    def test_synthetic(self):
+        docs = list(yaml.safe_load_all(microbench.synthetic_manifest(5)))
+        self.assertEqual(len(docs), 10)
+        self.assertEqual({d["kind"] for d in docs}, {"Deployment", "StatefulSet", "Service"})
+        self.assertNotEqual(
+            microbench.synthetic_manifest(5), microbench.synthetic_manifest(5, variant=1)
+        )
+
+        output = microbench.synthetic_output(5, blocks=3)
+        self.assertEqual(output.count("```yaml"), 3)
+        parsed = MDCodeBlockOutputParser().parse(output)
+        self.assertEqual(list(yaml.safe_load_all(parsed)), docs)
+
+    def test_run(self):
+        got = microbench.run(sizes=[1], repeat=1, only="@")
+        self.assertIn("parse@1", got)
+        self.assertIn("report@1", got)
+        self.assertIn("judge/input12@1", got)
+        self.assertTrue(all(seconds > 0 for seconds in got.values()))
+
+    def test_compare(self):
+        baseline = {"parse@1": 1.0, "count@1": 1.0}
+        results = {"parse@1": 1.1, "count@1": 2.0, "report@1": 5.0}
+        self.assertEqual(microbench.compare(results, baseline), {"count@1": 2.0})
+        self.assertEqual(microbench.compare(results, baseline, threshold=3), {})
+
+    def test_startup(self):
+        got = microbench.run(sizes=[], repeat=1, only="compose2kube.__main__")
+        self.assertEqual(list(got), ["import/compose2kube.__main__"])
+        self.assertGreater(got["import/compose2kube.__main__"], 0)
+        with self.assertRaises(RuntimeError):
+            microbench.import_time("compose2kube.nonexistent")
@@ -1,5 +1,6 @@
+import asyncio
 import unittest
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 from compose2kube.model import ChatOpenAIMultiGenerations
 
@@ -9,6 +10,7 @@ class TestChatOpenAI(unittest.TestCase):
     def test_n(self, mock_create):
         from openai.types.chat.chat_completion import ChatCompletion, Choice
         from openai.types.chat.chat_completion_message import ChatCompletionMessage
+        from openai.types.completion_usage import CompletionUsage
 
         msgs = [
             "こんにちは！いい天気ですね。何かお手伝いできることはありますか？",
@@ -32,10 +34,35 @@ class TestChatOpenAI(unittest.TestCase):
             created=1,
             model="gpt-3.5-turbo",
             object="chat.completion",
+            usage=CompletionUsage(prompt_tokens=5, completion_tokens=60, total_tokens=65),
         )
 
         chat = ChatOpenAIMultiGenerations(
-            model="gpt-3.5-turbo", n=3, temperature=1, api_key="dummy"
+            model="gpt-3.5-turbo", n=3, temperature=1, api_key="dummy", cache=False
         )
         got = chat.invoke("こんにちは！")
         self.assertEqual(len(got), 3)
+        # the usage of the request, once
+        self.assertEqual(got[0].response_metadata["token_usage"]["completion_tokens"], 60)
+        self.assertNotIn("token_usage", got[1].response_metadata)
+
+        with patch(
+            "openai.resources.chat.completions.AsyncCompletions.create",
+            new_callable=AsyncMock,
+            return_value=mock_create.return_value,
+        ):
+            got = asyncio.run(chat.ainvoke("こんにちは！"))
+        self.assertEqual([m.content for m in got], msgs)
+
+    @patch("openai.resources.chat.completions.Completions.create", autospec=True)
+    def test_sample_seed(self, mock_create):
+        from openai.types.chat.chat_completion import ChatCompletion
+
+        mock_create.return_value = ChatCompletion(
+            id="test", choices=[], created=1, model="gpt-3.5-turbo", object="chat.completion"
+        )
+        chat = ChatOpenAIMultiGenerations(api_key="dummy", cache=False, model_kwargs={"seed": 1})
+        chat.invoke("hi")
+        chat.invoke("hi", {"configurable": {"sample": 2}})
+        seeds = [call.kwargs["seed"] for call in mock_create.call_args_list]
+        self.assertEqual(seeds, [1, 3])
@@ -0,0 +1,105 @@
+import unittest
+
+from compose2kube.openapi import SchemaValidator
+
+# a tiny excerpt of swagger.json
+SWAGGER = {
+    "definitions": {
+        "io.k8s.api.core.v1.Service": {
+            "type": "object",
+            "properties": {
+                "apiVersion": {"type": "string"},
+                "kind": {"type": "string"},
+                "metadata": {
+                    "$ref": "#/definitions/io.k8s.apimachinery.pkg.apis.meta.v1.ObjectMeta"
+                },
+                "spec": {"$ref": "#/definitions/io.k8s.api.core.v1.ServiceSpec"},
+            },
+            "x-kubernetes-group-version-kind": [{"group": "", "kind": "Service", "version": "v1"}],
+        },
+        "io.k8s.api.core.v1.ServiceSpec": {
+            "type": "object",
+            "properties": {
+                "ports": {
+                    "type": "array",
+                    "items": {"$ref": "#/definitions/io.k8s.api.core.v1.ServicePort"},
+                },
+                "selector": {"type": "object", "additionalProperties": {"type": "string"}},
+            },
+        },
+        "io.k8s.api.core.v1.ServicePort": {
+            "type": "object",
+            "properties": {
+                "port": {"type": "integer", "format": "int32"},
+                "targetPort": {
+                    "$ref": "#/definitions/io.k8s.apimachinery.pkg.util.intstr.IntOrString"
+                },
+            },
+            "required": ["port"],
+        },
+        "io.k8s.apimachinery.pkg.util.intstr.IntOrString": {
+            "type": "string",
+            "format": "int-or-string",
+        },
+        "io.k8s.apimachinery.pkg.apis.meta.v1.ObjectMeta": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "labels": {"type": "object", "additionalProperties": {"type": "string"}},
+            },
+        },
+    }
+}
+
+SERVICE = """
+apiVersion: v1
+kind: Service
+metadata:
+  name: web
+spec:
+  selector:
+    app: web
+  ports:
+    - port: 80
+      targetPort: http
+"""
+
+
+class TestSchemaValidator(unittest.TestCase):
+    def setUp(self) -> None:
+        self.validator = SchemaValidator(SWAGGER)
+
+    def test_valid(self):
+        ok, msg = self.validator.validate(SERVICE)
+        self.assertTrue(ok, msg)
+        self.assertEqual(msg, "service/web created (dry run)\n")
+
+    def test_errors(self):
+        cases = [
+            # (spec, expected part of the message)
+            (SERVICE.replace("selector:", "selectors:"), 'unknown field "selectors"'),
+            (SERVICE.replace("- port: 80", "- name: a"), 'missing required field "port"'),
+            (SERVICE.replace("port: 80", "port: [80]"), 'got "array", expected "integer"'),
+            (SERVICE.replace("kind: Service", "kind: Svc"), 'no matches for kind "Svc"'),
+            (SERVICE.replace("apiVersion: v1", ""), "apiVersion not set"),
+            ("a: [", "error parsing"),
+            # kubectl rejects duplicated keys, which yaml.safe_load takes the last of
+            (SERVICE + "kind: Service\n", "already set in a map"),
+            ("", "no objects passed to apply"),
+        ]
+        for i, (spec, want) in enumerate(cases):
+            with self.subTest(i=i):
+                ok, msg = self.validator.validate(spec)
+                self.assertFalse(ok)
+                self.assertIn(want, msg)
+
+    def test_lenient_primitives(self):
+        # kubectl accepts any primitive for a string and a number for an integer
+        spec = SERVICE.replace("app: web", "app: 1").replace("targetPort: http", "targetPort: 8080")
+        self.assertTrue(self.validator.validate(spec)[0])
+
+    def test_multi_documents(self):
+        ok, msg = self.validator.validate(SERVICE + "---\n" + SERVICE.replace("spec:", "spek:"))
+        self.assertFalse(ok)
+        self.assertEqual(len(msg.splitlines()), 2)
+        self.assertIn('ValidationError(Service): unknown field "spek"', msg)
@@ -0,0 +1,137 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from langchain_core.messages import AIMessage
+
+from compose2kube import workkey
+from compose2kube.benchmark.grader.judgement import Judgement
+from compose2kube.benchmark.grader.rule import INPUTS_JUDGES
+from compose2kube.llm import Manifests
+from compose2kube.results import SCHEMA, read, rows, to_parquet
+from compose2kube.runlog import ResultLog
+
+SERVICE = "apiVersion: v1\nkind: Service\nmetadata:\n  name: web"
+DEPLOYMENT = """apiVersion: apps/v1
+kind: Deployment
+spec:
+  template:
+    spec:
+      containers:
+      - name: web
+        livenessProbe: {httpGet: {path: /, port: 80}}
+"""
+
+
+def benchmark_record(method: str = "zeroshot_txt", sample: int = 0, i: int = 0) -> dict:
+    name, compose, _ = INPUTS_JUDGES[i]
+    key = workkey.WorkKey(
+        input=workkey.content_hash(compose), name=name, method=method, sample=sample
+    )
+    usage = {"prompt_tokens": 10, "completion_tokens": 90, "total_tokens": 100}
+    return dict(
+        key=str(key),
+        input=name,
+        method=method,
+        model="gpt-4o",
+        compose=compose,
+        output=[
+            AIMessage(content=f"```\n{SERVICE}\n```", response_metadata={"token_usage": usage}),
+            AIMessage(content=f"```\n{DEPLOYMENT}```"),
+        ],
+        output_parsed=[SERVICE, DEPLOYMENT],
+        grade_by_function=[Judgement(ok=True, metadata={}), Judgement(ok=False, metadata={})],
+        grade_by_dryrun=[Judgement(ok=True, metadata={}), Judgement(ok=True, metadata={})],
+        grade_by_model=dict(
+            model_graded=[dict(decision="Y", explanation="ok"), dict(decision="N", explanation="")]
+        ),
+        seconds=1.5,
+    )
+
+
+def _unnamed(record: dict) -> dict:
+    """a record as written before the records had the name of their input"""
+
+    key = json.loads(record["key"])
+    del key["name"]
+    record = dict(record, key=json.dumps(key))
+    del record["input"]
+    return record
+
+
+class TestResults(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "results.parquet"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_benchmark_rows(self):
+        first, second = rows([benchmark_record()])
+        self.assertEqual(first["input"], INPUTS_JUDGES[0][0])
+        self.assertEqual([first["method"], first["model"]], ["zeroshot_txt", "gpt-4o"])
+        self.assertEqual(first["round"], 0)
+        self.assertEqual([first["sample"], second["sample"]], [0, 1])
+        self.assertEqual([first["judge_ok"], second["judge_ok"]], [True, False])
+        self.assertEqual([first["grader_decision"], second["grader_decision"]], ["Y", "N"])
+        self.assertEqual(first["kinds"], {"Service": 1})
+        self.assertEqual((second["n_containers"], second["livenessProbe"]), (1, 1))
+        # of the request, on each of its rows
+        self.assertEqual((first["completion_tokens"], second["completion_tokens"]), (90, 90))
+        self.assertEqual(second["text"], f"```\n{DEPLOYMENT}```")
+
+    def test_input_names(self):
+        names = [name for name, _, _ in INPUTS_JUDGES]
+        records = [benchmark_record(i=names.index(name)) for name in ("input4", "input9")]
+        self.assertEqual([next(rows([r]))["input"] for r in records], ["input4", "input9"])
+        # the records from before the names: by the content, unless inputs share it
+        unnamed = [_unnamed(r) for r in [benchmark_record(), *records]]
+        first, *shared = [next(rows([r]))["input"] for r in unnamed]
+        self.assertEqual(first, names[0])
+        self.assertEqual(shared, [json.loads(unnamed[1]["key"])["input"]] * 2)
+
+    def test_evaluation_rows(self):
+        generated = Manifests(manifests=[SERVICE])
+        feature = dict(
+            line_length=4,
+            dry_run_client_success=True,
+            client_msg="",
+            dry_run_server_success=False,
+            server_msg="error",
+            Service=1,
+            livenessProbe=0,
+            readinessProbe=0,
+            n_containers=0,
+        )
+        record = dict(
+            inputs=dict(
+                input="data/web/compose.yaml", op="llm2", generates=[ValueError(), generated]
+            ),
+            reports=dict(generates_features=[feature], compares_to_answer=[dict(distance=0.5)]),
+            key="k",
+        )
+        failed, row = rows([record])
+        self.assertEqual((failed["input"], failed["method"]), ("web", "llm2"))
+        self.assertIsNone(failed.get("dryrun_ok"))
+        self.assertEqual(row["sample"], 1)
+        self.assertEqual((row["client_dryrun_ok"], row["dryrun_ok"]), (True, False))
+        self.assertEqual((row["distance"], row["kinds"]), (0.5, {"Service": 1}))
+
+    def test_parquet(self):
+        # as read back from a result log
+        log = ResultLog(Path(self.tmp.name) / "run.jsonl")
+        log.extend(benchmark_record(method, sample) for method in ("a", "b") for sample in (0, 1))
+        self.assertEqual(to_parquet(log, self.path, row_group_size=3), 8)
+
+        table = read(self.path)
+        self.assertEqual(table.schema, SCHEMA)
+        self.assertEqual(table.num_rows, 8)
+        table = read(self.path, ["sample", "judge_ok"], [("method", "=", "b"), ("round", "=", 1)])
+        self.assertEqual(table.column_names, ["sample", "judge_ok"])
+        self.assertEqual(table.to_pydict(), dict(sample=[0, 1], judge_ok=[True, False]))
+
+    def test_empty(self):
+        self.assertEqual(to_parquet([], self.path), 0)
+        self.assertEqual(read(self.path).schema, SCHEMA)
@@ -0,0 +1,63 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+
+from compose2kube.benchmark.grader.judgement import Judgement
+from compose2kube.llm import Manifests
+from compose2kube.manifest import ParsedManifest
+from compose2kube.runlog import RecordedError, ResultLog
+
+
+class TestResultLog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log = ResultLog(Path(self.tmp.name) / "run.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_roundtrip(self):
+        record = {
+            "input": "compose.yaml",
+            "generates": [Manifests(manifests=["kind: Service"])],
+            "answer": Document(page_content="kind: Pod", metadata={"source": "all.yaml"}),
+            "message": AIMessage(content="hi"),
+            "output_parsed": [ParsedManifest.of("kind: Service")],
+            "grade": [Judgement(ok=False, metadata={"n": 1})],
+            "error": ValueError("boom"),
+        }
+        self.log.append(record)
+        (got,) = list(self.log)
+
+        self.assertEqual(got["input"], "compose.yaml")
+        self.assertEqual(got["generates"], record["generates"])
+        self.assertEqual(got["answer"], record["answer"])
+        self.assertEqual(got["message"].content, "hi")
+        self.assertEqual(got["output_parsed"], ["kind: Service"])
+        self.assertEqual(got["grade"], record["grade"])
+        self.assertIsInstance(got["error"], RecordedError)
+        self.assertEqual(got["error"].cls, "builtins.ValueError")
+        self.assertEqual(got["error"].message, "boom")
+
+    def test_lazy_and_append_only(self):
+        self.log.extend({"i": i} for i in range(3))
+        records = iter(self.log)
+        self.assertEqual(next(records), {"i": 0})
+        self.log.append({"i": 3})
+        self.assertEqual([r["i"] for r in self.log], [0, 1, 2, 3])
+
+        self.log.truncate()
+        self.assertEqual(list(self.log), [])
+
+    def test_skip_broken_line(self):
+        self.log.append({"i": 0})
+        with open(self.log.path, "a") as f:
+            f.write('{"i": 1, "cut')
+        with self.assertLogs("compose2kube.runlog", "WARNING"):
+            self.assertEqual(list(self.log), [{"i": 0}])
+
+    def test_missing_file(self):
+        self.assertEqual(list(ResultLog(Path(self.tmp.name) / "none.jsonl")), [])
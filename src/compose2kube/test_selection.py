@@ -0,0 +1,34 @@
+import unittest
+
+from langchain_core.runnables import RunnableLambda, RunnableParallel
+
+from compose2kube.selection import select, select_steps
+
+NAMES = ["canonical_kompose", "canonical_llm1_kompose", "canonical_llm2", "llm2"]
+
+
+class TestSelection(unittest.TestCase):
+    def test_select(self):
+        self.assertEqual(select(NAMES), NAMES)
+        self.assertEqual(select(NAMES, ["llm2"]), ["llm2"])
+        self.assertEqual(select(NAMES, ["*llm*"]), NAMES[1:])
+        self.assertEqual(select(NAMES, ["!*kompose"]), ["canonical_llm2", "llm2"])
+        self.assertEqual(select(NAMES, ["canonical_*", "!*llm1*"]), NAMES[0:3:2])
+        # in the order of the names, not of the selectors
+        self.assertEqual(select(NAMES, ["llm2", "canonical_kompose"]), NAMES[0:4:3])
+        with self.assertRaises(ValueError):
+            select(NAMES, ["llm3"])
+        with self.assertRaises(ValueError):
+            select(NAMES, ["!llm3"])
+
+    def test_select_steps(self):
+        calls = []
+
+        def method(name: str):
+            return RunnableLambda(lambda x: calls.append(name) or f"{name}({x})")
+
+        parallel = RunnableParallel({name: method(name) for name in NAMES})
+        got = select_steps(parallel, ["llm*", "canonical_llm2"]).invoke("compose")
+        want = {"canonical_llm2": "canonical_llm2(compose)", "llm2": "llm2(compose)"}
+        self.assertEqual(got, want)
+        self.assertEqual(sorted(calls), ["canonical_llm2", "llm2"])
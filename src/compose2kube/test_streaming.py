@@ -0,0 +1,82 @@
+import unittest
+from unittest.mock import patch
+
+from langchain.chains.openai_functions import convert_to_openai_function
+from langchain.globals import get_llm_cache, set_llm_cache
+from langchain_core.caches import InMemoryCache
+from langchain_core.documents import Document
+
+from compose2kube import llm, streaming
+from compose2kube.benchmark import methods
+from compose2kube.fakeopenai import FakeOpenAI
+from compose2kube.model import ChatOpenAIMultiGenerations
+
+ANSWER = """Here you are:
+
+```yaml
+kind: Deployment
+---
+kind: Service
+```
+
+and
+
+```yaml
+kind: ConfigMap
+```
+"""
+
+
+def _answer(request, i):
+    if "functions" in request:
+        return {"manifests": [f"kind: Pod{i}", "kind: Service"]}
+    return ANSWER
+
+
+def _dry_run_batch(specs, server):
+    return [("Service" not in spec, "") for spec in specs]
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self) -> None:
+        cache = get_llm_cache()
+        set_llm_cache(InMemoryCache())
+        self.addCleanup(set_llm_cache, cache)
+        patcher = patch.object(llm, "_dry_run_batch", _dry_run_batch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_zeroshottext(self):
+        config = {"configurable": {"n": 2}}
+        doc = Document(page_content="services: {}")
+        with FakeOpenAI(responder=_answer, chunk_latency=0.001) as fake:
+            with patch.dict("os.environ", fake.environ()):
+                events = list(streaming.stream_zeroshottext(doc, config))
+                want = methods.chain_zeroshottext.invoke(doc, config)
+        self.assertEqual(fake.stats.requests, 1)
+
+        kinds = [e.kind for e in events]
+        self.assertLess(kinds.index("document"), kinds.index("done"))
+        documents = [(e.index, e.value) for e in events if e.kind == "document"]
+        kinds = ["kind: ConfigMap", "kind: Deployment", "kind: Service"]
+        self.assertEqual(sorted(documents), [(i, kind) for i in (0, 1) for kind in kinds])
+        dry_runs = {(e.index, e.document): e.value[0] for e in events if e.kind == "dryrun"}
+        self.assertEqual(dry_runs, {(i, k): k != 1 for i in (0, 1) for k in range(3)})
+        self.assertEqual([e.value for e in events if e.kind == "done"], want)
+
+    def test_function_call(self):
+        function = convert_to_openai_function(llm.Manifests)
+        with FakeOpenAI(responder=_answer) as fake:
+            model = ChatOpenAIMultiGenerations(
+                openai_api_base=fake.base_url,
+                openai_api_key="fake",
+                n=2,
+                cache=False,
+                model_kwargs=dict(functions=[function], function_call={"name": "Manifests"}),
+            )
+            stream = streaming.stream_documents(model, "convert", function=True, dry_run=False)
+            events = list(stream)
+        documents = sorted((e.index, e.document, e.value) for e in events if e.kind == "document")
+        want = [(i, 0, f"kind: Pod{i}") for i in (0, 1)] + [(i, 1, "kind: Service") for i in (0, 1)]
+        self.assertEqual(documents, sorted(want))
+        self.assertNotIn("dryrun", [e.kind for e in events])
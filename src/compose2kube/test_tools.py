@@ -0,0 +1,64 @@
+import subprocess
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from compose2kube import concurrency, tools
+
+PYTHON = Path(sys.executable).name
+ECHO = [sys.executable, "-c", "import sys; sys.stdout.write(sys.stdin.read().upper())"]
+
+
+class TestTools(unittest.TestCase):
+    def setUp(self) -> None:
+        tools.reset_stats()
+
+    def test_stdin(self):
+        proc = tools.run(ECHO, input="kind: Service\n")
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual(proc.stdout, "KIND: SERVICE\n")
+
+    def test_missing_tool(self):
+        proc = tools.run("no-such-tool-c2k version")
+        self.assertEqual(proc.returncode, 127)
+        self.assertIn("not found", proc.stderr)
+        with self.assertRaises(subprocess.CalledProcessError):
+            tools.run("no-such-tool-c2k version", check=True)
+
+    def test_stats(self):
+        tools.run(ECHO, input="")
+        tools.run("no-such-tool-c2k")
+        got = tools.stats()
+        self.assertEqual(got[PYTHON]["calls"], 1)
+        self.assertEqual(got["no-such-tool-c2k"]["failures"], 1)
+        self.assertGreater(got[PYTHON]["mean_seconds"], 0)
+
+    def test_workspace_is_removed(self):
+        with tools.workspace() as workdir:
+            (workdir / "compose.yaml").write_text("services: {}")
+            argv = [sys.executable, "-c", "print(open('compose.yaml').read())"]
+            proc = tools.run(argv, cwd=workdir)
+            self.assertEqual(proc.stdout, "services: {}\n")
+        self.assertFalse(workdir.exists())
+
+    def test_parallel_map_within_stage_limit(self):
+        concurrency.set_stage_limit("sleep", 2)
+        self.addCleanup(concurrency.set_stage_limit, "sleep", None)
+        running, peak = 0, 0
+        lock = threading.Lock()
+
+        def work(i: int) -> int:
+            nonlocal running, peak
+            with concurrency.stage("sleep"):
+                with lock:
+                    running += 1
+                    peak = max(peak, running)
+                time.sleep(0.02)
+                with lock:
+                    running -= 1
+            return i
+
+        self.assertEqual(tools.parallel_map(work, range(6)), list(range(6)))
+        self.assertLessEqual(peak, 2)
@@ -0,0 +1,72 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langchain_openai import ChatOpenAI
+
+from compose2kube import evaluator
+from compose2kube.runlog import ResultLog
+from compose2kube.workkey import (
+    WorkKey,
+    completed,
+    content_hash,
+    prompt_version,
+    seed_of,
+)
+
+
+def _chain(template: str, seed: int):
+    return PromptTemplate.from_template(template) | ChatOpenAI(
+        api_key="dummy", model_kwargs={"seed": seed}  # type: ignore
+    )
+
+
+class TestWorkKey(unittest.TestCase):
+    def test_key(self):
+        key = WorkKey(input=content_hash("services: {}"), method="m", model="gpt", n=5, seed=1)
+        self.assertEqual(str(key), str(WorkKey(**vars(key))))
+        self.assertNotEqual(str(key), str(WorkKey(**{**vars(key), "sample": 1})))
+        # the keys of the runs before adaptive sampling stay the same
+        self.assertNotIn("adaptive", str(key))
+        self.assertNotEqual(str(key), str(WorkKey(**{**vars(key), "adaptive": "5:20:0.3:1.96"})))
+        self.assertNotEqual(content_hash("services: {}"), content_hash("services: {} "))
+        # inputs of the same content graded by different judges
+        self.assertNotIn("name", str(key))
+        named = str(WorkKey(**{**vars(key), "name": "input4"}))
+        self.assertNotEqual(named, str(WorkKey(**{**vars(key), "name": "input9"})))
+
+    def test_prompt_version(self):
+        a = _chain("convert {compose}", seed=1)
+        self.assertEqual(prompt_version(a), prompt_version(_chain("convert {compose}", seed=2)))
+        self.assertNotEqual(prompt_version(a), prompt_version(_chain("translate {compose}", 1)))
+        self.assertEqual(seed_of(a), 1)
+        self.assertIsNone(seed_of(RunnableLambda(lambda x: x)))
+
+    def test_resume_evaluate(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log = ResultLog(Path(tmp) / "eval.jsonl")
+            items = [{"key": k, "x": i} for i, k in enumerate("abc")]
+            fake = RunnableLambda(lambda item: {"inputs": item})
+
+            async def run(skip):
+                async for got in evaluator.astream_evaluate(items, 2, skip=skip):
+                    log.append(got)
+
+            with patch.object(evaluator, "eval_chain", fake):
+                asyncio.run(run(skip={"b"}))
+                self.assertEqual(completed(log), {"a", "c"})
+                asyncio.run(run(skip=completed(log)))
+
+            self.assertEqual(sorted(r["key"] for r in log), ["a", "b", "c"])
+
+    def test_failed_evaluation(self):
+        records = [
+            {"key": "a", "inputs": {}, "reports": {"compares_to_answer": []}},
+            {"key": "b", "inputs": {}, "reports": {}},
+            {"key": "c", "inputs": {}},
+        ]
+        self.assertEqual(completed(records), {"a", "c"})
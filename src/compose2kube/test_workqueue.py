@@ -0,0 +1,120 @@
+import multiprocessing
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from langchain_core.documents import Document
+
+from compose2kube.runlog import ResultLog
+from compose2kube.workqueue import WorkQueue, matrix, merge, work
+
+
+def _double(item: dict) -> dict:
+    time.sleep(0.01)
+    return dict(key=item["key"], value=item["value"] * 2)
+
+
+def _work_doubles(path: str) -> int:
+    return work(path, run=_double)
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "queue.sqlite"
+        self.queue = WorkQueue(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def items(self, n: int) -> list[dict]:
+        return [dict(key=f"k{i}", value=i) for i in range(n)]
+
+    def test_add(self):
+        self.assertEqual(self.queue.add(self.items(3)), 3)
+        # the queued keys are not queued again
+        self.assertEqual(self.queue.add(self.items(5)), 2)
+        self.assertEqual(self.queue.counts()["pending"], 5)
+
+    def test_claim(self):
+        self.queue.add(self.items(2))
+        self.assertEqual(self.queue.claim("a")["key"], "k0")
+        self.assertEqual(self.queue.claim("b")["key"], "k1")
+        self.assertIsNone(self.queue.claim("c"))
+
+        self.assertTrue(self.queue.complete("k0", "a", {"x": 1}))
+        # b holds the lease of k1
+        self.assertFalse(self.queue.complete("k1", "a", {"x": 2}))
+        self.assertEqual(self.queue.counts(), dict(pending=0, running=1, done=1, failed=0))
+
+    def test_expired_lease(self):
+        self.queue.add(self.items(1))
+        self.queue.claim("dead", lease=-1)
+        self.assertEqual(self.queue.claim("b")["key"], "k0")
+        # the worker that lost the lease can't overwrite the result
+        self.assertFalse(self.queue.complete("k0", "dead", "late"))
+        self.assertTrue(self.queue.complete("k0", "b", "ok"))
+        self.assertEqual(list(self.queue.results()), ["ok"])
+
+    def test_expired_lease_attempts(self):
+        self.queue.add(self.items(2))
+        self.queue.claim("dead", lease=-1, max_attempts=2)
+        self.assertEqual(self.queue.claim("dead", lease=-1, max_attempts=2)["key"], "k0")
+        # k0 expired after 2 attempts, it is failed instead of claimed a 3rd time
+        self.assertEqual(self.queue.claim("b", max_attempts=2)["key"], "k1")
+        self.assertEqual(self.queue.failures(), [("k0", "the lease of dead expired")])
+        self.assertFalse(self.queue.complete("k0", "dead", "late"))
+        self.assertEqual(self.queue.counts(), dict(pending=0, running=1, done=0, failed=1))
+
+    def test_retry(self):
+        self.queue.add(self.items(1))
+        attempts = []
+
+        def run(item: dict) -> dict:
+            attempts.append(item["key"])
+            raise RuntimeError("boom")
+
+        self.assertEqual(work(self.path, "w", max_attempts=2, run=run), 0)
+        self.assertEqual(attempts, ["k0", "k0"])
+        ((key, error),) = self.queue.failures()
+        self.assertEqual(key, "k0")
+        self.assertIn("RuntimeError: boom", error)
+
+    def test_processes(self):
+        self.queue.add(self.items(40))
+        with multiprocessing.get_context("spawn").Pool(4) as pool:
+            done = pool.map(_work_doubles, [str(self.path)] * 4)
+        # each item was run by exactly one of the workers
+        self.assertEqual(sum(done), 40)
+        results = list(self.queue.results())
+        self.assertEqual([r["value"] for r in results], [2 * i for i in range(40)])
+
+    def test_merge(self):
+        self.queue.add(self.items(2))
+        doc = Document(page_content="kind: Pod")
+        work(self.path, "w", run=lambda item: dict(key=item["key"], output=[doc]))
+
+        output = Path(self.tmp.name) / "results.jsonl"
+        self.assertEqual(merge(self.path, output), 2)
+        records = list(ResultLog(output))
+        self.assertEqual([r["key"] for r in records], ["k0", "k1"])
+        self.assertEqual(records[0]["output"], [doc])
+
+
+class TestMatrix(unittest.TestCase):
+    @patch.dict("os.environ", {"OPENAI_API_KEY": "dummy"})
+    def test_matrix(self):
+        configurable = dict(model_name="gpt-4o-2024-05-13", n=5)
+        items = list(matrix(configurable, ["zeroshot_*"], ["*"], samples=2))
+        self.assertTrue(items)
+        # distinct, also for input4 and input9 of the same compose file
+        self.assertEqual(len({item["key"] for item in items}), len(items))
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(WorkQueue(Path(tmp) / "queue.sqlite").add(items), len(items))
+        self.assertIn("input9", {item["input"] for item in items})
+        self.assertEqual({item["configurable"]["sample"] for item in items}, {0, 1})
+        self.assertTrue(all(item["method"].startswith("zeroshot_") for item in items))
+        with self.assertRaises(ValueError):
+            list(matrix(configurable, ["nosuchmethod"]))
@@ -0,0 +1,128 @@
+"""Running the external tools: kompose, docker compose and kubectl.
+
+Specs are piped over stdin where the tool accepts it. Tools that need files
+get a scratch workspace on tmpfs that is removed afterwards, so runs don't
+leave files behind. At most `WORKERS` tool processes run at once, whatever
+thread or stage starts them, and the latency of each tool is recorded.
+"""
+
+import os
+import shlex
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from logging import getLogger
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Sequence, TypeVar
+
+from compose2kube.concurrency import stage
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+WORKERS = int(os.environ.get("C2K_TOOL_WORKERS", os.cpu_count() or 4))
+# tmpfs when available
+WORKSPACE_ROOT = Path("/dev/shm") if os.access("/dev/shm", os.W_OK) else None
+
+_slots = threading.BoundedSemaphore(WORKERS)
+
+
+@dataclass
+class ToolStats:
+    calls: int = 0
+    failures: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.seconds / self.calls if self.calls else 0.0
+
+
+_stats: dict[str, ToolStats] = {}
+_stats_lock = threading.Lock()
+
+
+def _record(tool: str, seconds: float, ok: bool) -> None:
+    with _stats_lock:
+        s = _stats.setdefault(tool, ToolStats())
+        s.calls += 1
+        s.failures += not ok
+        s.seconds += seconds
+        s.max_seconds = max(s.max_seconds, seconds)
+
+
+def stats() -> dict[str, dict[str, float]]:
+    """calls, failures and latency (seconds) per tool"""
+
+    with _stats_lock:
+        return {
+            tool: dict(asdict(s), mean_seconds=s.mean_seconds) for tool, s in _stats.items()
+        }
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+def run(
+    command: str | Sequence[str],
+    input: str | None = None,
+    stage_name: str | None = None,
+    cwd: str | Path | None = None,
+    check: bool = False,
+) -> subprocess.CompletedProcess[str]:
+    """run a tool without a shell and capture its output
+
+    command: argv, or a string split like a shell would. its first word names
+        the tool in stats()
+    input: text piped to stdin
+    stage_name: the concurrency stage to run in (see concurrency.stage)
+
+    A missing executable is reported like a shell would, with exit status 127.
+    """
+
+    argv = shlex.split(command) if isinstance(command, str) else list(command)
+    tool = Path(argv[0]).name
+    with stage(stage_name or tool), _slots:
+        start = time.perf_counter()
+        try:
+            proc = subprocess.run(
+                argv, input=input, capture_output=True, encoding="utf-8", cwd=cwd
+            )
+        except FileNotFoundError:
+            proc = subprocess.CompletedProcess(argv, 127, "", f"{argv[0]}: not found\n")
+        seconds = time.perf_counter() - start
+
+    _record(tool, seconds, proc.returncode == 0)
+    logger.debug(f"{shlex.join(argv)}: exit {proc.returncode} in {seconds:.2f}s")
+    if check:
+        proc.check_returncode()
+    return proc
+
+
+@contextmanager
+def workspace(prefix: str = "c2k") -> Iterator[Path]:
+    """a scratch directory on tmpfs, removed on exit"""
+
+    with tempfile.TemporaryDirectory(prefix=prefix, dir=WORKSPACE_ROOT) as tmpdir:
+        yield Path(tmpdir)
+
+
+@lru_cache
+def _pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="c2k-tools")
+
+
+def parallel_map(fn: Callable[[T], R], items: Iterable[T]) -> list[R]:
+    """fn over items in the tool worker pool, results in order"""
+
+    return list(_pool().map(fn, items))
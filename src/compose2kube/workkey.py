@@ -0,0 +1,84 @@
+"""Stable keys of benchmark work units, to resume interrupted runs.
+
+A unit of work is one method run on one input: a single LLM request for n
+samples and the grading of them. Its key covers everything that changes the
+result: the input content and name, the method, the sample (round) index, the
+model, n, the seed, the version of the prompts and the adaptive sampling, so a
+rerun skips the units already in the result log and schedules only the missing
+or failed ones. The name tells apart the inputs of the same content that are
+graded by different judges.
+"""
+
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from typing import Iterable
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import BasePromptTemplate
+from langchain_core.runnables import Runnable
+
+
+@dataclass(frozen=True)
+class WorkKey:
+    input: str  # content hash of the input
+    method: str
+    # name of the input, left out when None like adaptive
+    name: str | None = None
+    sample: int = 0
+    model: str | None = None
+    n: int | None = None
+    seed: int | None = None
+    prompt: str | None = None  # prompt_version() of the method
+    # the settings of sequential sampling (benchmark.adaptive), left out when unused
+    # so that the keys of the runs of fixed n don't change
+    adaptive: str | None = None
+
+    def __str__(self) -> str:
+        fields = asdict(self)
+        for optional in ("name", "adaptive"):
+            if fields[optional] is None:
+                del fields[optional]
+        return json.dumps(fields, sort_keys=True, separators=(",", ":"))
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def _chat_models(runnable: Runnable) -> list[BaseChatModel]:
+    nodes = runnable.get_graph().nodes.values()
+    return [n.data for n in nodes if isinstance(n.data, BaseChatModel)]
+
+
+def prompt_version(runnable: Runnable) -> str:
+    """hash of the prompt templates and function schemas used in the runnable"""
+
+    h = hashlib.sha256()
+    for node in runnable.get_graph().nodes.values():
+        if isinstance(node.data, BasePromptTemplate):
+            h.update(json.dumps(node.data.dict(), sort_keys=True, default=str).encode())
+    for model in _chat_models(runnable):
+        kwargs = {k: v for k, v in model.model_kwargs.items() if k != "seed"}  # type: ignore
+        h.update(json.dumps(kwargs, sort_keys=True, default=str).encode())
+    return h.hexdigest()[:16]
+
+
+def seed_of(runnable: Runnable) -> int | None:
+    """the seed of the first chat model in the runnable"""
+
+    for model in _chat_models(runnable):
+        seed = model.model_kwargs.get("seed")  # type: ignore
+        if seed is not None:
+            return seed
+    return None
+
+
+def completed(records: Iterable[dict]) -> set[str]:
+    """keys of the finished units in a result log
+
+    an evaluation whose report fell back to {} (see evaluator.eval_chain) failed,
+    so it is not finished.
+    """
+
+    return {r["key"] for r in records if r.get("key") is not None and r.get("reports") != {}}
@@ -0,0 +1,345 @@
+"""A work queue in SQLite to spread a benchmark sweep over processes and hosts.
+
+One process runs the whole sweep in astream_convert_grade, so the grading
+(YAML parsing, distances, judges) is bound to one core of one host. Here the
+inputs x methods x samples matrix of chains_convert_grade is put in a queue
+file instead, one item per work key (see workkey). Workers claim items one at a
+time, run them and store the results in the queue; any number of them, in
+processes of one host or on hosts that share the file system:
+
+    python -m compose2kube.workqueue enqueue sweep.sqlite --model gpt-4o-2024-05-13 -n 20
+    python -m compose2kube.workqueue work sweep.sqlite -p 8      # on each host
+    python -m compose2kube.workqueue status sweep.sqlite
+    python -m compose2kube.workqueue merge sweep.sqlite /tmp/benchmark.jsonl \\
+        --parquet /tmp/benchmark.parquet
+
+A claimed item is leased for `lease` seconds: the item of a worker that died is
+claimed again after that. A failing item, or one whose lease expired, is tried up
+to `max_attempts` times.
+merge writes the records astream_convert_grade yields, in the order of the
+matrix, as a result log (runlog). The queue uses the rollback journal, not WAL,
+which needs shared memory and so doesn't work on network file systems.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+from compose2kube.runlog import ResultLog, decode, encode
+
+logger = getLogger(__name__)
+
+LEASE = 3600.0
+MAX_ATTEMPTS = 3
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+class WorkQueue:
+    """items {key, ...} and their results in a sqlite file"""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "position INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE, item TEXT, "
+            "status TEXT, worker TEXT, lease REAL, attempts INTEGER DEFAULT 0, "
+            "result TEXT, error TEXT, seconds REAL)"
+        )
+        self._conn().execute("CREATE INDEX IF NOT EXISTS items_status ON items (status)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread, and per process after a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def add(self, items: Iterable[dict]) -> int:
+        """queue the items whose keys aren't queued yet. returns how many were new"""
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            added = sum(
+                conn.execute(
+                    "INSERT OR IGNORE INTO items (key, item, status) VALUES (?, ?, ?)",
+                    (item["key"], json.dumps(item), PENDING),
+                ).rowcount
+                for item in items
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def claim(
+        self, worker: str, lease: float = LEASE, max_attempts: int = MAX_ATTEMPTS
+    ) -> dict | None:
+        """the next pending item, or one whose lease expired, leased to worker
+
+        an item whose lease expired after max_attempts is marked failed instead, so
+        an item that kills its workers isn't claimed again forever.
+        """
+
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE items SET status = ?, error = 'the lease of ' || worker || ' expired' "
+                "WHERE status = ? AND lease < ? AND attempts >= ?",
+                (FAILED, RUNNING, now, max_attempts),
+            )
+            row = conn.execute(
+                "SELECT position, item FROM items WHERE status = ? "
+                "OR (status = ? AND lease < ?) ORDER BY position LIMIT 1",
+                (PENDING, RUNNING, now),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE items SET status = ?, worker = ?, lease = ?, "
+                    "attempts = attempts + 1 WHERE position = ?",
+                    (RUNNING, worker, now + lease, row[0]),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return json.loads(row[1]) if row else None
+
+    def complete(self, key: str, worker: str, result: Any, seconds: float = 0.0) -> bool:
+        """store the result of a claimed item. False if the lease was lost to another worker"""
+
+        return self._conn().execute(
+            "UPDATE items SET status = ?, result = ?, seconds = ?, error = NULL "
+            "WHERE key = ? AND worker = ? AND status = ?",
+            (DONE, json.dumps(encode(result), ensure_ascii=False), seconds, key, worker, RUNNING),
+        ).rowcount == 1
+
+    def fail(self, key: str, worker: str, error: str, max_attempts: int = MAX_ATTEMPTS) -> None:
+        """give a claimed item back to be retried, or mark it failed after max_attempts"""
+
+        self._conn().execute(
+            "UPDATE items SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, error = ? "
+            "WHERE key = ? AND worker = ? AND status = ?",
+            (max_attempts, PENDING, FAILED, error, key, worker, RUNNING),
+        )
+
+    def counts(self) -> dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM items GROUP BY status")
+        return {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0} | dict(rows.fetchall())
+
+    def failures(self) -> list[tuple[str, str]]:
+        rows = self._conn().execute(
+            "SELECT key, error FROM items WHERE status = ? ORDER BY position", (FAILED,)
+        )
+        return rows.fetchall()
+
+    def results(self) -> Iterator[dict]:
+        """the results of the done items, in the order they were queued"""
+
+        rows = self._conn().execute(
+            "SELECT result FROM items WHERE status = ? ORDER BY position", (DONE,)
+        )
+        for (result,) in rows:
+            yield decode(json.loads(result))
+
+
+def matrix(
+    configurable: dict[str, Any],
+    methods: list[str] | None = None,
+    inputs: list[str] | None = None,
+    samples: int = 1,
+) -> Iterator[dict]:
+    """the items of chains_convert_grade for the selected inputs and methods
+
+    each sample is a request of configurable "n" generations with its own seed.
+    the key of sample 0 is the key of the same work run by astream_convert_grade
+    on the named input. the keys have the name of the input, so the inputs of the
+    same content (input4 and input9), which have different judges, are both run.
+    """
+
+    from compose2kube.benchmark.benchmark import (
+        chains_convert_grade,
+        convert_grade_key,
+        inputs_judges,
+    )
+    from compose2kube.selection import select
+
+    for name, compose, _ in inputs_judges(inputs):
+        for method in select(chains_convert_grade.steps__, methods):
+            for sample in range(samples):
+                config = dict(configurable=dict(configurable, sample=sample))
+                key = convert_grade_key(compose, method, config, name=name)  # type: ignore
+                yield dict(key=key, input=name, method=method, configurable=config["configurable"])
+
+
+def run_item(item: dict) -> dict:
+    """the record of an item, as astream_convert_grade yields it"""
+
+    from compose2kube.benchmark.benchmark import chains_convert_grade, inputs_judges
+    from compose2kube.benchmark.grader.version import grader_versions
+
+    ((_, compose, judge),) = inputs_judges([item["input"]])
+    config = dict(configurable=item["configurable"])
+    step = chains_convert_grade.steps__[item["method"]]
+    start = time.perf_counter()
+    graded = step.invoke({"compose": compose, "judge": judge}, config)  # type: ignore
+    graded = {k: v for k, v in graded.items() if k != "judge"}
+    graded["seconds"] = time.perf_counter() - start
+    graded["grader_versions"] = grader_versions(judge, config)  # type: ignore
+    model = item["configurable"].get("model_name")
+    return dict(key=item["key"], input=item["input"], method=item["method"], model=model, **graded)
+
+
+def work(
+    path: str | Path,
+    worker: str | None = None,
+    lease: float = LEASE,
+    max_attempts: int = MAX_ATTEMPTS,
+    run: Callable[[dict], Any] = run_item,
+) -> int:
+    """run the items of the queue until none is left to claim. returns how many were done"""
+
+    queue = WorkQueue(path)
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    done = 0
+    while (item := queue.claim(worker, lease, max_attempts)) is not None:
+        start = time.perf_counter()
+        try:
+            result = run(item)
+        except Exception:
+            logger.warning(f"{worker}: {item['key']} failed", exc_info=True)
+            queue.fail(item["key"], worker, traceback.format_exc(), max_attempts)
+            continue
+        if queue.complete(item["key"], worker, result, time.perf_counter() - start):
+            done += 1
+        else:
+            logger.warning(f"{worker}: {item['key']} was claimed again by another worker")
+    return done
+
+
+def _work_process(path: str, lease: float, max_attempts: int, llm_cache: bool) -> int:
+    from compose2kube import load_env
+
+    load_env()
+    if llm_cache:
+        from compose2kube import cache
+
+        cache.install_llm_cache()
+    else:
+        from langchain.globals import set_llm_cache
+        from langchain_core.caches import InMemoryCache
+
+        set_llm_cache(InMemoryCache())
+    return work(path, lease=lease, max_attempts=max_attempts)
+
+
+def work_processes(
+    path: str | Path,
+    processes: int,
+    lease: float = LEASE,
+    max_attempts: int = MAX_ATTEMPTS,
+    llm_cache: bool = True,
+) -> int:
+    """work() in processes, for the grading to use as many cores"""
+
+    args = (str(path), lease, max_attempts, llm_cache)
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        return sum(pool.starmap(_work_process, [args] * processes))
+
+
+def merge(path: str | Path, output: str | Path) -> int:
+    """write the results of the queue as a result log. returns how many records"""
+
+    log = ResultLog(output)
+    log.truncate()
+    count = 0
+    for record in WorkQueue(path).results():
+        log.append(record)
+        count += 1
+    return count
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="compose2kube.workqueue", description=__doc__)
+    parser.formatter_class = argparse.RawDescriptionHelpFormatter
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="queue the inputs x methods x samples")
+    enqueue.add_argument("queue")
+    enqueue.add_argument("--model", required=True)
+    enqueue.add_argument("-n", type=int, default=20, help="generations per request")
+    enqueue.add_argument("--samples", type=int, default=1, help="requests per input and method")
+    enqueue.add_argument("--grader-model", default=None)
+    enqueue.add_argument("--method", "-m", action="append", default=[], metavar="PATTERN")
+    enqueue.add_argument("--input", "-i", action="append", default=[], metavar="PATTERN")
+
+    worker = commands.add_parser("work", help="run queued items until none is left")
+    worker.add_argument("queue")
+    worker.add_argument("--processes", "-p", type=int, default=1)
+    worker.add_argument("--lease", type=float, default=LEASE, help="seconds")
+    worker.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    worker.add_argument("--no-llm-cache", action="store_true")
+
+    status = commands.add_parser("status", help="count the items by status")
+    status.add_argument("queue")
+
+    merger = commands.add_parser("merge", help="write the results as a result log")
+    merger.add_argument("queue")
+    merger.add_argument("output")
+    merger.add_argument("--parquet", help="also write the results flattened (see results)")
+    args = parser.parse_args(argv)
+
+    match args.command:
+        case "enqueue":
+            from compose2kube import load_env
+
+            load_env()
+            configurable: dict[str, Any] = dict(model_name=args.model, n=args.n)
+            if args.grader_model:
+                configurable["grader_model_name"] = args.grader_model
+            try:
+                items = list(matrix(configurable, args.method, args.input, args.samples))
+            except ValueError as e:
+                parser.error(str(e))
+            added = WorkQueue(args.queue).add(items)
+            print(f"queued {added} of {len(items)} items in {args.queue}")
+        case "work":
+            done = work_processes(
+                args.queue,
+                args.processes,
+                lease=args.lease,
+                max_attempts=args.max_attempts,
+                llm_cache=not args.no_llm_cache,
+            )
+            print(f"done {done} items, {WorkQueue(args.queue).counts()}")
+        case "status":
+            queue = WorkQueue(args.queue)
+            print(queue.counts())
+            for key, error in queue.failures():
+                print(f"failed {key}:\n{error}")
+        case "merge":
+            print(f"wrote {merge(args.queue, args.output)} records to {args.output}")
+            if args.parquet:
+                from compose2kube import results
+
+                rows = results.to_parquet(ResultLog(args.output), args.parquet)
+                print(f"wrote {rows} rows to {args.parquet}")
+
+
+if __name__ == "__main__":
+    main()